@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# Filename: agent_assignment.py
+"""Lastabhängige Zuweisung von Anfragen an Agents für den Watchdog.
+
+Pro Agent wird die offene Arbeit geführt (queued + progress, geschätzte
+Tokens) und innerhalb eines Dispatcher-Zyklus um jede Zuweisung erhöht.
+Modelle, die ein Agent erst laden muss, reservieren ihren RAM/VRAM-Bedarf für
+den Rest des Zyklus. Jede Anfrage geht an den Agent mit der kleinsten
+erwarteten Fertigstellungszeit – außer der Agent, der den Dialog zuletzt
+bedient hat, hat das Modell noch geladen und liegt innerhalb der Lasttoleranz
+(Dialog-Affinität: der warme KV-Cache spart die erneute Prompt-Auswertung).
+"""
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+
+CHARS_PER_TOKEN = 4  # grobe Schätzung für deutsch/englischen Text
+EXPECTED_OUTPUT_TOKENS = 256  # angenommene Antwortlänge pro Anfrage
+DEFAULT_TOKENS_PER_SECOND = 10.0  # für Agents ohne Messwerte
+THROUGHPUT_WINDOW_MINUTES = 60
+DIALOG_TIMEOUT_MINUTES = 15  # wie get_or_create_dialog_id im Agent
+AFFINITY_LOAD_TOLERANCE = 1.5  # Affinitäts-Agent darf so viel langsamer fertig werden ...
+AFFINITY_SLACK_SECONDS = 5.0  # ... plus diese Sekunden
+MODEL_LOAD_PENALTY_SECONDS = 15.0  # Aufschlag, wenn der Agent das Modell erst laden muss
+
+
+def estimate_tokens(text) -> int:
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+def request_tokens(message) -> int:
+    return estimate_tokens(message) + EXPECTED_OUTPUT_TOKENS
+
+
+def loaded_models(agent) -> set:
+    """Modelle, die laut agent_status geladen sind (model_active + ollama ps)."""
+    models = set()
+    active = (agent.get("model_active") or "").strip()
+    if active and active != "-":
+        models.add(active)
+    for line in (agent.get("runtime_status") or "").splitlines():
+        parts = line.split()
+        if parts and not line.startswith("Fehler"):
+            models.add(parts[0])
+    return models
+
+
+def is_agent_suitable(agent, model, reserved_ram_mb=0, reserved_vram_mb=0):
+    try:
+        model_name = model.get("model_name", "").strip()
+
+        if model_name in loaded_models(agent):
+            logging.debug(f"🔍 Agent {agent['agent_name']}: Modell '{model_name}' ist bereits aktiv geladen ✅")
+            return True
+
+        ram_mem_total_mb = agent.get("ram_mem_total_mb")
+        if not isinstance(ram_mem_total_mb, (int, float)) or ram_mem_total_mb <= 0:
+            logging.debug(f"🔍 Agent {agent['agent_name']}: RAM-Wert ungültig oder fehlt: {ram_mem_total_mb}")
+            return False
+
+        used_ram_percent = agent.get("mem_used_percent", 100)
+        available_ram_mb = (1 - used_ram_percent / 100) * ram_mem_total_mb - reserved_ram_mb
+
+        gpu_mem_total = agent.get("gpu_mem_total_mb", 0) or 0
+        gpu_mem_used = agent.get("gpu_mem_used_mb", 0) or 0
+        available_vram_mb = gpu_mem_total - gpu_mem_used - reserved_vram_mb
+
+        requires_gpu = model.get("requires_gpu", False)
+        min_ram = model.get("min_ram_mb") or 0
+        min_vram = model.get("min_vram_mb") or 0
+
+        logging.debug(
+            f"🔍 Agent {agent['agent_name']}: RAM frei {available_ram_mb:.0f}/{ram_mem_total_mb} MB | "
+            f"VRAM frei {available_vram_mb:.0f}/{gpu_mem_total} MB | "
+            f"Bedarf RAM {min_ram} MB, VRAM {min_vram} MB, GPU {bool(requires_gpu)}"
+        )
+
+        if requires_gpu and gpu_mem_total <= 0:
+            return False
+        if min_ram and available_ram_mb < min_ram:
+            return False
+        if min_vram and available_vram_mb < min_vram:
+            return False
+        return True
+
+    except Exception as e:
+        logging.warning(f"⚠️ Fehler bei der Agentprüfung: {e}")
+        return False
+
+
+# === Laststand aus der DB ===
+def load_outstanding_work(cursor) -> dict:
+    cursor.execute("""
+        SELECT agent, COUNT(*) AS open_requests, SUM(CHAR_LENGTH(user_message)) AS open_chars
+        FROM conversations
+        WHERE message_status IN ('queued', 'progress') AND agent IS NOT NULL
+        GROUP BY agent
+    """)
+    return {row["agent"]: row for row in cursor.fetchall()}
+
+
+def load_throughput(cursor) -> dict:
+    """Tokens pro Sekunde je Agent aus den zuletzt gelösten Anfragen."""
+    cursor.execute("""
+        SELECT agent,
+               SUM(TIMESTAMPDIFF(MICROSECOND, processing_started_at, processing_finished_at)) / 1000000 AS seconds,
+               SUM(CHAR_LENGTH(user_message) + CHAR_LENGTH(COALESCE(model_response, ''))) AS chars
+        FROM conversations
+        WHERE message_status = 'solved'
+        AND processing_started_at IS NOT NULL
+        AND processing_finished_at > NOW() - INTERVAL %s MINUTE
+        GROUP BY agent
+    """, (THROUGHPUT_WINDOW_MINUTES,))
+    throughput = {}
+    for row in cursor.fetchall():
+        seconds = float(row["seconds"] or 0)
+        tokens = float(row["chars"] or 0) / CHARS_PER_TOKEN
+        if seconds > 0 and tokens > 0:
+            throughput[row["agent"]] = tokens / seconds
+    return throughput
+
+
+def load_dialog_agents(cursor, requests) -> dict:
+    """Agent, der den Dialog einer offenen Anfrage zuletzt bedient hat
+    (conversation_id: agent_name)."""
+    user_ids = sorted({r["user_id"] for r in requests if r.get("user_id") is not None})
+    if not user_ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    cursor.execute(f"""
+        SELECT c.user_id, c.dialog_id, c.agent, c.processing_finished_at
+        FROM conversations c
+        JOIN (
+            SELECT user_id, MAX(id) AS id FROM conversations
+            WHERE message_status = 'solved' AND agent IS NOT NULL AND user_id IN ({placeholders})
+            GROUP BY user_id
+        ) last ON last.id = c.id
+    """, user_ids)
+    last_by_user = {row["user_id"]: row for row in cursor.fetchall()}
+
+    cutoff = datetime.now() - timedelta(minutes=DIALOG_TIMEOUT_MINUTES)
+    dialog_agents = {}
+    for req in requests:
+        last = last_by_user.get(req.get("user_id"))
+        if not last:
+            continue
+        if req.get("dialog_id"):
+            same_dialog = req["dialog_id"] == last["dialog_id"]
+        else:
+            # Ohne dialog_id setzt der Agent den Dialog innerhalb des Timeouts fort
+            same_dialog = bool(last["processing_finished_at"] and last["processing_finished_at"] > cutoff)
+        if same_dialog:
+            dialog_agents[req["id"]] = last["agent"]
+    return dialog_agents
+
+
+class AssignmentEngine:
+    def __init__(self, agents, outstanding, throughput):
+        self.agents = {a["agent_name"]: a for a in agents}
+        self.state = {}
+        for name, agent in self.agents.items():
+            load = outstanding.get(name) or {}
+            open_chars = float(load.get("open_chars") or 0)
+            open_requests = int(load.get("open_requests") or 0)
+            self.state[name] = {
+                "open_requests": open_requests,
+                "open_tokens": open_chars / CHARS_PER_TOKEN + open_requests * EXPECTED_OUTPUT_TOKENS,
+                "tokens_per_second": throughput.get(name, DEFAULT_TOKENS_PER_SECOND),
+                "reserved_ram_mb": 0,
+                "reserved_vram_mb": 0,
+                "models": loaded_models(agent),
+                "warm_models": loaded_models(agent),  # laut agent_status, ohne Reservierungen
+            }
+        self.affinity = Counter()  # hit, agent_unavailable, model_cold, overloaded
+        self.model_loads = 0  # Zuweisungen, für die ein Agent ein Modell laden muss
+
+    @classmethod
+    def from_db(cls, cursor, agents):
+        return cls(agents, load_outstanding_work(cursor), load_throughput(cursor))
+
+    def expected_completion(self, agent_name, tokens, model_name=None) -> float:
+        state = self.state[agent_name]
+        seconds = (state["open_tokens"] + tokens) / state["tokens_per_second"]
+        if model_name and model_name not in state["models"]:
+            seconds += MODEL_LOAD_PENALTY_SECONDS
+        return seconds
+
+    def suitable_agents(self, model) -> list:
+        suitable = []
+        for name, agent in self.agents.items():
+            state = self.state[name]
+            if model["model_name"] in state["models"] or is_agent_suitable(
+                    agent, model, state["reserved_ram_mb"], state["reserved_vram_mb"]):
+                suitable.append(name)
+        return suitable
+
+    def select(self, model, message, preferred_agent=None):
+        """Agentname mit der kleinsten erwarteten Fertigstellungszeit oder None.
+        preferred_agent (letzter Agent des Dialogs) wird bevorzugt, solange er
+        das Modell geladen hat und innerhalb der Lasttoleranz liegt."""
+        tokens = request_tokens(message)
+        model_name = model["model_name"]
+        candidates = self.suitable_agents(model)
+        if not candidates:
+            return None
+        best = min(candidates, key=lambda name: self.expected_completion(name, tokens, model_name))
+        if not preferred_agent:
+            return best
+
+        if preferred_agent not in candidates:
+            self.affinity["agent_unavailable"] += 1
+        elif model["model_name"] not in self.state[preferred_agent]["warm_models"]:
+            self.affinity["model_cold"] += 1
+        elif self.expected_completion(preferred_agent, tokens, model_name) > (
+                self.expected_completion(best, tokens, model_name) * AFFINITY_LOAD_TOLERANCE + AFFINITY_SLACK_SECONDS):
+            self.affinity["overloaded"] += 1
+        else:
+            self.affinity["hit"] += 1
+            return preferred_agent
+        return best
+
+    def reserve(self, agent_name, model, message):
+        """Bucht die Anfrage auf den Agent; ein neu zu ladendes Modell belegt
+        seinen Speicherbedarf bis zum Ende des Zyklus."""
+        state = self.state[agent_name]
+        state["open_requests"] += 1
+        state["open_tokens"] += request_tokens(message)
+        if model["model_name"] not in state["models"]:
+            self.model_loads += 1
+            state["reserved_ram_mb"] += model.get("min_ram_mb") or 0
+            state["reserved_vram_mb"] += model.get("min_vram_mb") or 0
+            state["models"].add(model["model_name"])
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# Filename: agent_registry.py
+"""Agent-Registry im Speicher: Heartbeats per UDP (oder HTTP) statt über die DB.
+
+Agents schicken alle HEARTBEAT_INTERVAL Sekunden ein kompaktes JSON-Paket
+(Last, geladene Modelle, freie Slots) an die Registry, die im Watchdog läuft.
+Der Watchdog liest die Agents direkt aus dem Speicher; agent_status wird nur
+noch alle SNAPSHOT_INTERVAL Sekunden für die Monitoring-Tools geschrieben.
+Die Einträge haben dieselben Schlüssel wie Zeilen aus agent_status, damit
+AssignmentEngine & Co. unverändert damit arbeiten.
+
+AGENT_REGISTRY=watchdog-host:47800 auf allen Hosts setzen – Agents und Watchdog
+schalten die Registry über dieselbe Variable ein, sonst verwirft der Watchdog
+Agents, die agent_status nur noch selten schreiben.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from db_access import db_cursor
+
+REGISTRY_ADDRESS = os.environ.get("AGENT_REGISTRY")  # "host:port"; leer = Heartbeats über die DB
+USE_AGENT_REGISTRY = bool(REGISTRY_ADDRESS)  # gemeinsamer Schalter für Agents und Watchdog
+REGISTRY_HOST = "0.0.0.0"
+REGISTRY_UDP_PORT = 47800
+REGISTRY_HTTP_PORT = 47801  # POST /heartbeat, GET /agents
+HEARTBEAT_INTERVAL = 3  # Sekunden
+STALE_SECONDS = 10  # ohne Heartbeat danach nicht mehr verfügbar
+SNAPSHOT_INTERVAL = 30  # Sekunden zwischen zwei agent_status-Schnappschüssen
+MODEL_LIST_EVERY = 20  # Modellliste nur jedes n-te Paket (und bei Änderung) mitschicken
+MAX_PACKET_BYTES = 65507
+
+SNAPSHOT_SQL = """
+    INSERT INTO agent_status (
+        agent_name, hostname, last_seen, model_list, model_active, runtime_status, is_available,
+        cpu_load_percent, mem_used_percent, gpu_util_percent,
+        gpu_mem_used_mb, gpu_mem_total_mb, ram_mem_total_mb
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        hostname = VALUES(hostname),
+        last_seen = VALUES(last_seen),
+        model_list = COALESCE(VALUES(model_list), model_list),
+        model_active = VALUES(model_active),
+        runtime_status = VALUES(runtime_status),
+        is_available = VALUES(is_available),
+        cpu_load_percent = VALUES(cpu_load_percent),
+        mem_used_percent = VALUES(mem_used_percent),
+        gpu_util_percent = VALUES(gpu_util_percent),
+        gpu_mem_used_mb = VALUES(gpu_mem_used_mb),
+        gpu_mem_total_mb = VALUES(gpu_mem_total_mb),
+        ram_mem_total_mb = VALUES(ram_mem_total_mb)
+"""
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port or REGISTRY_UDP_PORT)
+
+
+# === Agent-Seite ===
+class HeartbeatSender:
+    """Schickt Telemetrie-Schnappschüsse als kompakte UDP-Pakete."""
+
+    def __init__(self, agent_name, telemetry, address=REGISTRY_ADDRESS, free_slots=None):
+        self.agent_name = agent_name
+        self.telemetry = telemetry
+        self.target = parse_address(address)
+        self.free_slots = free_slots or (lambda: None)
+        self.hostname = socket.gethostname()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sent = 0
+        self.sent_model_info_version = None
+
+    def packet(self) -> dict:
+        snap = self.telemetry.snapshot()
+        packet = {
+            "n": self.agent_name, "h": self.hostname,
+            "c": snap["cpu"], "m": snap["mem"], "r": snap["ram_total_mb"],
+            "gu": snap["gpu_util"], "gm": snap["gpu_used"], "gt": snap["gpu_total"],
+            "a": snap["active_model"], "l": snap["loaded_models"], "s": self.free_slots(),
+        }
+        if snap["model_info_version"] != self.sent_model_info_version or self.sent % MODEL_LIST_EVERY == 0:
+            packet["ml"] = snap["model_info"]
+            self.sent_model_info_version = snap["model_info_version"]
+        return packet
+
+    def send(self):
+        data = json.dumps(self.packet(), separators=(",", ":")).encode("utf-8")
+        if len(data) > MAX_PACKET_BYTES:
+            logging.warning(f"⚠️ Heartbeat-Paket zu groß ({len(data)} Bytes) – nicht gesendet")
+            return
+        self.sock.sendto(data, self.target)
+        self.sent += 1
+
+    def run_forever(self, interval=HEARTBEAT_INTERVAL):
+        logging.info(f"📡 Heartbeats an Registry {self.target[0]}:{self.target[1]}")
+        while True:
+            try:
+                self.send()
+            except Exception as e:
+                logging.error(f"Fehler beim Senden des Heartbeats: {e}")
+            time.sleep(interval)
+
+
+# === Registry-Seite ===
+class AgentRegistry:
+    def __init__(self, stale_seconds=STALE_SECONDS):
+        self.stale_seconds = stale_seconds
+        self.agents = {}  # agent_name: Eintrag mit agent_status-Schlüsseln
+        self.seen_at = {}  # agent_name: monotonic
+        self.lock = threading.Lock()
+
+    def update(self, packet):
+        name = packet["n"]
+        loaded = packet.get("l") or []
+        entry = {
+            "agent_name": name,
+            "hostname": packet.get("h"),
+            "last_seen": datetime.now(),
+            "model_active": packet.get("a") or "-",
+            "runtime_status": "\n".join(loaded),  # erste Spalte = Modell, wie bei ollama ps
+            "cpu_load_percent": packet.get("c"),
+            "mem_used_percent": packet.get("m"),
+            "gpu_util_percent": packet.get("gu"),
+            "gpu_mem_used_mb": packet.get("gm"),
+            "gpu_mem_total_mb": packet.get("gt"),
+            "ram_mem_total_mb": packet.get("r"),
+            "free_slots": packet.get("s"),
+            "is_available": True,
+        }
+        with self.lock:
+            previous = self.agents.get(name)
+            if previous is None:
+                logging.info(f"🆕 Agent '{name}' meldet sich bei der Registry")
+            entry["model_list"] = packet.get("ml", previous and previous.get("model_list"))
+            self.agents[name] = entry
+            self.seen_at[name] = time.monotonic()
+
+    def is_fresh(self, name, now=None) -> bool:
+        return (now or time.monotonic()) - self.seen_at.get(name, 0) < self.stale_seconds
+
+    def available_agents(self) -> list:
+        """Frische Agents, sortiert wie get_available_agents (CPU, dann RAM)."""
+        now = time.monotonic()
+        with self.lock:
+            agents = [dict(a) for name, a in self.agents.items() if self.is_fresh(name, now)]
+        return sorted(agents, key=lambda a: (a["cpu_load_percent"] or 0, a["mem_used_percent"] or 0))
+
+    def all_agents(self) -> list:
+        now = time.monotonic()
+        with self.lock:
+            return [dict(a, is_available=self.is_fresh(name, now)) for name, a in self.agents.items()]
+
+    # === Empfang ===
+    def handle_datagram(self, data):
+        try:
+            self.update(json.loads(data))
+        except Exception as e:
+            logging.debug(f"Ungültiges Heartbeat-Paket verworfen: {e}")
+
+    def serve_udp(self, host=REGISTRY_HOST, port=REGISTRY_UDP_PORT):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((host, port))
+        logging.info(f"📡 Agent-Registry lauscht auf UDP {host}:{port}")
+        while True:
+            data, _ = sock.recvfrom(MAX_PACKET_BYTES)
+            self.handle_datagram(data)
+
+    def serve_http(self, host=REGISTRY_HOST, port=REGISTRY_HTTP_PORT):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != "/heartbeat":
+                    self.send_error(404)
+                    return
+                registry.handle_datagram(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                self.send_response(204)
+                self.end_headers()
+
+            def do_GET(self):
+                if self.path != "/agents":
+                    self.send_error(404)
+                    return
+                body = json.dumps(registry.all_agents(), default=str).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        logging.info(f"🌐 Agent-Registry HTTP auf {host}:{port}")
+        ThreadingHTTPServer((host, port), Handler).serve_forever()
+
+    # === Schnappschüsse für Monitoring ===
+    def write_snapshot(self, cursor):
+        for a in self.all_agents():
+            cursor.execute(SNAPSHOT_SQL, (
+                a["agent_name"], a["hostname"], a["last_seen"], a["model_list"], a["model_active"],
+                a["runtime_status"], a["is_available"], a["cpu_load_percent"], a["mem_used_percent"],
+                a["gpu_util_percent"], a["gpu_mem_used_mb"], a["gpu_mem_total_mb"], a["ram_mem_total_mb"],
+            ), prepared=True)
+
+    def run_snapshots(self, interval=SNAPSHOT_INTERVAL):
+        while True:
+            time.sleep(interval)
+            try:
+                with db_cursor() as cursor:
+                    self.write_snapshot(cursor)
+            except Exception as e:
+                logging.error(f"Fehler beim Registry-Schnappschuss: {e}")
+
+    def start(self, udp_port=REGISTRY_UDP_PORT, http_port=REGISTRY_HTTP_PORT):
+        threading.Thread(target=self.serve_udp, kwargs={"port": udp_port}, daemon=True).start()
+        if http_port:
+            threading.Thread(target=self.serve_http, kwargs={"port": http_port}, daemon=True).start()
+        threading.Thread(target=self.run_snapshots, daemon=True).start()
+        return self
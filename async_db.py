@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# Filename: async_db.py
+"""DB-Zugriff für asyncio-Code ohne Blockieren der Eventloop.
+
+mysql.connector ist synchron. Damit eine langsame Abfrage nicht alle anderen
+Handler anhält, laufen DB-Schritte als normale Funktionen func(cursor, ...)
+in einem eigenen Thread-Pool – so groß wie der Verbindungspool, damit kein
+Thread auf eine freie Verbindung warten muss. Pro Handler werden Anzahl,
+Wartezeit im Pool und Ausführungsdauer erfasst.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from db_access import db_cursor, load_pool_size
+
+SLOW_QUERY_SECONDS = 0.5  # langsamere DB-Schritte einzeln loggen
+
+
+class HandlerStats:
+    __slots__ = ("calls", "errors", "wait_total", "run_total", "run_max")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.wait_total = 0.0  # Zeit in der Warteschlange des Thread-Pools
+        self.run_total = 0.0  # Zeit mit geliehener Verbindung
+        self.run_max = 0.0
+
+
+class AsyncDB:
+    def __init__(self, workers=None):
+        self.workers = workers or load_pool_size()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="db")
+        self.stats = defaultdict(HandlerStats)  # handler: HandlerStats
+        self.lock = threading.Lock()
+
+    async def run(self, handler, func, *args, dictionary=True):
+        """Führt func(cursor, *args) mit Pool-Verbindung im DB-Thread aus
+        (commit bei Erfolg) und liefert dessen Ergebnis."""
+        submitted = time.monotonic()
+
+        def call():
+            started = time.monotonic()
+            ok = False
+            try:
+                with db_cursor(dictionary=dictionary) as cursor:
+                    result = func(cursor, *args)
+                ok = True
+                return result
+            finally:
+                self.record(handler, started - submitted, time.monotonic() - started, ok)
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    def record(self, handler, waited, duration, ok):
+        with self.lock:
+            s = self.stats[handler]
+            s.calls += 1
+            s.errors += 0 if ok else 1
+            s.wait_total += waited
+            s.run_total += duration
+            s.run_max = max(s.run_max, duration)
+        if duration >= SLOW_QUERY_SECONDS:
+            logging.warning(f"🐢 Langsamer DB-Schritt in {handler}: {duration:.2f}s")
+
+    # === Kennzahlen ===
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                handler: {
+                    "calls": s.calls,
+                    "errors": s.errors,
+                    "avg_wait_ms": s.wait_total / s.calls * 1000,
+                    "avg_ms": s.run_total / s.calls * 1000,
+                    "max_ms": s.run_max * 1000,
+                }
+                for handler, s in self.stats.items() if s.calls
+            }
+
+    def format_report(self):
+        """Mehrzeiliger Bericht für Log oder Konsole; None ohne Aufrufe."""
+        snapshot = self.snapshot()
+        if not snapshot:
+            return None
+        lines = [f"  - {handler}: {s['calls']}× | Ø {s['avg_ms']:.1f} ms (max {s['max_ms']:.0f} ms) | "
+                 f"Warteschlange Ø {s['avg_wait_ms']:.1f} ms | Fehler {s['errors']}"
+                 for handler, s in sorted(snapshot.items())]
+        return f"🗄 DB-Latenz pro Handler ({self.workers} Threads):\n" + "\n".join(lines)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# Filename: context_manager.py
+"""Kontextfenster mit Token-Budget und laufender Zusammenfassung alter Runden.
+
+Das Budget je Modell kommt aus model_catalog.context_tokens (abzüglich einer
+Reserve für die Antwort). In den Kontext kommen Systemprompt, die
+Zusammenfassung älterer Runden und so viele der neuesten Runden, wie
+hineinpassen. Runden, die herausfallen und noch nicht zusammengefasst sind,
+faltet ein kleines Modell im Hintergrund in die Zusammenfassung des Dialogs
+(Tabelle dialog_summary). Die aktuelle Anfrage wartet nie darauf – bis die
+neue Zusammenfassung fertig ist, wird die vorherige verwendet.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from agent_assignment import estimate_tokens
+from db_access import db_cursor
+from history_cache import turns_to_messages
+
+OLLAMA_CHAT_URL = "http://localhost:11434/api/chat"
+SUMMARY_MODEL = "stablelm2:1.6b"  # klein und schnell; muss auf dem Agent installiert sein
+SUMMARY_MAX_TOKENS = 300  # num_predict für die Zusammenfassung
+DEFAULT_CONTEXT_TOKENS = 4096  # Ollama-Standard für num_ctx
+RESPONSE_RESERVE_TOKENS = 512  # Platz für die Antwort im Kontextfenster
+CATALOG_REFRESH_INTERVAL = 60  # Sekunden
+SUMMARY_WORKERS = 1
+SUMMARY_TIMEOUT = 120
+MAX_CACHED_SUMMARIES = 1000
+
+SUMMARY_INSTRUCTION = (
+    "Fasse den folgenden Gesprächsverlauf knapp auf Deutsch zusammen. Behalte Fakten, "
+    "Namen, Zahlen, Entscheidungen und offene Fragen, lass Höflichkeitsfloskeln weg."
+)
+
+
+def newest_fitting(turns, available) -> int:
+    """Index der ältesten Runde, ab der die neuesten Runden ins Budget passen."""
+    start = len(turns)
+    used = 0
+    while start > 0 and used + turns[start - 1][3] <= available:
+        start -= 1
+        used += turns[start][3]
+    return start
+
+
+def summary_fits(covered_until, dropped, kept) -> bool:
+    """Die Zusammenfassung lohnt nur, wenn sie herausgefallene Runden abdeckt und
+    nicht in die behaltenen hineinreicht – sonst stünde derselbe Inhalt doppelt im Kontext."""
+    if covered_until is None or not dropped:
+        return False
+    return covered_until >= dropped[0][0] and (not kept or covered_until < kept[0][0])
+
+
+class ContextManager:
+    def __init__(self, summary_model=SUMMARY_MODEL, chat_url=OLLAMA_CHAT_URL):
+        self.summary_model = summary_model
+        self.chat_url = chat_url
+        self.context_tokens = {}  # model_name: context_tokens
+        self.catalog_loaded_at = None
+        self.summaries = OrderedDict()  # dialog_id: (covered_until_id, text, tokens)
+        self.pending = set()  # dialog_ids mit laufender Zusammenfassung
+        self.executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summary")
+        self.lock = threading.Lock()
+
+    # === Budget ===
+    def budget(self, cursor, model) -> int:
+        now = time.monotonic()
+        if self.catalog_loaded_at is None or now - self.catalog_loaded_at >= CATALOG_REFRESH_INTERVAL:
+            cursor.execute("SELECT model_name, context_tokens FROM model_catalog WHERE is_active = 1")
+            self.context_tokens = {row["model_name"]: row["context_tokens"] for row in cursor.fetchall()}
+            self.catalog_loaded_at = now
+        return self.num_ctx(model) - RESPONSE_RESERVE_TOKENS
+
+    def num_ctx(self, model) -> int:
+        """Kontextfenster für options.num_ctx – dasselbe, mit dem budget() rechnet."""
+        return self.context_tokens.get(model) or DEFAULT_CONTEXT_TOKENS
+
+    # === Zusammenfassung ===
+    def summary(self, cursor, dialog_id):
+        with self.lock:
+            if dialog_id in self.summaries:
+                self.summaries.move_to_end(dialog_id)
+                return self.summaries[dialog_id]
+        cursor.execute("""
+            SELECT covered_until_id, summary, summary_tokens FROM dialog_summary WHERE dialog_id = %s
+        """, (dialog_id,), prepared=True)
+        row = cursor.fetchone()
+        entry = (row["covered_until_id"], row["summary"], row["summary_tokens"]) if row else (None, None, 0)
+        self.remember(dialog_id, entry)
+        return entry
+
+    def remember(self, dialog_id, entry):
+        with self.lock:
+            self.summaries[dialog_id] = entry
+            self.summaries.move_to_end(dialog_id)
+            while len(self.summaries) > MAX_CACHED_SUMMARIES:
+                self.summaries.popitem(last=False)
+
+    def schedule_summary(self, dialog_id, previous, turns):
+        with self.lock:
+            if dialog_id in self.pending:
+                return
+            self.pending.add(dialog_id)
+        self.executor.submit(self.summarize, dialog_id, previous, turns)
+
+    def summarize(self, dialog_id, previous, turns):
+        """Faltet `turns` in die bisherige Zusammenfassung (läuft im Worker-Thread)."""
+        try:
+            transcript = "\n".join(
+                f"{'Nutzer' if m['role'] == 'user' else 'Assistent'}: {m['content']}"
+                for m in turns_to_messages(turns)
+            )
+            if previous:
+                transcript = f"Bisherige Zusammenfassung:\n{previous}\n\nNeue Runden:\n{transcript}"
+            payload = {
+                "model": self.summary_model,
+                "messages": [{"role": "system", "content": SUMMARY_INSTRUCTION},
+                             {"role": "user", "content": transcript}],
+                "stream": False,
+                "options": {"num_predict": SUMMARY_MAX_TOKENS},
+            }
+            started = time.monotonic()
+            response = requests.post(self.chat_url, json=payload, timeout=SUMMARY_TIMEOUT)
+            response.raise_for_status()
+            text = response.json().get("message", {}).get("content", "").strip()
+            if not text:
+                return
+            covered_until = turns[-1][0]
+            tokens = estimate_tokens(text)
+            with db_cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO dialog_summary (dialog_id, summary, summary_tokens, covered_until_id, model_used)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        summary = VALUES(summary),
+                        summary_tokens = VALUES(summary_tokens),
+                        covered_until_id = VALUES(covered_until_id),
+                        model_used = VALUES(model_used)
+                """, (dialog_id, text, tokens, covered_until, self.summary_model), prepared=True)
+            self.remember(dialog_id, (covered_until, text, tokens))
+            logging.info(f"📝 Dialog {dialog_id}: {len(turns)} Runde(n) zusammengefasst "
+                         f"({tokens} Tokens, {time.monotonic() - started:.1f}s)")
+        except Exception as e:
+            logging.error(f"Fehler bei der Zusammenfassung von Dialog {dialog_id}: {e}")
+        finally:
+            with self.lock:
+                self.pending.discard(dialog_id)
+
+    # === Kontext zusammenstellen ===
+    def build_messages(self, cursor, model, turns, dialog_id, system_prompt, new_prompt) -> list:
+        """Systemprompt + Zusammenfassung + neueste Runden im Budget + neue Anfrage."""
+        available = self.budget(cursor, model) - estimate_tokens(system_prompt) - estimate_tokens(new_prompt)
+        if sum(t[3] for t in turns) <= available:
+            # Passt komplett – keine Zusammenfassung nötig
+            kept, dropped = turns, []
+            covered_until, summary_text, use_summary = None, None, False
+        else:
+            covered_until, summary_text, summary_tokens = self.summary(cursor, dialog_id)
+            start = newest_fitting(turns, available - (summary_tokens or 0))
+            use_summary = bool(summary_text) and summary_fits(covered_until, turns[:start], turns[start:])
+            if not use_summary:
+                # Zusammenfassung passt nicht zur Lücke – weglassen, ihr Budget geht an Runden
+                start = newest_fitting(turns, available)
+            kept, dropped = turns[start:], turns[:start]
+
+        # Herausgefallene Runden, die die Zusammenfassung noch nicht enthält
+        unsummarized = [t for t in dropped if covered_until is None or t[0] > covered_until]
+        if unsummarized:
+            self.schedule_summary(dialog_id, summary_text, unsummarized)
+            logging.debug(f"✂️ Dialog {dialog_id}: {len(dropped)} Runde(n) außerhalb des Budgets, "
+                          f"{len(unsummarized)} werden zusammengefasst")
+
+        system = system_prompt or ""
+        if use_summary:
+            system = f"{system}\n\nZusammenfassung des bisherigen Gesprächs:\n{summary_text}".strip()
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.extend(turns_to_messages(kept))
+        messages.append({"role": "user", "content": new_prompt})
+        return messages
+
+
+context_manager = ContextManager()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# Filename: db_access.py
+"""Gemeinsamer DB-Zugriff für Agent, Watchdog, Connector und Tools.
+
+Alle Komponenten lesen die Zugangsdaten aus private/.mariadb_access und leihen
+sich Verbindungen aus einem gemeinsamen Pool, statt pro Aufruf eine neue
+TCP-Verbindung samt Authentifizierung aufzubauen.
+"""
+import logging
+import os
+import threading
+import time
+from configparser import ConfigParser
+from contextlib import contextmanager
+from pathlib import Path
+
+from mysql.connector import errors, pooling
+
+# === Konfiguration ===
+BASE_DIR = Path(__file__).resolve().parent
+ACCESS_FILE = BASE_DIR / "private" / ".mariadb_access"
+POOL_NAME = "ollama_bot"
+DEFAULT_POOL_SIZE = 5
+MAX_POOL_SIZE = pooling.CNX_POOL_MAXSIZE
+POOL_TIMEOUT = 10  # Sekunden warten, wenn alle Verbindungen verliehen sind
+
+_pool = None
+_pool_lock = threading.Lock()
+_prepared_cache = {}  # (id(Verbindung), connection_id, dictionary): {sql: Prepared-Cursor}
+_prepared_lock = threading.Lock()
+
+
+# === Zugangsdaten laden ===
+def load_db_config(path=ACCESS_FILE) -> dict:
+    config = ConfigParser()
+    if not config.read(path):
+        raise FileNotFoundError(f"Zugriffskonfig {path} fehlt.")
+    client = config["client"]
+    return {
+        "host": client.get("host", "127.0.0.1"),
+        "port": int(client.get("port", 3306)),
+        "user": client.get("user"),
+        "password": client.get("password"),
+        "database": client.get("database")
+    }
+
+
+def load_pool_size(path=ACCESS_FILE) -> int:
+    """Poolgröße aus DB_POOL_SIZE oder dem optionalen Abschnitt [pool] size=..."""
+    config = ConfigParser()
+    config.read(path)
+    size = os.environ.get("DB_POOL_SIZE") or config.get("pool", "size", fallback=DEFAULT_POOL_SIZE)
+    return int(size)
+
+
+# === Verbindungspool ===
+def init_pool(size=None):
+    """Legt den Pool an (einmal pro Prozess). Spätere Aufrufe liefern den
+    bestehenden Pool zurück; size wird auf die Obergrenze von mysql.connector
+    begrenzt."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            size = max(1, min(size or load_pool_size(), MAX_POOL_SIZE))
+            # pool_reset_session=False: serverseitige Prepared Statements
+            # überleben die Rückgabe an den Pool
+            _pool = pooling.MySQLConnectionPool(
+                pool_name=POOL_NAME,
+                pool_size=size,
+                pool_reset_session=False,
+                **load_db_config()
+            )
+            logging.debug(f"DB-Pool angelegt: {size} Verbindungen")
+        return _pool
+
+
+def get_connection(timeout=POOL_TIMEOUT):
+    """Leiht eine Verbindung aus dem Pool. Der Pool prüft sie beim Ausleihen per
+    Ping und verbindet bei Bedarf neu; ist der Pool erschöpft, wird bis zu
+    `timeout` Sekunden gewartet. close() gibt die Verbindung zurück."""
+    pool = init_pool()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return pool.get_connection()
+        except errors.PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+
+class PooledCursor:
+    """Cursor über einer Pool-Verbindung. Verhält sich wie ein normaler
+    mysql.connector-Cursor; execute(..., prepared=True) nutzt ein serverseitiges
+    Prepared Statement, das pro physischer Verbindung wiederverwendet wird."""
+
+    def __init__(self, conn, dictionary=True):
+        self.conn = conn
+        self.dictionary = dictionary
+        self._plain = conn.cursor(dictionary=dictionary)
+        self._last = self._plain
+        self._used_prepared = []
+
+    def _prepared(self, sql):
+        cnx = getattr(self.conn, "_cnx", self.conn)
+        key = (id(cnx), self.conn.connection_id, self.dictionary)
+        with _prepared_lock:
+            if key not in _prepared_cache:
+                # Nach einem Reconnect sind die alten Statements serverseitig weg
+                for stale in [k for k in _prepared_cache if k[0] == key[0]]:
+                    del _prepared_cache[stale]
+            cursors = _prepared_cache.setdefault(key, {})
+            cursor = cursors.get(sql)
+            if cursor is None:
+                cursor = self.conn.cursor(prepared=True, dictionary=self.dictionary)
+                cursors[sql] = cursor
+        return cursor
+
+    def execute(self, sql, params=(), prepared=False):
+        cursor = self._prepared(sql) if prepared else self._plain
+        cursor.execute(sql, params)
+        self._last = cursor
+        if prepared:
+            self._used_prepared.append(cursor)
+        return cursor
+
+    def fetchone(self):
+        return self._last.fetchone()
+
+    def fetchall(self):
+        return self._last.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._last.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._last.lastrowid
+
+    @property
+    def description(self):
+        return self._last.description
+
+    @property
+    def column_names(self):
+        return self._last.column_names
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        # Nicht gelesene Ergebnisse verwerfen, sonst blockieren sie die
+        # gecachten Prepared-Cursor bei der nächsten Ausleihe
+        for cursor in self._used_prepared:
+            try:
+                if cursor.with_rows:
+                    cursor.fetchall()
+            except errors.Error:
+                pass
+        self._plain.close()
+
+
+@contextmanager
+def db_cursor(dictionary=True):
+    """Cursor mit Pool-Verbindung: commit bei Erfolg, rollback bei Fehler,
+    danach geht die Verbindung zurück in den Pool."""
+    conn = get_connection()
+    cursor = PooledCursor(conn, dictionary=dictionary)
+    try:
+        yield cursor
+        conn.commit()
+    except Exception:
+        try:
+            conn.rollback()
+        except errors.Error:
+            pass
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
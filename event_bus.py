@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# Filename: event_bus.py
+"""Schlanker Pub/Sub über TCP (eine JSON-Zeile pro Nachricht) als Weckruf.
+
+Die Datenbank bleibt die einzige Wahrheit – Events sagen nur „schau jetzt
+nach“. Connector → Watchdog (conversation.new), Watchdog → Agent
+(conversation.queued) und Agent → Connector (conversation.solved) wecken die
+jeweils nächste Stufe sofort. Geht ein Event verloren oder läuft kein Broker,
+greift das AdaptivePoller-Polling mit Backoff.
+
+Broker:  python event_bus.py  (oder RUN_EVENT_BROKER im Watchdog)
+Clients: EVENT_BUS=host:47810 setzen.
+
+Ohne Broker kann der Agent fertige Antworten auch per HTTP melden:
+SOLVED_CALLBACK=http://connector:8444/solved (siehe notify_solved).
+"""
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+import urllib.request
+
+EVENT_BUS_ADDRESS = os.environ.get("EVENT_BUS")  # "host:port"; leer = nur Polling
+SOLVED_CALLBACK_URL = os.environ.get("SOLVED_CALLBACK")  # HTTP-Rückruf des Connectors, optional
+SOLVED_CALLBACK_TIMEOUT = 1
+EVENT_BUS_HOST = "0.0.0.0"
+EVENT_BUS_PORT = 47810
+RECONNECT_MIN_SECONDS = 1
+RECONNECT_MAX_SECONDS = 30
+CONNECT_TIMEOUT = 2
+
+# Topics
+CONVERSATION_NEW = "conversation.new"  # Connector hat eine Nachricht gespeichert
+CONVERSATION_QUEUED = "conversation.queued"  # Watchdog hat Anfragen Agents zugewiesen
+CONVERSATION_SOLVED = "conversation.solved"  # Agent hat eine Antwort fertig
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port or EVENT_BUS_PORT)
+
+
+def encode(message) -> bytes:
+    return (json.dumps(message, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+
+
+# === Broker ===
+class EventBroker(socketserver.ThreadingTCPServer):
+    """Leitet jede veröffentlichte Nachricht an alle Abonnenten des Topics weiter."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host=EVENT_BUS_HOST, port=EVENT_BUS_PORT):
+        super().__init__((host, port), BrokerHandler)
+        self.subscribers = {}  # topic: set(BrokerHandler)
+        self.lock = threading.Lock()
+
+    def subscribe(self, handler, topics):
+        with self.lock:
+            for topic in topics:
+                self.subscribers.setdefault(topic, set()).add(handler)
+
+    def unsubscribe(self, handler):
+        with self.lock:
+            for handlers in self.subscribers.values():
+                handlers.discard(handler)
+
+    def publish(self, topic, data):
+        with self.lock:
+            handlers = list(self.subscribers.get(topic, ()))
+        line = encode({"topic": topic, "data": data})
+        for handler in handlers:
+            handler.send(line)
+
+    def serve_in_background(self):
+        logging.info(f"📣 Event-Broker lauscht auf {self.server_address[0]}:{self.server_address[1]}")
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class BrokerHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+
+    def send(self, line):
+        try:
+            with self.write_lock:
+                self.wfile.write(line)
+                self.wfile.flush()
+        except OSError:
+            self.server.unsubscribe(self)
+
+    def handle(self):
+        try:
+            for raw in self.rfile:
+                try:
+                    message = json.loads(raw)
+                except ValueError:
+                    continue
+                if message.get("op") == "sub":
+                    self.server.subscribe(self, message.get("topics", []))
+                elif message.get("op") == "pub":
+                    self.server.publish(message["topic"], message.get("data") or {})
+        finally:
+            self.server.unsubscribe(self)
+
+
+# === Client ===
+class EventBus:
+    """Veröffentlichen ist „fire and forget“: ohne Broker geht das Event verloren
+    und der Empfänger findet die Arbeit beim nächsten Fallback-Poll."""
+
+    def __init__(self, address=EVENT_BUS_ADDRESS):
+        self.address = parse_address(address) if address else None
+        self.sock = None
+        self.lock = threading.Lock()
+        self.retry_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.address is not None
+
+    def connect(self):
+        return socket.create_connection(self.address, timeout=CONNECT_TIMEOUT)
+
+    def publish(self, topic, **data):
+        if not self.enabled:
+            return False
+        with self.lock:
+            try:
+                if self.sock is None:
+                    if time.monotonic() < self.retry_at:
+                        return False
+                    self.sock = self.connect()
+                self.sock.sendall(encode({"op": "pub", "topic": topic, "data": data}))
+                return True
+            except OSError as e:
+                logging.debug(f"Event '{topic}' nicht gesendet: {e}")
+                if self.sock is not None:
+                    self.sock.close()
+                self.sock = None
+                self.retry_at = time.monotonic() + RECONNECT_MIN_SECONDS
+                return False
+
+    def subscribe(self, topics, callback):
+        """Ruft callback(topic, data) im Hintergrundthread für jedes Event auf;
+        verlorene Verbindungen werden mit Backoff neu aufgebaut."""
+        if not self.enabled:
+            return
+        threading.Thread(target=self.listen, args=(list(topics), callback), daemon=True).start()
+
+    def listen(self, topics, callback):
+        delay = RECONNECT_MIN_SECONDS
+        while True:
+            try:
+                with self.connect() as sock:
+                    sock.settimeout(None)
+                    sock.sendall(encode({"op": "sub", "topics": topics}))
+                    logging.info(f"📣 Event-Bus verbunden, abonniert: {', '.join(topics)}")
+                    delay = RECONNECT_MIN_SECONDS
+                    for raw in sock.makefile("rb"):
+                        message = json.loads(raw)
+                        try:
+                            callback(message["topic"], message.get("data") or {})
+                        except Exception as e:
+                            logging.error(f"Fehler im Event-Handler für '{message['topic']}': {e}")
+            except (OSError, ValueError) as e:
+                logging.debug(f"Event-Bus nicht erreichbar: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+
+# === Fertige Antwort melden ===
+def notify_solved(bus, conv_id):
+    """Meldet eine gespeicherte Antwort über den Bus und/oder den HTTP-Rückruf.
+    Beides ist nur ein Hinweis – geht er verloren, liefert das Sicherheits-Polling aus."""
+    sent = bus.publish(CONVERSATION_SOLVED, id=conv_id) if bus is not None else False
+    if SOLVED_CALLBACK_URL:
+        request = urllib.request.Request(SOLVED_CALLBACK_URL, data=json.dumps({"id": conv_id}).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=SOLVED_CALLBACK_TIMEOUT):
+                sent = True
+        except OSError as e:
+            logging.debug(f"Rückruf für Anfrage {conv_id} fehlgeschlagen: {e}")
+    return sent
+
+
+# === Fallback-Polling ===
+class AdaptivePoller:
+    """Wartezeit zwischen zwei Polls: bei Arbeit sofort wieder min_interval,
+    sonst verdoppeln bis max_interval. notify() beendet die Wartezeit sofort."""
+
+    def __init__(self, min_interval, max_interval, factor=2.0):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.factor = factor
+        self.interval = min_interval
+        self.event = threading.Event()
+        self.listeners = []  # zusätzliche Weckfunktionen, z. B. für eine asyncio-Eventloop
+        self.wakeups = 0
+
+    def record(self, found_work):
+        if found_work:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.factor, self.max_interval)
+        return self.interval
+
+    def notify(self):
+        self.wakeups += 1
+        self.event.set()
+        for listener in self.listeners:
+            listener()
+
+    def wait(self):
+        """Schläft bis zum nächsten Poll; True, wenn ein Event geweckt hat."""
+        woken = self.event.wait(self.interval)
+        self.event.clear()
+        return woken
+
+
+def fallback_interval(base_interval, bus_interval):
+    """Mit Event-Bus darf das Sicherheits-Polling deutlich seltener laufen."""
+    return bus_interval if EVENT_BUS_ADDRESS else base_interval
+
+
+# === Direkt ausführbar: eigenständiger Broker ===
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    broker = EventBroker()
+    logging.info(f"📣 Event-Broker lauscht auf {EVENT_BUS_HOST}:{EVENT_BUS_PORT}")
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        logging.warning("Event-Broker wurde manuell beendet.")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# Filename: heartbeat.py
+"""Differenzielles Heartbeat-Protokoll für agent_status.
+
+Im Heartbeat-Takt wird nur last_seen berührt (ein kleines UPDATE auf den
+Primärschlüssel). Die volle Zeile wird per INSERT … ON DUPLICATE KEY UPDATE
+geschrieben, wenn eine Kennzahl ihre Schwelle überschreitet, sich die Menge
+geladener Modelle oder die Modellliste ändert oder FULL_UPDATE_MAX_INTERVAL
+verstrichen ist. Ein status-Eintrag in agent_log entsteht nur bei geänderter
+Modellliste – verglichen wird im Speicher statt per SELECT. Schreibrate und
+Datenmenge werden mitgezählt und regelmäßig geloggt.
+"""
+import logging
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from db_access import db_cursor
+
+HEARTBEAT_INTERVAL = 3  # Sekunden; Watchdog markiert Agents nach 10 s als inaktiv
+FULL_UPDATE_MAX_INTERVAL = 300  # Sekunden; volle Zeile spätestens danach
+CPU_THRESHOLD = 5.0  # Prozentpunkte
+MEM_THRESHOLD = 5.0  # Prozentpunkte
+GPU_UTIL_THRESHOLD = 5.0  # Prozentpunkte
+GPU_MEM_THRESHOLD_MB = 256
+STATS_REPORT_INTERVAL = 300  # Sekunden zwischen zwei Log-Ausgaben der Schreibrate
+
+UPSERT_SQL = """
+    INSERT INTO agent_status (
+        agent_name, hostname, last_seen, model_list, model_active, runtime_status, is_available,
+        cpu_load_percent, mem_used_percent, gpu_util_percent,
+        gpu_mem_used_mb, gpu_mem_total_mb, ram_mem_total_mb
+    ) VALUES (%s, %s, %s, %s, %s, %s, TRUE, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        hostname = VALUES(hostname),
+        last_seen = VALUES(last_seen),
+        model_list = VALUES(model_list),
+        model_active = VALUES(model_active),
+        runtime_status = VALUES(runtime_status),
+        is_available = TRUE,
+        cpu_load_percent = VALUES(cpu_load_percent),
+        mem_used_percent = VALUES(mem_used_percent),
+        gpu_util_percent = VALUES(gpu_util_percent),
+        gpu_mem_used_mb = VALUES(gpu_mem_used_mb),
+        gpu_mem_total_mb = VALUES(gpu_mem_total_mb),
+        ram_mem_total_mb = VALUES(ram_mem_total_mb)
+"""
+
+TOUCH_SQL = "UPDATE agent_status SET last_seen = %s, is_available = TRUE WHERE agent_name = %s"
+
+STATUS_LOG_SQL = """
+    INSERT INTO agent_log (conversation_id, agent_name, log_type, model_info, timestamp)
+    VALUES (%s, %s, 'status', %s, %s)
+"""
+
+
+def payload_bytes(params) -> int:
+    """Ungefähre Nutzdaten eines Statements (Parameter als Text)."""
+    return sum(len(str(p).encode("utf-8")) for p in params if p is not None)
+
+
+def exceeds(prev, curr, threshold) -> bool:
+    if prev is None or curr is None:
+        return prev != curr
+    return abs(curr - prev) >= threshold
+
+
+class HeartbeatWriter:
+    def __init__(self, agent_name, telemetry, hostname=None):
+        self.agent_name = agent_name
+        self.hostname = hostname or socket.gethostname()
+        self.telemetry = telemetry
+        self.last_full = None  # Schnappschuss der letzten vollen Zeile
+        self.last_full_at = None
+        self.logged_model_info_version = None
+        self.force_full = False
+        self.counts = Counter()  # touch, full, status_log, bytes
+        self.started_at = time.monotonic()
+        self.reported_at = self.started_at
+        self.lock = threading.Lock()
+
+    # === Entscheidung ===
+    def needs_full_update(self, snap) -> bool:
+        prev = self.last_full
+        if prev is None or self.force_full:
+            return True
+        if time.monotonic() - self.last_full_at >= FULL_UPDATE_MAX_INTERVAL:
+            return True
+        return (
+            exceeds(prev["cpu"], snap["cpu"], CPU_THRESHOLD)
+            or exceeds(prev["mem"], snap["mem"], MEM_THRESHOLD)
+            or exceeds(prev["gpu_util"], snap["gpu_util"], GPU_UTIL_THRESHOLD)
+            or exceeds(prev["gpu_used"], snap["gpu_used"], GPU_MEM_THRESHOLD_MB)
+            or prev["active_model"] != snap["active_model"]
+            or set(prev["loaded_models"]) != set(snap["loaded_models"])
+            or prev["model_info_version"] != snap["model_info_version"]
+        )
+
+    # === Schreiben ===
+    def execute(self, cursor, kind, sql, params):
+        cursor.execute(sql, params, prepared=True)
+        with self.lock:
+            self.counts[kind] += 1
+            self.counts["bytes"] += payload_bytes(params)
+        return cursor.rowcount
+
+    def beat(self, cursor):
+        """Ein Heartbeat: volle Zeile oder nur last_seen."""
+        snap = self.telemetry.snapshot()
+        now = datetime.now()
+
+        if snap["model_info"] and snap["model_info_version"] != self.logged_model_info_version:
+            self.execute(cursor, "status_log", STATUS_LOG_SQL, (None, self.agent_name, snap["model_info"], now))
+            self.logged_model_info_version = snap["model_info_version"]
+
+        if self.needs_full_update(snap):
+            self.execute(cursor, "full", UPSERT_SQL, (
+                self.agent_name, self.hostname, now, snap["model_info"], snap["active_model"],
+                snap["runtime_status"], snap["cpu"], snap["mem"], snap["gpu_util"],
+                snap["gpu_used"], snap["gpu_total"], snap["ram_total_mb"],
+            ))
+            self.last_full = snap
+            self.last_full_at = time.monotonic()
+            self.force_full = False
+        elif self.execute(cursor, "touch", TOUCH_SQL, (now, self.agent_name)) == 0:
+            # Zeile fehlt (z. B. von Hand gelöscht) → nächstes Mal vollständig schreiben
+            self.force_full = True
+
+        self.report()
+
+    # === Kennzahlen ===
+    def stats(self) -> dict:
+        with self.lock:
+            counts = dict(self.counts)
+        minutes = max((time.monotonic() - self.started_at) / 60, 1 / 60)
+        writes = counts.get("touch", 0) + counts.get("full", 0) + counts.get("status_log", 0)
+        return {
+            "touches": counts.get("touch", 0),
+            "full_updates": counts.get("full", 0),
+            "status_logs": counts.get("status_log", 0),
+            "bytes": counts.get("bytes", 0),
+            "writes_per_minute": writes / minutes,
+            "bytes_per_minute": counts.get("bytes", 0) / minutes,
+        }
+
+    def report(self):
+        now = time.monotonic()
+        if now - self.reported_at < STATS_REPORT_INTERVAL:
+            return
+        self.reported_at = now
+        s = self.stats()
+        logging.info(f"💓 Heartbeat {self.agent_name}: {s['touches']} Touch / {s['full_updates']} voll / "
+                     f"{s['status_logs']} Log | {s['writes_per_minute']:.1f} Writes/min, "
+                     f"{s['bytes_per_minute'] / 1024:.1f} KB/min")
+
+    def run_forever(self, interval=HEARTBEAT_INTERVAL):
+        while True:
+            try:
+                with db_cursor(dictionary=False) as cursor:
+                    self.beat(cursor)
+            except Exception as e:
+                logging.error(f"Fehler beim Heartbeat: {e}")
+            time.sleep(interval)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# Filename: history_cache.py
+"""LRU-Cache der Dialogverläufe im Agent.
+
+Pro dialog_id werden die gelösten Runden kompakt als Tupel (ID, Nutzertext,
+Antwort, Tokens) gehalten. Nach jeder eigenen Antwort wird die Runde nach dem
+Commit nach ID einsortiert statt den Dialog neu zu lesen. Vor der Nutzung prüft eine kleine Abfrage
+(COUNT/MAX(id) der gelösten Zeilen), ob der Stand noch stimmt – hat ein
+anderer Agent den Dialog weitergeführt, wird aus der DB neu geladen.
+Speicher ist über MAX_CACHE_BYTES und MAX_DIALOGS begrenzt.
+"""
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+
+from agent_assignment import estimate_tokens
+
+MAX_CACHE_BYTES = 32 * 1024 * 1024
+MAX_DIALOGS = 1000
+REPORT_EVERY = 100  # Abfragen zwischen zwei Log-Ausgaben der Trefferquote
+
+
+def text_bytes(text) -> int:
+    return len(text.encode("utf-8")) if text else 0
+
+
+class DialogHistory:
+    __slots__ = ("turns", "count", "max_id", "size")
+
+    def __init__(self, turns, count, max_id):
+        self.turns = turns  # Liste von (id, user_message, model_response, tokens)
+        self.count = count
+        self.max_id = max_id
+        self.size = sum(text_bytes(u) + text_bytes(a) for _, u, a, _ in turns)
+
+    def messages(self) -> list:
+        return turns_to_messages(self.turns)
+
+
+def turns_to_messages(turns) -> list:
+    history = []
+    for _, user_message, model_response, _ in turns:
+        if user_message:
+            history.append({"role": "user", "content": user_message})
+        if model_response:
+            history.append({"role": "assistant", "content": model_response})
+    return history
+
+
+def turn_tokens(row) -> int:
+    """Gespeicherte Tokenzahl der Runde; ältere Zeilen ohne Werte werden geschätzt."""
+    user_tokens = row.get("user_tokens")
+    if user_tokens is None:
+        user_tokens = estimate_tokens(row["user_message"])
+    response_tokens = row.get("response_tokens")
+    if response_tokens is None:
+        response_tokens = estimate_tokens(row["model_response"])
+    return user_tokens + response_tokens
+
+
+class HistoryCache:
+    def __init__(self, max_bytes=MAX_CACHE_BYTES, max_dialogs=MAX_DIALOGS):
+        self.max_bytes = max_bytes
+        self.max_dialogs = max_dialogs
+        self.dialogs = OrderedDict()  # dialog_id: DialogHistory, älteste zuerst
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0  # nicht im Cache
+        self.stale = 0  # im Cache, aber von anderer Stelle weitergeführt
+        self.lock = threading.Lock()
+
+    # === Lesen ===
+    def history(self, cursor, dialog_id) -> list:
+        """Bisherige Runden des Dialogs als Ollama-Nachrichten."""
+        return turns_to_messages(self.turns(cursor, dialog_id))
+
+    def turns(self, cursor, dialog_id) -> list:
+        """Bisherige Runden des Dialogs als (id, user, antwort, tokens), älteste zuerst."""
+        with self.lock:
+            entry = self.dialogs.get(dialog_id)
+        if entry is not None:
+            cursor.execute("""
+                SELECT COUNT(*) AS cnt, MAX(id) AS max_id FROM conversations
+                WHERE dialog_id = %s AND message_status = 'solved'
+            """, (dialog_id,), prepared=True)
+            version = cursor.fetchone()
+            if (version["cnt"], version["max_id"]) == (entry.count, entry.max_id):
+                with self.lock:
+                    self.hits += 1
+                    if dialog_id in self.dialogs:
+                        self.dialogs.move_to_end(dialog_id)
+                self.report()
+                return list(entry.turns)
+            with self.lock:
+                self.stale += 1
+        else:
+            with self.lock:
+                self.misses += 1
+
+        entry = self.load(cursor, dialog_id)
+        self.store(dialog_id, entry)
+        self.report()
+        return list(entry.turns)
+
+    def load(self, cursor, dialog_id) -> DialogHistory:
+        cursor.execute("""
+            SELECT id, user_message, model_response, user_tokens, response_tokens
+            FROM conversations
+            WHERE dialog_id = %s
+            AND message_status = 'solved'
+            ORDER BY id ASC
+        """, (dialog_id,), prepared=True)
+        rows = cursor.fetchall()
+        turns = [(row["id"], row["user_message"], row["model_response"], turn_tokens(row)) for row in rows]
+        return DialogHistory(turns, len(rows), max((row["id"] for row in rows), default=None))
+
+    # === Schreiben ===
+    def store(self, dialog_id, entry):
+        with self.lock:
+            old = self.dialogs.pop(dialog_id, None)
+            if old is not None:
+                self.bytes -= old.size
+            self.dialogs[dialog_id] = entry
+            self.bytes += entry.size
+            self.evict()
+
+    def append(self, dialog_id, conv_id, user_message, model_response, tokens):
+        """Fügt die gerade gelöste Runde ein, ohne den Dialog neu zu lesen. Parallele
+        Runden eines Dialogs können in beliebiger Reihenfolge fertig werden, daher
+        wird nach ID einsortiert."""
+        with self.lock:
+            entry = self.dialogs.get(dialog_id)
+            if entry is None:
+                return
+            ids = [turn[0] for turn in entry.turns]
+            position = bisect.bisect_left(ids, conv_id)
+            if position < len(ids) and ids[position] == conv_id:
+                return  # schon enthalten (z. B. beim Neuladen mitgelesen)
+            entry.turns.insert(position, (conv_id, user_message, model_response, tokens))
+            entry.count += 1
+            entry.max_id = max(entry.max_id or 0, conv_id)
+            added = text_bytes(user_message) + text_bytes(model_response)
+            entry.size += added
+            self.bytes += added
+            self.dialogs.move_to_end(dialog_id)
+            self.evict()
+
+    def evict(self):
+        # Aufrufer hält self.lock
+        while self.dialogs and (self.bytes > self.max_bytes or len(self.dialogs) > self.max_dialogs):
+            _, entry = self.dialogs.popitem(last=False)
+            self.bytes -= entry.size
+
+    # === Kennzahlen ===
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses + self.stale
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "dialogs": len(self.dialogs),
+                "bytes": self.bytes,
+            }
+
+    def report(self):
+        s = self.stats()
+        if (s["hits"] + s["misses"] + s["stale"]) % REPORT_EVERY:
+            return
+        logging.info(f"🗂 Verlaufscache: Trefferquote {s['hit_rate']:.0%} ({s['hits']} Treffer, "
+                     f"{s['misses']} neu, {s['stale']} veraltet) | {s['dialogs']} Dialoge, "
+                     f"{s['bytes'] / 1024:.0f} KB")
+
+
+history_cache = HistoryCache()
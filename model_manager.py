@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# Filename: model_manager.py
+"""Vorladen, keep_alive und Entladen von Ollama-Modellen im Agent.
+
+Der Agent meldet die Modelle der wartenden Anfragen (set_upcoming, auch leer,
+wenn die Warteschlange abgearbeitet ist) sowie Beginn und Ende jeder
+Generierung (begin/end). Ein Hintergrundthread lädt das nächste benötigte
+Modell per leerem /api/generate vor – aber nur, wenn es neben den laufenden
+Modellen in den freien Speicher passt oder die Gruppe des laufenden Modells
+fertig ist; sonst würde es das gerade genutzte Modell verdrängen. Er
+entlädt ungenutzte Modelle, wenn ein anderes gebraucht wird, und leitet den
+keep_alive-Wert je Modell aus der Nachfrage in `conversations` ab. Die
+Stellgrößen kommen aus `model_catalog` (preload, keep_alive_min_s,
+keep_alive_max_s); gemessene Ladezeiten landen in model_catalog.last_load_ms
+und agent_log.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+
+import requests
+from db_access import db_cursor
+
+OLLAMA_BASE_URL = "http://localhost:11434"
+PRELOAD_INTERVAL = 2  # Sekunden zwischen zwei Planungsrunden
+CATALOG_REFRESH_INTERVAL = 60  # Sekunden zwischen DB-Abfragen für Katalog und Nachfrage
+DEMAND_WINDOW_MINUTES = 60
+PRELOAD_AHEAD = 1  # so viele noch nicht geladene Modelle werden vorab geladen
+IDLE_UNLOAD_SECONDS = 120  # ungenutzte Modelle danach entladen, wenn ein anderes gebraucht wird
+KEEP_ALIVE_GAP_FACTOR = 2.0  # keep_alive ≈ Faktor × mittlerer Abstand zwischen Anfragen
+DEFAULT_KEEP_ALIVE_MIN_S = 300  # Ollama-Standard
+DEFAULT_KEEP_ALIVE_MAX_S = 3600
+
+
+class ModelManager:
+    def __init__(self, agent_name, base_url=OLLAMA_BASE_URL, telemetry=None):
+        self.agent_name = agent_name
+        self.base_url = base_url
+        self.telemetry = telemetry  # TelemetrySampler für freien RAM/VRAM, optional
+        self.catalog = {}  # model_name: Zeile aus model_catalog
+        self.demand = {}  # model_name: Anfragen im DEMAND_WINDOW_MINUTES
+        self.upcoming = []  # Modelle in Scheduler-Reihenfolge
+        self.last_used = {}  # model_name: monotonic
+        self.active = {}  # model_name: Anzahl laufender Generierungen
+        self.catalog_loaded_at = None
+        self.lock = threading.Lock()
+
+    # === Eingaben vom Agent ===
+    def set_upcoming(self, models):
+        with self.lock:
+            self.upcoming = list(dict.fromkeys(models))
+
+    def note_used(self, model):
+        with self.lock:
+            self.last_used[model] = time.monotonic()
+
+    def begin(self, model):
+        """Generierung mit diesem Modell startet."""
+        with self.lock:
+            self.last_used[model] = time.monotonic()
+            self.active[model] = self.active.get(model, 0) + 1
+
+    def end(self, model):
+        with self.lock:
+            self.last_used[model] = time.monotonic()
+            remaining = self.active.get(model, 0) - 1
+            if remaining > 0:
+                self.active[model] = remaining
+            else:
+                self.active.pop(model, None)
+
+    # === Katalog und Nachfrage ===
+    def refresh(self, cursor, force=False):
+        now = time.monotonic()
+        if not force and self.catalog_loaded_at is not None and now - self.catalog_loaded_at < CATALOG_REFRESH_INTERVAL:
+            return
+        cursor.execute("""
+            SELECT model_name, preload, keep_alive_min_s, keep_alive_max_s, min_ram_mb, min_vram_mb
+            FROM model_catalog WHERE is_active = 1
+        """)
+        catalog = {row["model_name"]: row for row in cursor.fetchall()}
+        cursor.execute("""
+            SELECT COALESCE(c.model_used, p.model) AS model, COUNT(*) AS cnt
+            FROM conversations c
+            LEFT JOIN prompts p ON p.id = c.pre_prompt_id
+            WHERE c.agent = %s AND c.timestamp > NOW() - INTERVAL %s MINUTE
+            GROUP BY model
+        """, (self.agent_name, DEMAND_WINDOW_MINUTES))
+        demand = {row["model"]: int(row["cnt"]) for row in cursor.fetchall() if row["model"]}
+        with self.lock:
+            self.catalog = catalog
+            self.demand = demand
+        self.catalog_loaded_at = now
+
+    def keep_alive(self, model) -> int:
+        """keep_alive in Sekunden: deckt den erwarteten Abstand bis zur nächsten
+        Anfrage ab, begrenzt durch keep_alive_min_s/keep_alive_max_s."""
+        entry = self.catalog.get(model) or {}
+        minimum = entry.get("keep_alive_min_s") or DEFAULT_KEEP_ALIVE_MIN_S
+        maximum = max(entry.get("keep_alive_max_s") or DEFAULT_KEEP_ALIVE_MAX_S, minimum)
+        count = self.demand.get(model, 0)
+        if not count:
+            return minimum
+        mean_gap = DEMAND_WINDOW_MINUTES * 60 / count
+        if mean_gap > maximum:
+            # Seltene Modelle nicht lange im Speicher halten
+            return minimum
+        return int(min(max(KEEP_ALIVE_GAP_FACTOR * mean_gap, minimum), maximum))
+
+    def keep_alive_param(self, model) -> str:
+        return f"{self.keep_alive(model)}s"
+
+    # === Ollama-HTTP-API ===
+    def loaded_models(self) -> set:
+        response = requests.get(f"{self.base_url}/api/ps", timeout=5)
+        response.raise_for_status()
+        return {m["name"] for m in response.json().get("models", [])}
+
+    def preload(self, model):
+        """Lädt das Modell mit leerem Prompt und liefert die Ladezeit in ms."""
+        payload = {"model": model, "keep_alive": self.keep_alive_param(model)}
+        started = time.monotonic()
+        response = requests.post(f"{self.base_url}/api/generate", json=payload, timeout=300)
+        response.raise_for_status()
+        load_ns = response.json().get("load_duration")
+        load_ms = int(load_ns / 1_000_000) if load_ns else int((time.monotonic() - started) * 1000)
+        self.note_used(model)
+        return load_ms
+
+    def unload(self, model):
+        requests.post(f"{self.base_url}/api/generate", json={"model": model, "keep_alive": 0}, timeout=30)
+        with self.lock:
+            self.last_used.pop(model, None)
+
+    # === Planung ===
+    def fits(self, model) -> bool:
+        """Passt das Modell laut model_catalog in den freien VRAM (bzw. RAM ohne GPU)?
+        Ohne Katalogwert oder Messung wird nicht geraten – dann passt es nicht."""
+        if self.telemetry is None:
+            return False
+        snapshot = self.telemetry.snapshot()
+        entry = self.catalog.get(model) or {}
+        if snapshot.get("gpu_total"):
+            needed = entry.get("min_vram_mb")
+            free = snapshot["gpu_total"] - (snapshot.get("gpu_used") or 0)
+        else:
+            needed = entry.get("min_ram_mb")
+            free = snapshot.get("ram_total_mb", 0) * (1 - (snapshot.get("mem") or 0) / 100)
+        return needed is not None and needed <= free
+
+    def plan(self, loaded):
+        """Liefert (zu ladende, zu entladende) Modelle für den aktuellen Stand."""
+        with self.lock:
+            upcoming = list(self.upcoming)
+            last_used = dict(self.last_used)
+            active = set(self.active)
+        needed = [m for m in upcoming if (self.catalog.get(m) or {}).get("preload", 1)]
+        to_load = []
+        for model in [m for m in needed if m not in loaded][:PRELOAD_AHEAD]:
+            # Solange ein anderes Modell generiert, nur vorladen, wenn beide Platz haben –
+            # sonst verdrängt Ollama das laufende Modell und die Bündelung ist dahin
+            if active - {model} and not self.fits(model):
+                continue
+            to_load.append(model)
+        to_unload = []
+        if to_load:
+            now = time.monotonic()
+            to_unload = [m for m in loaded
+                         if m not in upcoming and m not in active and now - last_used.get(m, 0) >= IDLE_UNLOAD_SECONDS]
+        return to_load, to_unload
+
+    def record_load(self, cursor, model, load_ms):
+        cursor.execute("UPDATE model_catalog SET last_load_ms = %s WHERE model_name = %s", (load_ms, model))
+        cursor.execute("""
+            INSERT INTO agent_log (conversation_id, agent_name, log_type, message, timestamp)
+            VALUES (%s, %s, 'info', %s, %s)
+        """, (None, self.agent_name, f"Modell geladen: {model} | Ladezeit={load_ms}ms", datetime.now()))
+
+    def run_cycle(self):
+        with db_cursor() as cursor:
+            self.refresh(cursor)
+        to_load, to_unload = self.plan(self.loaded_models())
+        for model in to_unload:
+            logging.info(f"📤 Entlade ungenutztes Modell '{model}'")
+            self.unload(model)
+        for model in to_load:
+            logging.info(f"📥 Lade Modell '{model}' vor (keep_alive={self.keep_alive_param(model)})")
+            load_ms = self.preload(model)
+            logging.info(f"📥 Modell '{model}' geladen in {load_ms} ms")
+            with db_cursor() as cursor:
+                self.record_load(cursor, model, load_ms)
+
+    def run_forever(self):
+        while True:
+            try:
+                self.run_cycle()
+            except Exception as e:
+                logging.error(f"Fehler beim Modell-Vorladen: {e}")
+            time.sleep(PRELOAD_INTERVAL)
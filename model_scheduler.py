@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# Filename: model_scheduler.py
+"""Reihenfolge für wartende Anfragen, die Modellwechsel in Ollama minimiert.
+
+Anfragen werden nach Modell gruppiert: zuerst das bereits geladene Modell,
+danach die übrigen Gruppen nach ihrer ältesten Anfrage. Ein Alterungsfenster
+sorgt für Fairness – was länger als AGING_WINDOW_SECONDS wartet, wird ohne
+Rücksicht auf das Modell vorgezogen, damit keine Anfrage verhungert.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+AGING_WINDOW_SECONDS = 60
+REPORT_EVERY = 50  # Generierungen zwischen zwei Log-Ausgaben der Wechselrate
+
+
+def order_by_model(items, warm_models=(), aging_seconds=AGING_WINDOW_SECONDS, now=None,
+                   model_key="model", time_key="timestamp"):
+    """Sortiert Dicts mit Modell und Zeitstempel für möglichst wenige Wechsel."""
+    now = now or datetime.now()
+    items = sorted(items, key=lambda item: item[time_key])
+
+    starving = [i for i in items if (now - i[time_key]).total_seconds() >= aging_seconds]
+    rest = [i for i in items if (now - i[time_key]).total_seconds() < aging_seconds]
+
+    groups = OrderedDict()  # Einfügereihenfolge = älteste Anfrage je Modell
+    for item in rest:
+        groups.setdefault(item[model_key], []).append(item)
+
+    warm = [m for m in groups if m in warm_models]
+    cold = [m for m in groups if m not in warm_models]
+
+    # Auch die ausgehungerten Anfragen nach Modell bündeln, Reihenfolge nach Alter
+    ordered = []
+    starving_groups = OrderedDict()
+    for item in starving:
+        starving_groups.setdefault(item[model_key], []).append(item)
+    for model, group in starving_groups.items():
+        ordered.extend(group)
+        # Das Modell ist danach ohnehin geladen – gleiche Anfragen direkt anschließen
+        ordered.extend(groups.pop(model, []))
+    for model in warm + cold:
+        ordered.extend(groups.get(model, []))
+    return ordered
+
+
+class ModelSwitchCounter:
+    """Zählt, wie oft aufeinanderfolgende Generierungen das Modell wechseln."""
+
+    def __init__(self, name="Agent"):
+        self.name = name
+        self.current_model = None
+        self.generations = 0
+        self.switches = 0
+        self.lock = threading.Lock()
+
+    def note(self, model):
+        with self.lock:
+            if self.current_model is not None and model != self.current_model:
+                self.switches += 1
+            self.current_model = model
+            self.generations += 1
+            if self.generations % REPORT_EVERY == 0:
+                logging.info(f"🔁 {self.name}: {self.switches} Modellwechsel bei {self.generations} Generierungen "
+                             f"({self.switch_rate():.0%})")
+
+    def switch_rate(self) -> float:
+        return self.switches / self.generations if self.generations else 0.0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"generations": self.generations, "model_switches": self.switches,
+                    "current_model": self.current_model}
@@ -4,317 +4,542 @@ import os
 import time
 import logging
 import socket
-import subprocess
-import mysql.connector
 import requests
 import uuid
-from configparser import ConfigParser
+import json
+from collections import Counter
 from datetime import datetime, timedelta
 import threading
-import psutil
+import asyncio
+import argparse
+import aiohttp
+from db_access import db_cursor, init_pool
+from prompt_index import tag_index
+from history_cache import history_cache
+from context_manager import context_manager
+from agent_assignment import estimate_tokens
+from response_cache import cache_key, is_cacheable, response_cache
+from semantic_cache import SemanticCache
+from single_flight import SingleFlight
+from vector_memory import HashEmbedder, OllamaEmbedder, VectorMemory, format_snippets
+from model_scheduler import ModelSwitchCounter, order_by_model
+from model_manager import ModelManager
+from telemetry import TelemetrySampler
+from heartbeat import HeartbeatWriter
+from agent_registry import REGISTRY_ADDRESS, HeartbeatSender
+from event_bus import CONVERSATION_QUEUED, AdaptivePoller, EventBus, fallback_interval, notify_solved
 
 #logging.basicConfig(level=logging.DEBUG, format="%(asctime)s [%(levelname)s] %(message)s")
 
 # === Konfiguration ===
-ACCESS_FILE = "private/.mariadb_access"
-OLLAMA_URL = "http://localhost:11434/api/chat"
+OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_URL = f"{OLLAMA_BASE_URL}/api/chat"
 AGENT_NAME = socket.gethostname()
 CHECK_INTERVAL = 3  # Sekunden
+MIN_CHECK_INTERVAL = 0.5  # solange Arbeit da ist; ohne Arbeit Backoff bis CHECK_INTERVAL
+BUS_FALLBACK_INTERVAL = 30  # Sicherheits-Polling, wenn der Watchdog per Event weckt
+STREAM_RESPONSES = True  # Antworten tokenweise von Ollama lesen und Zwischenstände speichern
+STREAM_FLUSH_INTERVAL = 1.0  # Sekunden zwischen zwei Teil-Updates in der DB
+ERROR_REPLY = "❌ Fehler bei der Modellanfrage."
+OLLAMA_NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", 1))  # parallele Slots pro Modell (wie in Ollama)
+MAX_CONCURRENT_REQUESTS = 8  # Obergrenze gleichzeitiger Generierungen auf diesem Agent
+LEASE_RENEW_INTERVAL = 30  # Sekunden; muss deutlich unter LEASE_TIMEOUT_SECONDS im Watchdog liegen
+SCHEDULING_MODE = "model"  # "model": nach Modell bündeln (weniger Ladevorgänge), "fifo": strikt nach Alter
+SCHEDULER_LOOKAHEAD = 50  # so viele wartende Zeilen berücksichtigt der Modell-Scheduler
+DEFAULT_MODEL = "stablelm2:1.6b"
+PRELOAD_MODELS = True  # nächste benötigte Modelle vorladen, keep_alive nach Nachfrage setzen
+LONG_TERM_MEMORY = False  # ähnliche Runden aus früheren Dialogen in den Systemprompt einfügen
+MEMORY_EMBEDDER = "ollama"  # "ollama" (/api/embed) oder "hash" (deterministisch, ohne Modell)
+MEMORY_TOP_K = 3
+MEMORY_MIN_SCORE = 0.35  # Kosinus-Ähnlichkeit; darunter wird nichts eingefügt
+DEFAULT_CACHE_TTL = 3600  # Sekunden, falls prompts.cache_ttl_s leer ist
+SEMANTIC_CACHE_MODE = "off"  # "off", "shadow" (nur messen) oder "on" (Treffer ersetzen die Generierung)
+COALESCE_REQUESTS = True  # identische Einzelfragen teilen sich eine laufende Generierung
+REGISTRY_DB_HEARTBEAT_INTERVAL = 60  # Sekunden; mit Registry schreibt der Agent agent_status nur noch selten
 
 # === Logging ===
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
-# === DB-Konfiguration laden ===
-def load_db_config():
-    config = ConfigParser()
-    config.read(ACCESS_FILE)
-    client = config["client"]
-    return {
-        "host": client.get("host", "127.0.0.1"),
-        "port": int(client.get("port", 3306)),
-        "user": client.get("user"),
-        "password": client.get("password"),
-        "database": client.get("database")
-    }
-
-# === Perfomance Informationen ermitteln ===
-
-def get_cpu_load():
-    return psutil.cpu_percent(interval=None)
-
-def get_memory_usage():
-    return psutil.virtual_memory().percent
-
-def get_gpu_info():
-    try:
-        out = subprocess.check_output(["nvidia-smi", "--query-gpu=utilization.gpu,memory.used,memory.total",
-                                       "--format=csv,noheader,nounits"],
-                                      text=True)
-        util_str, used_str, total_str = out.strip().split(", ")
-        return float(util_str), int(used_str), int(total_str)
-    except Exception:
-        return None, None, None
-
-# === Agent-Infos eintragen und agent_status aktualisieren ===
-def log_agent_info(cursor):
-    import psutil  # nur falls nicht global importiert
-
-    def run_cmd(command):
-        try:
-            return subprocess.check_output(command, text=True).strip().splitlines()[1:]
-        except Exception as e:
-            return [f"Fehler: {e}"]
-
-    # Modellinformationen via ollama
-    models = run_cmd(["ollama", "list"])
-    status = run_cmd(["ollama", "ps"])
-
-    model_info_str = "\n".join(models)
-    runtime_status_str = "\n".join(status)
-
-    # Aktives Modell extrahieren (erste Zeile mit Modellnamen)
-    active_model = "-"
-    for line in status:
-        if line.strip():
-            parts = line.split()
-            if parts:
-                active_model = parts[0]
-                break
+# === Prompt Logik ===
 
-    # Performance-Werte sammeln
-    cpu = get_cpu_load()                         # CPU-Auslastung in %
-    mem = get_memory_usage()                     # RAM-Auslastung in %
-    gpu_util, gpu_used, gpu_total = get_gpu_info()
-    ram_total_mb = psutil.virtual_memory().total // 1024 // 1024  # ⇨ RAM gesamt in MB
+def find_best_prompt_id_by_tags(cursor, user_text):
+    # Index wird nur bei geänderten pre-Prompts neu aus der DB geladen
+    tag_index.refresh(cursor)
+    return tag_index.best_prompt_id(user_text)
 
-    # Debug-Ausgabe zur Verifikation (optional)
-    #print(f"[DEBUG] RAM gesamt erkannt: {ram_total_mb} MB")
+# === Konversation aus DB laden ===
+def build_chat_history(cursor, dialog_id, new_prompt, model, system_prompt=None):
+    # Verlauf aus dem Cache; die DB wird nur bei Fehlschlag oder fremden Antworten gelesen
+    turns = history_cache.turns(cursor, dialog_id)
+    # Nur die neuesten Runden im Token-Budget des Modells, ältere als Zusammenfassung
+    return context_manager.build_messages(cursor, model, turns, dialog_id, system_prompt, new_prompt)
+
+# === Anfrage vorbereiten: Prompt, Modell, Dialog, Sperre, Verlauf ===
+def prepare_request(cursor, row, query_vector=None):
+    """Ermittelt Prompt und Modell, sperrt die Anfrage und baut den Chatverlauf.
+    query_vector ist die vorab (ohne DB-Verbindung) berechnete Einbettung der Frage.
+    Liefert ein Job-Dict oder None, wenn die Anfrage nicht bearbeitet wird."""
+    conv_id = row["id"]
+    prompt = row["user_message"]
+    user_id = row["user_id"]
+
+    logging.debug(f"🛠 Anfrage erhalten: ID={conv_id} | Text='{prompt}'")
+    logging.debug("🔍 Starte Tag-Matching auf pre-Prompts...")
+
+    if not row.get("pre_prompt_id"):
+        best_id = find_best_prompt_id_by_tags(cursor, prompt)
+        if best_id:
+            logging.debug(f"➤ Gewählt: Prompt ID {best_id}")
+            row["pre_prompt_id"] = best_id
+        else:
+            logging.debug("⚠️ Kein passender Pre-Prompt gefunden.")
+
+    model = row.get("model_used")
+    pre_prompt_text = None
+    prompt_name = None
+    cache_enabled = False
+    cache_ttl = None
+    semantic_threshold = None
+    if not model and row.get("pre_prompt_id"):
+        cursor.execute("""
+            SELECT model, content, name, cache_enabled, cache_ttl_s, semantic_threshold
+            FROM prompts WHERE id = %s
+        """, (row["pre_prompt_id"],), prepared=True)
+        result = cursor.fetchone()
+        if result:
+            model = result.get("model") or model
+            pre_prompt_text = result.get("content")
+            prompt_name = result.get("name")
+            cache_enabled = bool(result.get("cache_enabled"))
+            cache_ttl = result.get("cache_ttl_s")
+            semantic_threshold = result.get("semantic_threshold")
+            logging.debug(f"📦 Modellzuordnung: {model} durch Prompt {prompt_name}")
+            if pre_prompt_text:
+                logging.debug(f"🧠 Pre-Prompt-Inhalt (Auszug): {pre_prompt_text[:80]}...")
+    if not model:
+        model = DEFAULT_MODEL
+        logging.debug(f"📦 Kein Modell im Prompt definiert. Fallback: {model}")
 
-    # agent_log bei Modelländerung aktualisieren
-    if status:
+    # 🧩 Kompatibilitätsprüfung basierend auf Agent-Fähigkeit (inkl. RAM/VRAM)
+    if not is_model_supported_by_agent(cursor, AGENT_NAME, model):
+        logging.warning(f"⛔ Modell '{model}' ist nicht kompatibel mit Agent '{AGENT_NAME}' – Anfrage wird ignoriert.")
         cursor.execute("""
-            SELECT model_info FROM agent_log
-            WHERE agent_name = %s AND log_type = 'status'
-            ORDER BY timestamp DESC LIMIT 1
-        """, (AGENT_NAME,))
-        last_status = cursor.fetchone()
-        if not last_status or last_status["model_info"] != model_info_str:
-            cursor.execute("""
-                INSERT INTO agent_log (conversation_id, agent_name, log_type, model_info, timestamp)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (None, AGENT_NAME, "status", model_info_str, datetime.now()))
-
-    # Agentstatus schreiben – mit vollständigen Performancewerten inkl. RAM
-    cursor.execute("""
-        REPLACE INTO agent_status (
-            agent_name, hostname, last_seen, performance_class,
-            recommended_models, model_list, model_active, runtime_status, is_available, notes,
-            cpu_load_percent, mem_used_percent, gpu_util_percent,
-            gpu_mem_used_mb, gpu_mem_total_mb, ram_mem_total_mb
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    """, (
-        AGENT_NAME,
-        socket.gethostname(),
-        datetime.now(),
-        None,           # performance_class
-        None,           # recommended_models
-        model_info_str,
-        active_model,
-        runtime_status_str,
-        True,
-        None,
-        cpu,
-        mem,
-        gpu_util,
-        gpu_used,
-        gpu_total,
-        ram_total_mb
-    ))
-
-    #print(f"[{datetime.now().strftime('%H:%M:%S')}] Status-Update ✅ Modell: {active_model}") #nur zum Troubleshooting
+            UPDATE conversations
+            SET message_status = 'error', failure_reason = 'Modell nicht kompatibel mit Agent'
+            WHERE id = %s
+        """, (conv_id,))
+        return None
 
-# === Prompt Logik ===
+    prompt_info = f"Prompt-ID={row.get('pre_prompt_id') or '-'}"
+    if prompt_name:
+        prompt_info += f" ({prompt_name})"
+    logging.info(f"⛰ Bearbeite Anfrage {conv_id} mit Modell '{model}' | {prompt_info}")
 
-def find_best_prompt_id_by_tags(cursor, user_text):
-    cursor.execute("SELECT id, tags FROM prompts WHERE is_active = 1 AND role = 'pre' AND tags IS NOT NULL")
-    prompts = cursor.fetchall()
+    dialog_id = get_or_create_dialog_id(cursor, user_id)
 
-    user_words = [w.strip(",.!?").lower() for w in user_text.split()]
-    max_hits = 0
-    best_id = None
+    cursor.execute("""
+        UPDATE conversations
+        SET processing_started_at = NOW(),
+            dialog_id = %s,
+            pre_prompt_id = %s
+        WHERE id = %s AND claim_token = %s
+    """, (dialog_id, row.get("pre_prompt_id"), conv_id, row["claim_token"]))
+
+    system_prompt = pre_prompt_text
+    # Bei Cache-Prompts keine nutzerspezifischen Ausschnitte, sonst wären die Antworten nicht teilbar
+    if LONG_TERM_MEMORY and not cache_enabled and query_vector is not None:
+        # Langzeitgedächtnis: passende Runden aus anderen Dialogen des Nutzers
+        hits = vector_memory.search(user_id, prompt, MEMORY_TOP_K, exclude_dialog=dialog_id,
+                                    min_score=MEMORY_MIN_SCORE, vector=query_vector)
+        if hits:
+            logging.debug(f"🧠 {len(hits)} Ausschnitt(e) aus früheren Gesprächen eingefügt")
+            system_prompt = "\n\n".join(filter(None, [pre_prompt_text, format_snippets(hits)]))
+
+    history = build_chat_history(cursor, dialog_id, prompt, model, system_prompt)
+
+    key = None
+    cached_reply = None
+    semantic_vector = None
+    shadow_reply = None
+    if cache_enabled and is_cacheable(history):
+        key = cache_key(model, history, ollama_options(model))
+        cached_reply = response_cache.get(cursor, key)
+        if cached_reply is not None:
+            logging.info(f"⚡ Anfrage {conv_id}: Antwort aus dem Cache")
+        elif query_vector is not None:
+            # Exakter Treffer verfehlt – ähnlich formulierte Frage?
+            semantic_vector, hit = semantic_cache.lookup(model, row.get("pre_prompt_id"), pre_prompt_text,
+                                                         prompt, semantic_threshold, vector=query_vector)
+            if hit:
+                score, question, answer = hit
+                if semantic_cache.mode == "on":
+                    cached_reply = answer
+                    logging.info(f"🧲 Anfrage {conv_id}: ähnliche Frage '{question[:40]}' "
+                                 f"({score:.2f}) – Antwort aus dem semantischen Cache")
+                else:
+                    shadow_reply = answer
+
+    # Schlüssel für das Zusammenlegen identischer, gleichzeitig laufender Generierungen
+    generation_key = None
+    if COALESCE_REQUESTS and cached_reply is None and is_cacheable(history):
+        generation_key = key or cache_key(model, history, ollama_options(model))
+
+    logging.debug("💬 Zusammengesetzter Chatverlauf:")
+    for msg in history:
+        role = msg["role"]
+        snippet = msg["content"][:80].replace("\n", " ")
+        logging.debug(f"[{role}] {snippet}")
 
-    for prompt in prompts:
-        tag_words = [tag.strip().lower() for tag in prompt["tags"].split(",") if tag.strip()]
-        hits = sum(1 for word in user_words if word in tag_words)
-        if hits > max_hits:
-            max_hits = hits
-            best_id = prompt["id"]
+    return {
+        "id": conv_id,
+        "claim_token": row["claim_token"],
+        "model": model,
+        "messages": history,
+        "pre_prompt_id": row.get("pre_prompt_id"),
+        "dialog_id": dialog_id,
+        "user_id": user_id,
+        "user_message": prompt,
+        "cache_key": key,
+        "cache_ttl": cache_ttl,
+        "cached_reply": cached_reply,
+        "system_prompt": pre_prompt_text,
+        "semantic_vector": semantic_vector,
+        "semantic_ttl": cache_ttl or DEFAULT_CACHE_TTL,
+        "shadow_reply": shadow_reply,
+        "generation_key": generation_key,
+    }
 
-    return best_id
+# === Zwischenstand einer gestreamten Antwort speichern ===
+def save_partial_response(cursor, job, text):
+    cursor.execute("""
+        UPDATE conversations
+        SET model_response = %s,
+            response_updated_at = NOW(),
+            locked_at = NOW()
+        WHERE id = %s AND claim_token = %s AND message_status = 'progress'
+    """, (text, job["id"], job["claim_token"]))
+
+# === Antwort speichern und Bearbeitung protokollieren ===
+def finish_request(cursor, job, reply, duration):
+    conv_id = job["id"]
+    model = job["model"]
+    # Tokenzahlen einmal speichern – das Kontextbudget rechnet später nur noch damit
+    user_tokens = estimate_tokens(job["user_message"])
+    response_tokens = estimate_tokens(reply)
+    cursor.execute("""
+        UPDATE conversations
+        SET model_response = %s,
+            model_used = %s,
+            message_status = 'solved',
+            processing_finished_at = NOW(),
+            agent = %s,
+            user_tokens = %s,
+            response_tokens = %s
+        WHERE id = %s AND claim_token = %s
+    """, (reply, model, AGENT_NAME, user_tokens, response_tokens, conv_id, job["claim_token"]))
+    if cursor.rowcount == 0:
+        # Lease abgelaufen und Anfrage neu vergeben – Ergebnis verwerfen
+        logging.warning(f"⚠️ Lease für Anfrage {conv_id} verloren – Antwort wird verworfen.")
+        return False
+    job["turn_tokens"] = user_tokens + response_tokens  # für history_cache nach dem Commit
+    if job.get("cache_key") and job.get("cached_reply") is None and not job.get("coalesced") \
+            and reply != ERROR_REPLY:
+        response_cache.put(cursor, job["cache_key"], reply, model, job["pre_prompt_id"],
+                           job.get("cache_ttl") or DEFAULT_CACHE_TTL)
 
-# === Konversation aus DB laden ===
-def build_chat_history(cursor, dialog_id, new_prompt):
+    log_text = f"Model={model} | Prompt={job['pre_prompt_id']} | Dauer={duration:.1f}s"
     cursor.execute("""
-        SELECT user_message, model_response
-        FROM conversations
-        WHERE dialog_id = %s
-        AND message_status = 'solved'
-        ORDER BY timestamp ASC
-    """, (dialog_id,))
-    rows = cursor.fetchall()
+        INSERT INTO agent_log (conversation_id, agent_name, log_type, message, timestamp)
+        VALUES (%s, %s, 'assignment', %s, %s)
+    """, (conv_id, AGENT_NAME, log_text, datetime.now()))
 
-    history = []
-    for row in rows:
-        if row["user_message"]:
-            history.append({"role": "user", "content": row["user_message"]})
-        if row["model_response"]:
-            history.append({"role": "assistant", "content": row["model_response"]})
+    logging.info(f"✅ Anfrage {conv_id} abgeschlossen.")
+    return True
 
-    history.append({"role": "user", "content": new_prompt})
-    return history
+# === Anfrage nach Fehler endgültig als 'error' markieren ===
+def fail_request(cursor, conv_id, claim_token, reason):
+    """Sonst bleibt die Zeile bis zum Lease-Ablauf in 'progress', der Watchdog
+    setzt sie zurück und derselbe Fehler wiederholt sich endlos."""
+    cursor.execute("""
+        UPDATE conversations
+        SET message_status = 'error',
+            failure_reason = %s,
+            processing_finished_at = NOW(),
+            locked_by_agent = NULL,
+            locked_at = NULL
+        WHERE id = %s AND claim_token = %s AND message_status = 'progress'
+    """, (reason[:1000], conv_id, claim_token), prepared=True)
+    return cursor.rowcount == 1
+
+def mark_failed(row, error):
+    logging.error(f"Fehler bei der Verarbeitung von Anfrage {row['id']}: {error}")
+    try:
+        run_db(fail_request, row["id"], row["claim_token"], f"{type(error).__name__}: {error}")
+    except Exception as e:
+        logging.error(f"Anfrage {row['id']} konnte nicht als Fehler markiert werden: {e}")
+
+# === Gelöste Runde ins Langzeitgedächtnis und den semantischen Cache übernehmen ===
+embedder = HashEmbedder() if MEMORY_EMBEDDER == "hash" else OllamaEmbedder()
+vector_memory = VectorMemory(embedder)
+semantic_cache = SemanticCache(embedder, SEMANTIC_CACHE_MODE)
+
+def embed_question(text):
+    """Einbettung der Frage vor dem DB-Schritt – ein /api/embed-Aufruf soll keine
+    Pool-Verbindung festhalten. None, wenn nichts sie braucht oder sie scheitert."""
+    if not LONG_TERM_MEMORY and not semantic_cache.enabled:
+        return None
+    try:
+        return vector_memory.embed([text])[0]
+    except Exception as e:
+        logging.debug(f"Einbettung der Frage fehlgeschlagen: {e}")
+        return None
+
+def remember_turn(job, reply):
+    """Erst nach dem Commit von finish_request aufrufen – sonst hielten die Caches
+    eine Runde, die zurückgerollt wurde."""
+    history_cache.append(job["dialog_id"], job["id"], job["user_message"], reply, job["turn_tokens"])
+    if reply == ERROR_REPLY:
+        return
+    if LONG_TERM_MEMORY and job.get("user_id") is not None:
+        vector_memory.add(job["user_id"], job["id"], job["dialog_id"], job["user_message"], reply)
+    if job.get("semantic_vector") is not None and job.get("cached_reply") is None and not job.get("coalesced"):
+        if job.get("shadow_reply") is not None:
+            semantic_cache.record_drift(job["shadow_reply"], reply)
+        semantic_cache.store(job["model"], job["pre_prompt_id"], job["system_prompt"], job["user_message"],
+                             job["semantic_vector"], reply, job["semantic_ttl"])
+
+# === Einzelnen DB-Schritt mit Pool-Verbindung ausführen ===
+def run_db(func, *args):
+    with db_cursor() as cursor:
+        return func(cursor, *args)
+
+# === Generierung im Thread-Modus, identische Anfragen zusammengelegt ===
+single_flight = SingleFlight()
+
+def generate_reply(job):
+    key = job["generation_key"]
+    flight = None
+    if key:
+        flight, leader = single_flight.join(key, job)
+        if not leader:
+            job["coalesced"] = True
+            logging.info(f"🪢 Anfrage {job['id']} hängt sich an eine laufende identische Generierung.")
+            if flight.partial:
+                run_db(save_partial_response, job, flight.partial)
+            return flight.future.result()
+
+    reply = ERROR_REPLY
+    try:
+        model_switches.note(job["model"])
+        model_manager.begin(job["model"])
+        try:
+            if STREAM_RESPONSES:
+                def save_partial(text):
+                    run_db(save_partial_response, job, text)
+                    if flight:
+                        for follower in single_flight.partial(flight, text):
+                            run_db(save_partial_response, follower, text)
+
+                reply = query_ollama_stream(job["messages"], job["model"], save_partial)
+            else:
+                reply = query_ollama(job["messages"], job["model"])
+        finally:
+            model_manager.end(job["model"])
+        return reply
+    finally:
+        if flight:
+            single_flight.finish(flight, reply)
 
 # === Verarbeitung einzelner Anfrage in separatem Thread ===
-def handle_request(cfg, row):
+def handle_request(row):
+    # Verbindungen nur pro DB-Schritt ausleihen, nicht für die ganze Generierung
     try:
-        conn = mysql.connector.connect(**cfg)
-        cursor = conn.cursor(dictionary=True)
-
-        conv_id = row["id"]
-        prompt = row["user_message"]
-        user_id = row["user_id"]
-
-        logging.debug(f"🛠 Anfrage erhalten: ID={conv_id} | Text='{prompt}'")
-        logging.debug("🔍 Starte Tag-Matching auf pre-Prompts...")
-
-        if not row.get("pre_prompt_id"):
-            best_id = find_best_prompt_id_by_tags(cursor, prompt)
-            if best_id:
-                logging.debug(f"➤ Gewählt: Prompt ID {best_id}")
-                row["pre_prompt_id"] = best_id
-            else:
-                logging.debug("⚠️ Kein passender Pre-Prompt gefunden.")
-
-        model = row.get("model_used")
-        pre_prompt_text = None
-        prompt_name = None
-        if not model and row.get("pre_prompt_id"):
-            cursor.execute("SELECT model, content, name FROM prompts WHERE id = %s", (row["pre_prompt_id"],))
-            result = cursor.fetchone()
-            if result:
-                model = result.get("model") or model
-                pre_prompt_text = result.get("content")
-                prompt_name = result.get("name")
-                logging.debug(f"📦 Modellzuordnung: {model} durch Prompt {prompt_name}")
-                if pre_prompt_text:
-                    logging.debug(f"🧠 Pre-Prompt-Inhalt (Auszug): {pre_prompt_text[:80]}...")
-        if not model:
-            model = "stablelm2:1.6b"
-            logging.debug(f"📦 Kein Modell im Prompt definiert. Fallback: {model}")
-
-        # 🧩 Kompatibilitätsprüfung basierend auf Agent-Fähigkeit (inkl. RAM/VRAM)
-        if not is_model_supported_by_agent(cursor, AGENT_NAME, model):
-            logging.warning(f"⛔ Modell '{model}' ist nicht kompatibel mit Agent '{AGENT_NAME}' – Anfrage wird ignoriert.")
-            cursor.execute("""
-                UPDATE conversations
-                SET message_status = 'error', notes = 'Modell nicht kompatibel mit Agent'
-                WHERE id = %s
-            """, (conv_id,))
-            conn.commit()
+        job = run_db(prepare_request, row, embed_question(row["user_message"]))
+        if not job:
             return
 
-        prompt_info = f"Prompt-ID={row.get('pre_prompt_id') or '-'}"
-        if prompt_name:
-            prompt_info += f" ({prompt_name})"
-        logging.info(f"⛰ Bearbeite Anfrage {conv_id} mit Modell '{model}' | {prompt_info}")
-
-        dialog_id = get_or_create_dialog_id(cursor, user_id)
-
-        cursor.execute("""
-            UPDATE conversations
-            SET locked_by_agent = %s,
-                locked_at = NOW(),
-                processing_started_at = NOW(),
-                message_status = 'progress',
-                dialog_id = %s,
-                pre_prompt_id = %s
-            WHERE id = %s
-        """, (AGENT_NAME, dialog_id, row.get("pre_prompt_id"), conv_id))
-        conn.commit()
-
         start_time = datetime.now()
-        history = build_chat_history(cursor, dialog_id, prompt)
-        if pre_prompt_text:
-            history.insert(0, {"role": "system", "content": pre_prompt_text})
-
-        logging.debug("💬 Zusammengesetzter Chatverlauf:")
-        for msg in history:
-            role = msg["role"]
-            snippet = msg["content"][:80].replace("\n", " ")
-            logging.debug(f"[{role}] {snippet}")
-
-        reply = query_ollama(history, model)
+        if job["cached_reply"] is not None:
+            reply = job["cached_reply"]
+        else:
+            reply = generate_reply(job)
         duration = (datetime.now() - start_time).total_seconds()
 
-        cursor.execute("""
-            UPDATE conversations
-            SET model_response = %s,
-                model_used = %s,
-                message_status = 'solved',
-                processing_finished_at = NOW(),
-                agent = %s
-            WHERE id = %s
-        """, (reply, model, AGENT_NAME, conv_id))
-        conn.commit()
-
-        log_text = f"Model={model} | Prompt={row.get('pre_prompt_id')} | Dauer={duration:.1f}s"
-        cursor.execute("""
-            INSERT INTO agent_log (conversation_id, agent_name, log_type, message, timestamp)
-            VALUES (%s, %s, 'assignment', %s, %s)
-        """, (conv_id, AGENT_NAME, log_text, datetime.now()))
-        conn.commit()
-
-        logging.info(f"✅ Anfrage {conv_id} abgeschlossen.")
+        if run_db(finish_request, job, reply, duration):
+            notify_solved(bus, job["id"])
+            remember_turn(job, reply)
 
     except Exception as e:
-        logging.error(f"Fehler bei der Verarbeitung von Anfrage {row['id']}: {e}")
+        mark_failed(row, e)
     finally:
-        cursor.close()
-        conn.close()
-
-# === Verarbeitung neuer Einträge in Hauptloop ===
-def process_pending_requests(cfg):
-    conn = mysql.connector.connect(**cfg)
-    cursor = conn.cursor(dictionary=True)
-
-    log_agent_info(cursor)
-    conn.commit()
-
+        release_claim(row["id"])
+
+# === Offene Einträge für diesen Agent atomar beanspruchen ===
+active_claims = {}  # conversation_id: claim_token
+active_claims_lock = threading.Lock()
+model_switches = ModelSwitchCounter(AGENT_NAME)
+telemetry = TelemetrySampler(OLLAMA_BASE_URL)
+model_manager = ModelManager(AGENT_NAME, OLLAMA_BASE_URL, telemetry)
+heartbeat = HeartbeatWriter(AGENT_NAME, telemetry)
+bus = EventBus()
+poller = AdaptivePoller(MIN_CHECK_INTERVAL, fallback_interval(CHECK_INTERVAL, BUS_FALLBACK_INTERVAL))
+
+def on_queued(topic, data):
+    # Watchdog hat zugewiesen – nur wecken, wenn dieser Agent dabei ist
+    if AGENT_NAME in data.get("agents", [AGENT_NAME]):
+        poller.notify()
+
+def claim_requests(cursor, limit=1, slots=None):
+    """Beansprucht bis zu `limit` Anfragen in einem einzigen UPDATE. Nur Zeilen
+    ohne Sperre werden übernommen, parallele Agents/Threads können dieselbe
+    Zeile daher nicht doppelt erhalten. Die Lease läuft über locked_at und wird
+    vom Watchdog nach LEASE_TIMEOUT_SECONDS ohne Erneuerung zurückgesetzt.
+    slots (model: freie Plätze) begrenzt die Übernahme je Modell; Modelle ohne
+    Eintrag haben OLLAMA_NUM_PARALLEL Plätze."""
+    if SCHEDULING_MODE == "model" or slots is not None:
+        return claim_selected_requests(cursor, limit, slots)
+
+    token = uuid.uuid4().hex
     cursor.execute("""
-        SELECT * FROM conversations
+        UPDATE conversations
+        SET locked_by_agent = %s,
+            locked_at = NOW(),
+            claim_token = %s,
+            message_status = 'progress'
         WHERE message_status = 'queued'
         AND agent = %s
-        AND (locked_by_agent IS NULL OR locked_by_agent = %s)
+        AND locked_by_agent IS NULL
         ORDER BY timestamp ASC
-        LIMIT 1
-    """, (AGENT_NAME, AGENT_NAME))
+        LIMIT %s
+    """, (AGENT_NAME, token, AGENT_NAME, limit), prepared=True)
+    claimed = cursor.rowcount
+    # Vorladen richtet sich nach dem, was danach noch wartet – auch im FIFO-Modus
+    model_manager.set_upcoming([row["model"] for row in load_queued_candidates(cursor)])
+    if claimed == 0:
+        return []
+    return load_claimed_rows(cursor, token)
+
+def load_queued_candidates(cursor):
+    """Wartende, noch nicht beanspruchte Zeilen dieses Agents mit ihrem Modell."""
+    cursor.execute("""
+        SELECT c.id, c.timestamp, COALESCE(c.model_used, p.model) AS model
+        FROM conversations c
+        LEFT JOIN prompts p ON p.id = c.pre_prompt_id
+        WHERE c.message_status = 'queued'
+        AND c.agent = %s
+        AND c.locked_by_agent IS NULL
+        ORDER BY c.timestamp ASC
+        LIMIT %s
+    """, (AGENT_NAME, SCHEDULER_LOOKAHEAD), prepared=True)
+    candidates = cursor.fetchall()
+    for row in candidates:
+        row["model"] = row["model"] or DEFAULT_MODEL
+    return candidates
+
+def claim_selected_requests(cursor, limit, slots=None):
+    """Wie claim_requests, wählt die Zeilen aber vorab aus: im Modus "model" so,
+    dass aufeinanderfolgende Generierungen möglichst dasselbe Modell nutzen (siehe
+    model_scheduler), und nie mehr je Modell, als gerade Plätze frei sind – der
+    Rest bliebe sonst in 'progress' liegen, statt von anderen Agents bedient zu werden."""
+    candidates = load_queued_candidates(cursor)
+    if not candidates:
+        # Warteschlange leer: nichts mehr vorladen
+        model_manager.set_upcoming([])
+        return []
+
+    if SCHEDULING_MODE == "model":
+        ordered = order_by_model(candidates, warm_models={model_switches.current_model})
+    else:
+        ordered = candidates
+    model_manager.set_upcoming([row["model"] for row in ordered])
+    if slots is not None:
+        taken = Counter()
+        fitting = []
+        for row in ordered:
+            if taken[row["model"]] < slots.get(row["model"], OLLAMA_NUM_PARALLEL):
+                taken[row["model"]] += 1
+                fitting.append(row)
+        ordered = fitting
+    ordered = ordered[:limit]
+    if not ordered:
+        return []
+    ids = [row["id"] for row in ordered]
+    token = uuid.uuid4().hex
+    placeholders = ", ".join(["%s"] * len(ids))
+    cursor.execute(f"""
+        UPDATE conversations
+        SET locked_by_agent = %s,
+            locked_at = NOW(),
+            claim_token = %s,
+            message_status = 'progress'
+        WHERE id IN ({placeholders})
+        AND message_status = 'queued'
+        AND locked_by_agent IS NULL
+    """, (AGENT_NAME, token, *ids))
+    if cursor.rowcount == 0:
+        return []
+
+    position = {conv_id: i for i, conv_id in enumerate(ids)}
+    models = {row["id"]: row["model"] for row in ordered}
+    rows = sorted(load_claimed_rows(cursor, token), key=lambda row: position[row["id"]])
+    for row in rows:
+        row["scheduled_model"] = models[row["id"]]  # für die Platzbuchhaltung der Runtime
+    return rows
 
-    row = cursor.fetchone()
+def load_claimed_rows(cursor, token):
+    cursor.execute("""
+        SELECT * FROM conversations
+        WHERE claim_token = %s
+        ORDER BY timestamp ASC
+    """, (token,), prepared=True)
+    rows = cursor.fetchall()
+    with active_claims_lock:
+        for row in rows:
+            active_claims[row["id"]] = token
+    return rows
+
+def release_claim(conv_id):
+    with active_claims_lock:
+        active_claims.pop(conv_id, None)
+
+def renew_leases(cursor):
+    with active_claims_lock:
+        tokens = sorted(set(active_claims.values()))
+    if not tokens:
+        return
+    placeholders = ", ".join(["%s"] * len(tokens))
+    cursor.execute(f"""
+        UPDATE conversations
+        SET locked_at = NOW()
+        WHERE claim_token IN ({placeholders}) AND message_status = 'progress'
+    """, tokens)
+
+# === Verarbeitung neuer Einträge in Hauptloop ===
+def process_pending_requests():
+    # agent_status schreibt der Heartbeat im status_updater-Thread
+    with db_cursor() as cursor:
+        rows = claim_requests(cursor)
 
-    if row:
-        thread = threading.Thread(target=handle_request, args=(cfg, row), daemon=True)
+    if rows:
+        thread = threading.Thread(target=handle_request, args=(rows[0],), daemon=True)
         thread.start()
     else:
         logging.debug("Keine offenen Anfragen für diesen Agent.")
+    return bool(rows)
 
-    cursor.close()
-    conn.close()
+# === Modelloptionen: gehen in jeden Request und in jeden Cache-Schlüssel ===
+def ollama_options(model) -> dict:
+    # Ohne num_ctx schneidet Ollama bei 2048/4096 Tokens ab, egal was das Budget erlaubt
+    return {"num_ctx": context_manager.num_ctx(model)}
 
 # === Anfrage an Ollama senden ===
 def query_ollama(messages: list, model: str) -> str:
     payload = {
         "model": model,
         "messages": messages,
-        "stream": False
+        "stream": False,
+        "keep_alive": model_manager.keep_alive_param(model),
+        "options": ollama_options(model)
     }
     try:
         response = requests.post(OLLAMA_URL, json=payload, timeout=300)
@@ -323,7 +548,96 @@ def query_ollama(messages: list, model: str) -> str:
         logging.error("Fehlerhafte Antwort von Ollama: %s", response.text)
     except Exception as e:
         logging.exception("Fehler bei Anfrage an Ollama: %s", e)
-    return "❌ Fehler bei der Modellanfrage."
+    return ERROR_REPLY
+
+# === Anfrage an Ollama im Streaming-Modus ===
+def query_ollama_stream(messages: list, model: str, on_partial) -> str:
+    """Liest die NDJSON-Antwort von /api/chat und meldet Zwischenstände
+    höchstens alle STREAM_FLUSH_INTERVAL Sekunden über on_partial()."""
+    payload = {
+        "model": model,
+        "messages": messages,
+        "stream": True,
+        "keep_alive": model_manager.keep_alive_param(model),
+        "options": ollama_options(model)
+    }
+    parts = []
+    last_flush = None
+    try:
+        with requests.post(OLLAMA_URL, json=payload, stream=True, timeout=300) as response:
+            if not response.ok:
+                logging.error("Fehlerhafte Antwort von Ollama: %s", response.text)
+                return ERROR_REPLY
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    logging.error("Fehler im Ollama-Stream: %s", chunk["error"])
+                    return ERROR_REPLY
+                token = chunk.get("message", {}).get("content", "")
+                if token:
+                    parts.append(token)
+                if chunk.get("done"):
+                    break
+                # Erste Tokens sofort, danach gedrosselt in die DB schreiben
+                now = time.monotonic()
+                if parts and (last_flush is None or now - last_flush >= STREAM_FLUSH_INTERVAL):
+                    try:
+                        on_partial("".join(parts))
+                    except Exception as e:
+                        logging.warning(f"Zwischenstand konnte nicht gespeichert werden: {e}")
+                    last_flush = now
+        return "".join(parts)
+    except Exception as e:
+        logging.exception("Fehler bei Streaming-Anfrage an Ollama: %s", e)
+    return ERROR_REPLY
+
+# === Anfrage an Ollama über den gemeinsamen HTTP-Client (asyncio) ===
+async def query_ollama_async(session, messages: list, model: str, on_partial=None) -> str:
+    """Wie query_ollama/query_ollama_stream, aber nicht-blockierend über eine
+    geteilte aiohttp-Session. on_partial ist eine Coroutine-Funktion."""
+    payload = {
+        "model": model,
+        "messages": messages,
+        "stream": on_partial is not None,
+        "keep_alive": model_manager.keep_alive_param(model),
+        "options": ollama_options(model)
+    }
+    try:
+        async with session.post(OLLAMA_URL, json=payload) as response:
+            if response.status != 200:
+                logging.error("Fehlerhafte Antwort von Ollama: %s", await response.text())
+                return ERROR_REPLY
+            if on_partial is None:
+                data = await response.json()
+                return data.get("message", {}).get("content", "")
+
+            parts = []
+            last_flush = None
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    logging.error("Fehler im Ollama-Stream: %s", chunk["error"])
+                    return ERROR_REPLY
+                token = chunk.get("message", {}).get("content", "")
+                if token:
+                    parts.append(token)
+                if chunk.get("done"):
+                    break
+                now = time.monotonic()
+                if parts and (last_flush is None or now - last_flush >= STREAM_FLUSH_INTERVAL):
+                    try:
+                        await on_partial("".join(parts))
+                    except Exception as e:
+                        logging.warning(f"Zwischenstand konnte nicht gespeichert werden: {e}")
+                    last_flush = now
+            return "".join(parts)
+    except Exception as e:
+        logging.exception("Fehler bei Anfrage an Ollama: %s", e)
+    return ERROR_REPLY
 
 # === Dialog-ID bestimmen oder neu erzeugen ===
 def get_or_create_dialog_id(cursor, user_id):
@@ -362,34 +676,190 @@ def is_model_supported_by_agent(cursor, agent_name: str, model_name: str) -> boo
     return True
 
 # === Hauptfunktion ===
-def status_updater(cfg):
+def status_updater():
+    last_renewal = 0.0
+    last_beat = 0.0
+    # Mit Registry laufen die Heartbeats per UDP, die DB bekommt nur selten ein Update
+    beat_interval = REGISTRY_DB_HEARTBEAT_INTERVAL if REGISTRY_ADDRESS else 0
     while True:
         try:
-            conn = mysql.connector.connect(**cfg)
-            cursor = conn.cursor(dictionary=True)
-            log_agent_info(cursor)
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with db_cursor() as cursor:
+                # agent_status: last_seen-Touch, volle Zeile nur bei Änderungen
+                if time.monotonic() - last_beat >= beat_interval:
+                    heartbeat.beat(cursor)
+                    last_beat = time.monotonic()
+                if time.monotonic() - last_renewal >= LEASE_RENEW_INTERVAL:
+                    renew_leases(cursor)
+                    last_renewal = time.monotonic()
         except Exception as e:
             logging.error(f"Fehler beim Status-Update: {e}")
         time.sleep(3)
 
+# === Asyncio-Laufzeit: gemeinsamer HTTP-Client, Slots pro Modell ===
+class AgentRuntime:
+    """Hält bis zu MAX_CONCURRENT_REQUESTS Anfragen gleichzeitig in Arbeit.
+    Pro Modell begrenzt ein Semaphor die Generierungen auf OLLAMA_NUM_PARALLEL,
+    DB-Zugriffe laufen in Worker-Threads, damit die Eventloop frei bleibt."""
+
+    def __init__(self):
+        self.session = None
+        self.semaphores = {}  # model: asyncio.Semaphore
+        self.tasks = {}  # conversation_id: asyncio.Task
+        self.busy = Counter()  # model: beanspruchte, noch nicht fertige Anfragen
+        self.wake = None  # asyncio.Event, von Events aus dem Bus-Thread gesetzt
+
+    async def db(self, func, *args):
+        return await asyncio.to_thread(run_db, func, *args)
+
+    def model_semaphore(self, model):
+        if model not in self.semaphores:
+            self.semaphores[model] = asyncio.Semaphore(OLLAMA_NUM_PARALLEL)
+        return self.semaphores[model]
+
+    async def generate(self, job):
+        """Generierung mit Zusammenlegung identischer Anfragen (wie generate_reply)."""
+        key = job["generation_key"]
+        flight = None
+        if key:
+            flight, leader = single_flight.join(key, job)
+            if not leader:
+                job["coalesced"] = True
+                logging.info(f"🪢 Anfrage {job['id']} hängt sich an eine laufende identische Generierung.")
+                if flight.partial:
+                    await self.db(save_partial_response, job, flight.partial)
+                return await asyncio.wrap_future(flight.future)
+
+        async def save_partial(text):
+            await self.db(save_partial_response, job, text)
+            if flight:
+                for follower in single_flight.partial(flight, text):
+                    await self.db(save_partial_response, follower, text)
+
+        reply = ERROR_REPLY
+        try:
+            async with self.model_semaphore(job["model"]):
+                model_switches.note(job["model"])
+                model_manager.begin(job["model"])
+                try:
+                    reply = await query_ollama_async(self.session, job["messages"], job["model"],
+                                                     save_partial if STREAM_RESPONSES else None)
+                finally:
+                    model_manager.end(job["model"])
+            return reply
+        finally:
+            if flight:
+                single_flight.finish(flight, reply)
+
+    async def process(self, row):
+        conv_id = row["id"]
+        try:
+            query_vector = await asyncio.to_thread(embed_question, row["user_message"])
+            job = await self.db(prepare_request, row, query_vector)
+            if not job:
+                return
+
+            if job["cached_reply"] is not None:
+                # Cache-Treffer: kein Modell-Slot, keine Generierung
+                reply, duration = job["cached_reply"], 0.0
+            else:
+                start_time = datetime.now()
+                reply = await self.generate(job)
+                duration = (datetime.now() - start_time).total_seconds()
+
+            if await self.db(finish_request, job, reply, duration):
+                await asyncio.to_thread(notify_solved, bus, conv_id)
+                await asyncio.to_thread(remember_turn, job, reply)
+        except Exception as e:
+            await asyncio.to_thread(mark_failed, row, e)
+        finally:
+            release_claim(conv_id)
+
+    def finished(self, row):
+        self.tasks.pop(row["id"], None)
+        model = row["scheduled_model"]
+        self.busy[model] -= 1
+        if self.busy[model] <= 0:
+            del self.busy[model]
+
+    async def claim_loop(self):
+        while True:
+            free = MAX_CONCURRENT_REQUESTS - len(self.tasks)
+            if free <= 0:
+                # Alle Slots belegt – auf das nächste fertige Ergebnis warten
+                await asyncio.wait(list(self.tasks.values()), return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            # Nur so viele Zeilen je Modell, wie es Plätze gibt (OLLAMA_NUM_PARALLEL)
+            slots = {model: OLLAMA_NUM_PARALLEL - count for model, count in self.busy.items()}
+            try:
+                rows = await self.db(claim_requests, free, slots)
+            except Exception as e:
+                logging.error("Fehler beim Beanspruchen offener Anfragen: %s", e)
+                await asyncio.sleep(5)
+                continue
+
+            for row in rows:
+                task = asyncio.create_task(self.process(row))
+                self.tasks[row["id"]] = task
+                self.busy[row["scheduled_model"]] += 1
+                task.add_done_callback(lambda _, row=row: self.finished(row))
+
+            interval = poller.record(rows)
+            if not rows:
+                logging.debug("Keine offenen Anfragen für diesen Agent.")
+                # Event vom Watchdog oder ein frei werdender Slot beenden die Wartezeit vorzeitig
+                self.wake.clear()
+                waker = asyncio.create_task(self.wake.wait())
+                await asyncio.wait([waker, *self.tasks.values()], timeout=interval,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                waker.cancel()
+
+    async def run(self):
+        # Kein Gesamtlimit: lange Streams sind normal, abgebrochen wird nur bei 300 s ohne Daten
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=300)
+        connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_REQUESTS)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            self.session = session
+            self.wake = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            poller.listeners.append(lambda: loop.call_soon_threadsafe(self.wake.set))
+            await self.claim_loop()
+
 # In main():
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ollama Agent")
+    parser.add_argument("--threads", action="store_true",
+                        help="Alter Modus: eine Anfrage pro Zyklus in eigenem Thread")
+    args = parser.parse_args()
+
     logging.info(f"Starte Agent: {AGENT_NAME}")
-    cfg = load_db_config()
-    
-    # Hintergrundthread für Statusupdates
-    threading.Thread(target=status_updater, args=(cfg,), daemon=True).start()
+    # Laufende Generierungen + Statusthread + Reserve
+    init_pool(MAX_CONCURRENT_REQUESTS + 2)
     
-    while True:
+    # Hintergrundthreads für Telemetrie und Statusupdates
+    telemetry.start()
+    threading.Thread(target=status_updater, daemon=True).start()
+    if REGISTRY_ADDRESS:
+        sender = HeartbeatSender(AGENT_NAME, telemetry, REGISTRY_ADDRESS,
+                                 free_slots=lambda: MAX_CONCURRENT_REQUESTS - len(active_claims))
+        threading.Thread(target=sender.run_forever, daemon=True).start()
+    if PRELOAD_MODELS:
+        threading.Thread(target=model_manager.run_forever, daemon=True).start()
+    bus.subscribe([CONVERSATION_QUEUED], on_queued)
+
+    if not args.threads:
         try:
-            process_pending_requests(cfg)
-            time.sleep(CHECK_INTERVAL)
+            asyncio.run(AgentRuntime().run())
         except KeyboardInterrupt:
             logging.warning("Agent wurde manuell beendet.")
-            break
-        except Exception as e:
-            logging.error("Fehler in Hauptschleife: %s", e)
-            time.sleep(5)
\ No newline at end of file
+    else:
+        while True:
+            try:
+                poller.record(process_pending_requests())
+                poller.wait()
+            except KeyboardInterrupt:
+                logging.warning("Agent wurde manuell beendet.")
+                break
+            except Exception as e:
+                logging.error("Fehler in Hauptschleife: %s", e)
+                time.sleep(5)
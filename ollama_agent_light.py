@@ -5,49 +5,32 @@ import os
 import time
 import logging
 import socket
-import subprocess
-import mysql.connector
 import requests
 import uuid
-from configparser import ConfigParser
 from datetime import datetime, timedelta
 import threading
+from db_access import db_cursor
+from prompt_index import tag_index
+from context_manager import DEFAULT_CONTEXT_TOKENS
+from telemetry import TelemetrySampler
+from heartbeat import HeartbeatWriter
+from agent_registry import REGISTRY_ADDRESS, HeartbeatSender
+from event_bus import EventBus, notify_solved
 
 # === Konfiguration ===
-ACCESS_FILE = "private/.mariadb_access"
-OLLAMA_URL = "http://localhost:11434/api/chat"
+OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_URL = f"{OLLAMA_BASE_URL}/api/chat"
 AGENT_NAME = socket.gethostname()
 CHECK_INTERVAL = 3  # Sekunden
+LEASE_RENEW_INTERVAL = 30  # Sekunden (Timeout siehe LEASE_TIMEOUT_SECONDS im Watchdog)
 
 # === Logging ===
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
-# === DB-Konfiguration laden ===
-def load_db_config():
-    config = ConfigParser()
-    config.read(ACCESS_FILE)
-    client = config["client"]
-    return {
-        "host": client.get("host", "127.0.0.1"),
-        "port": int(client.get("port", 3306)),
-        "user": client.get("user"),
-        "password": client.get("password"),
-        "database": client.get("database")
-    }
-
 def find_best_prompt_id_by_tags(cursor, user_text):
-    cursor.execute("SELECT id, tags FROM prompts WHERE is_active = 1 AND role = 'pre' AND tags IS NOT NULL")
-    prompts = cursor.fetchall()
-    user_words = [w.strip(",.!?").lower() for w in user_text.split()]
-    max_hits = 0
-    best_id = None
-    for prompt in prompts:
-        tag_words = [tag.strip().lower() for tag in prompt["tags"].split(",") if tag.strip()]
-        hits = sum(1 for word in user_words if word in tag_words)
-        if hits > max_hits:
-            max_hits = hits
-            best_id = prompt["id"]
-    return best_id
+    # Index wird nur bei geänderten pre-Prompts neu aus der DB geladen
+    tag_index.refresh(cursor)
+    return tag_index.best_prompt_id(user_text)
 
 def build_chat_history(cursor, dialog_id, new_prompt):
     cursor.execute("""
@@ -65,11 +48,12 @@ def build_chat_history(cursor, dialog_id, new_prompt):
     history.append({"role": "user", "content": new_prompt})
     return history
 
-def query_ollama(messages: list, model: str) -> str:
+def query_ollama(messages: list, model: str, num_ctx: int = DEFAULT_CONTEXT_TOKENS) -> str:
     payload = {
         "model": model,
         "messages": messages,
-        "stream": False
+        "stream": False,
+        "options": {"num_ctx": num_ctx}
     }
     try:
         response = requests.post(OLLAMA_URL, json=payload, timeout=300)
@@ -109,78 +93,135 @@ def is_model_supported_by_agent(cursor, agent_name: str, model_name: str) -> boo
         return False
     return True
 
-def handle_request(cfg, row):
-    try:
-        conn = mysql.connector.connect(**cfg)
-        cursor = conn.cursor(dictionary=True)
-        conv_id = row["id"]
-        prompt = row["user_message"]
-        user_id = row["user_id"]
-        if not row.get("pre_prompt_id"):
-            row["pre_prompt_id"] = find_best_prompt_id_by_tags(cursor, prompt)
-        model = row.get("model_used")
-        if not model and row.get("pre_prompt_id"):
-            cursor.execute("SELECT model FROM prompts WHERE id = %s", (row["pre_prompt_id"],))
-            result = cursor.fetchone()
-            if result:
-                model = result.get("model") or model
-        if not model:
-            model = "stablelm2:1.6b"
-        if not is_model_supported_by_agent(cursor, AGENT_NAME, model):
-            cursor.execute("""
-                UPDATE conversations SET message_status = 'error', notes = 'Modell nicht kompatibel mit Agent'
-                WHERE id = %s
-            """, (conv_id,))
-            conn.commit()
-            return
-        dialog_id = get_or_create_dialog_id(cursor, user_id)
-        cursor.execute("""
-            UPDATE conversations SET locked_by_agent = %s, locked_at = NOW(),
-            processing_started_at = NOW(), message_status = 'progress',
-            dialog_id = %s, pre_prompt_id = %s WHERE id = %s
-        """, (AGENT_NAME, dialog_id, row.get("pre_prompt_id"), conv_id))
-        conn.commit()
-        history = build_chat_history(cursor, dialog_id, prompt)
-        cursor.execute("SELECT content FROM prompts WHERE id = %s", (row.get("pre_prompt_id"),))
+def prepare_request(cursor, row):
+    conv_id = row["id"]
+    prompt = row["user_message"]
+    user_id = row["user_id"]
+    if not row.get("pre_prompt_id"):
+        row["pre_prompt_id"] = find_best_prompt_id_by_tags(cursor, prompt)
+    model = row.get("model_used")
+    if not model and row.get("pre_prompt_id"):
+        cursor.execute("SELECT model FROM prompts WHERE id = %s", (row["pre_prompt_id"],))
         result = cursor.fetchone()
         if result:
-            history.insert(0, {"role": "system", "content": result.get("content")})
-        reply = query_ollama(history, model)
+            model = result.get("model") or model
+    if not model:
+        model = "stablelm2:1.6b"
+    if not is_model_supported_by_agent(cursor, AGENT_NAME, model):
         cursor.execute("""
-            UPDATE conversations SET model_response = %s, model_used = %s,
-            message_status = 'solved', processing_finished_at = NOW(), agent = %s
+            UPDATE conversations SET message_status = 'error', failure_reason = 'Modell nicht kompatibel mit Agent'
             WHERE id = %s
-        """, (reply, model, AGENT_NAME, conv_id))
-        conn.commit()
+        """, (conv_id,))
+        return None, None, None
+    cursor.execute("SELECT context_tokens FROM model_catalog WHERE model_name = %s", (model,))
+    catalog = cursor.fetchone()
+    num_ctx = (catalog or {}).get("context_tokens") or DEFAULT_CONTEXT_TOKENS
+    dialog_id = get_or_create_dialog_id(cursor, user_id)
+    cursor.execute("""
+        UPDATE conversations SET processing_started_at = NOW(),
+        dialog_id = %s, pre_prompt_id = %s WHERE id = %s AND claim_token = %s
+    """, (dialog_id, row.get("pre_prompt_id"), conv_id, row["claim_token"]))
+    history = build_chat_history(cursor, dialog_id, prompt)
+    cursor.execute("SELECT content FROM prompts WHERE id = %s", (row.get("pre_prompt_id"),))
+    result = cursor.fetchone()
+    if result:
+        history.insert(0, {"role": "system", "content": result.get("content")})
+    return model, history, num_ctx
+
+def handle_request(row):
+    try:
+        with db_cursor() as cursor:
+            model, history, num_ctx = prepare_request(cursor, row)
+        if not model:
+            return
+        reply = query_ollama(history, model, num_ctx)
+        with db_cursor() as cursor:
+            cursor.execute("""
+                UPDATE conversations SET model_response = %s, model_used = %s,
+                message_status = 'solved', processing_finished_at = NOW(), agent = %s
+                WHERE id = %s AND claim_token = %s
+            """, (reply, model, AGENT_NAME, row["id"], row["claim_token"]))
+            solved = cursor.rowcount == 1
+        if solved:
+            # Nach dem Commit, sonst findet der Connector die Antwort noch nicht
+            notify_solved(bus, row["id"])
     except Exception as e:
         logging.error(f"Fehler bei der Verarbeitung von Anfrage {row['id']}: {e}")
+        # Endgültig als Fehler markieren – sonst setzt der Watchdog die Zeile nach Lease-Ablauf zurück
+        try:
+            with db_cursor() as cursor:
+                cursor.execute("""
+                    UPDATE conversations SET message_status = 'error', failure_reason = %s,
+                    processing_finished_at = NOW(), locked_by_agent = NULL, locked_at = NULL
+                    WHERE id = %s AND claim_token = %s AND message_status = 'progress'
+                """, (f"{type(e).__name__}: {e}"[:1000], row["id"], row["claim_token"]))
+        except Exception as db_error:
+            logging.error(f"Anfrage {row['id']} konnte nicht als Fehler markiert werden: {db_error}")
     finally:
-        cursor.close()
-        conn.close()
+        with active_claims_lock:
+            active_claims.discard(row["claim_token"])
 
-def process_pending_requests(cfg):
-    conn = mysql.connector.connect(**cfg)
-    cursor = conn.cursor(dictionary=True)
+telemetry = TelemetrySampler(OLLAMA_BASE_URL)
+heartbeat = HeartbeatWriter(AGENT_NAME, telemetry)
+bus = EventBus()
+
+active_claims = set()  # claim_tokens laufender Anfragen
+active_claims_lock = threading.Lock()
+
+def claim_request(cursor):
+    # Atomare Übernahme: nur ungesperrte Zeilen, Lease über locked_at (siehe Watchdog)
+    token = uuid.uuid4().hex
     cursor.execute("""
-        SELECT * FROM conversations
-        WHERE message_status = 'queued'
-        AND agent = %s
-        AND (locked_by_agent IS NULL OR locked_by_agent = %s)
+        UPDATE conversations SET locked_by_agent = %s, locked_at = NOW(),
+        claim_token = %s, message_status = 'progress'
+        WHERE message_status = 'queued' AND agent = %s AND locked_by_agent IS NULL
         ORDER BY timestamp ASC LIMIT 1
-    """, (AGENT_NAME, AGENT_NAME))
+    """, (AGENT_NAME, token, AGENT_NAME))
+    if cursor.rowcount == 0:
+        return None
+    cursor.execute("SELECT * FROM conversations WHERE claim_token = %s", (token,))
     row = cursor.fetchone()
     if row:
-        thread = threading.Thread(target=handle_request, args=(cfg, row), daemon=True)
+        with active_claims_lock:
+            active_claims.add(token)
+    return row
+
+def lease_renewer():
+    while True:
+        time.sleep(LEASE_RENEW_INTERVAL)
+        with active_claims_lock:
+            tokens = list(active_claims)
+        if not tokens:
+            continue
+        try:
+            with db_cursor() as cursor:
+                placeholders = ", ".join(["%s"] * len(tokens))
+                cursor.execute(f"""
+                    UPDATE conversations SET locked_at = NOW()
+                    WHERE claim_token IN ({placeholders}) AND message_status = 'progress'
+                """, tokens)
+        except Exception as e:
+            logging.error(f"Fehler bei der Lease-Erneuerung: {e}")
+
+def process_pending_requests():
+    with db_cursor() as cursor:
+        row = claim_request(cursor)
+    if row:
+        thread = threading.Thread(target=handle_request, args=(row,), daemon=True)
         thread.start()
-    cursor.close()
-    conn.close()
 
 if __name__ == "__main__":
     logging.info(f"Starte Agent Light: {AGENT_NAME}")
-    cfg = load_db_config()
+    threading.Thread(target=lease_renewer, daemon=True).start()
+    telemetry.start()
+    if REGISTRY_ADDRESS:
+        sender = HeartbeatSender(AGENT_NAME, telemetry, REGISTRY_ADDRESS)
+        threading.Thread(target=sender.run_forever, daemon=True).start()
+    else:
+        threading.Thread(target=heartbeat.run_forever, daemon=True).start()
     while True:
         try:
-            process_pending_requests(cfg)
+            process_pending_requests()
             time.sleep(CHECK_INTERVAL)
         except KeyboardInterrupt:
             logging.warning("Agent wurde manuell beendet.")
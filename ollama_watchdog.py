@@ -1,45 +1,44 @@
 #!/usr/bin/env python3
 # Filename: ollama_watchdog.py
-import mysql.connector
 import logging
-from configparser import ConfigParser
+from collections import Counter
 from datetime import datetime
-import time
+from db_access import db_cursor
+from prompt_scoring import scorer_for
+from agent_assignment import AssignmentEngine, load_dialog_agents, loaded_models
+from model_scheduler import order_by_model
+from response_cache import normalize_text
+from agent_registry import USE_AGENT_REGISTRY, AgentRegistry
+from event_bus import (CONVERSATION_NEW, CONVERSATION_QUEUED, AdaptivePoller, EventBroker, EventBus,
+                       fallback_interval)
 
 # === Konfiguration ===
-ACCESS_FILE = "private/.mariadb_access"
 LOGLEVEL = logging.INFO
 INTERVAL_SECONDS = 10  # Zeit zwischen den Zyklen
+LEASE_TIMEOUT_SECONDS = 120  # Anfragen ohne Lease-Erneuerung gelten als verwaist
+AGENT_STALE_SECONDS = 10  # ohne Heartbeat danach nicht mehr verfügbar
+RUN_EVENT_BROKER = False  # Event-Broker im Watchdog-Prozess starten (EVENT_BUS in allen Komponenten setzen)
+MIN_POLL_SECONDS = 1  # solange Arbeit da ist, so oft prüfen; sonst Backoff bis INTERVAL_SECONDS
+BUS_FALLBACK_SECONDS = 30  # Sicherheits-Polling, wenn Events wecken
 
 logging.basicConfig(level=LOGLEVEL, format="%(asctime)s [%(levelname)s] %(message)s")
 
 # === DB-Zugriff ===
-def load_db_config():
-    config = ConfigParser()
-    config.read(ACCESS_FILE)
-    client = config["client"]
-    return {
-        "host": client.get("host", "127.0.0.1"),
-        "port": int(client.get("port", 3306)),
-        "user": client.get("user"),
-        "password": client.get("password"),
-        "database": client.get("database")
-    }
-
 def load_open_requests(cursor):
     cursor.execute("""
         SELECT * FROM conversations
         WHERE message_status = 'new' AND agent IS NULL
         ORDER BY timestamp ASC
-    """)
+    """, prepared=True)
     return cursor.fetchall()
 
 def get_available_agents(cursor):
+    # last_seen zusätzlich prüfen: zwischen zwei Zyklen können Minuten liegen
     cursor.execute("""
         SELECT * FROM agent_status
-        WHERE is_available = TRUE
+        WHERE is_available = TRUE AND last_seen >= NOW() - INTERVAL %s SECOND
         ORDER BY cpu_load_percent ASC, mem_used_percent ASC
-    """)
+    """, (AGENT_STALE_SECONDS,), prepared=True)
     return cursor.fetchall()
 
 def get_all_pre_prompts(cursor):
@@ -52,6 +51,10 @@ def get_model_catalog(cursor):
 
 # === Zustandscache ===
 prev_inactive_count = -1
+affinity_totals = Counter()  # Dialog-Affinität über alle Zyklen
+registry = None  # AgentRegistry, wenn AGENT_REGISTRY gesetzt ist (USE_AGENT_REGISTRY)
+bus = EventBus()
+poller = AdaptivePoller(MIN_POLL_SECONDS, fallback_interval(INTERVAL_SECONDS, BUS_FALLBACK_SECONDS))
 
 def update_agent_availability(cursor):
     global prev_inactive_count
@@ -59,31 +62,35 @@ def update_agent_availability(cursor):
     cursor.execute("""
         UPDATE agent_status
         SET is_available = FALSE
-        WHERE last_seen < NOW() - INTERVAL 10 SECOND
-    """)
+        WHERE last_seen < NOW() - INTERVAL %s SECOND
+    """, (AGENT_STALE_SECONDS,))
 
     cursor.execute("""
         SELECT COUNT(*) AS cnt FROM agent_status
-        WHERE is_available = FALSE AND last_seen < NOW() - INTERVAL 10 SECOND
-    """)
+        WHERE is_available = FALSE AND last_seen < NOW() - INTERVAL %s SECOND
+    """, (AGENT_STALE_SECONDS,))
     stale = cursor.fetchone()
 
     if stale and stale["cnt"] != prev_inactive_count:
-        logging.warning(f"⚠️ {stale['cnt']} Agent(s) als inaktiv markiert (last_seen > 10s).")
+        logging.warning(f"⚠️ {stale['cnt']} Agent(s) als inaktiv markiert (last_seen > {AGENT_STALE_SECONDS}s).")
         prev_inactive_count = stale["cnt"]
 
-def score_prompt(prompt, message):
-    score = 0
-    keywords = prompt.get("tags", "")
-    prompt_text = prompt.get("content", "")
-    if keywords:
-        for word in keywords.split(","):
-            if word.strip().lower() in message.lower():
-                score += 3
-    for word in prompt_text.split():
-        if word.strip().lower() in message.lower():
-            score += 1
-    return score
+def release_expired_leases(cursor):
+    """Setzt Anfragen zurück, deren Agent die Lease nicht mehr erneuert
+    (z. B. nach Absturz), damit sie neu verteilt werden."""
+    cursor.execute("""
+        UPDATE conversations
+        SET message_status = 'new',
+            agent = NULL,
+            locked_by_agent = NULL,
+            locked_at = NULL,
+            claim_token = NULL,
+            model_response = NULL
+        WHERE message_status = 'progress'
+        AND locked_at < NOW() - INTERVAL %s SECOND
+    """, (LEASE_TIMEOUT_SECONDS,))
+    if cursor.rowcount:
+        logging.warning(f"♻️ {cursor.rowcount} Anfrage(n) mit abgelaufener Lease zurückgesetzt.")
 
 def assign_request(cursor, request_id, agent_name, pre_prompt_id):
     cursor.execute("""
@@ -92,69 +99,33 @@ def assign_request(cursor, request_id, agent_name, pre_prompt_id):
         WHERE id = %s
     """, (agent_name, pre_prompt_id, request_id))
 
-def is_agent_suitable(agent, model):
-    try:
-        agent_model_active = agent.get("model_active", "").strip()
-        model_name = model.get("model_name", "").strip()
-
-        if agent_model_active == model_name:
-            print(f"\n🔍 Prüfe Agent: {agent['agent_name']}")
-            print(f"   ➤ Modell '{model_name}' ist bereits aktiv geladen.")
-            print("   ✅ Agent ist geeignet (bereits aktiv).")
-            return True
-
-        ram_mem_total_mb = agent.get("ram_mem_total_mb")
-        if not isinstance(ram_mem_total_mb, (int, float)) or ram_mem_total_mb <= 0:
-            print(f"   ⚠️ RAM-Wert ungültig oder fehlt: {ram_mem_total_mb}")
-            return False
-
-        used_ram_percent = agent.get("mem_used_percent", 100)
-        available_ram_mb = (1 - used_ram_percent / 100) * ram_mem_total_mb
-
-        gpu_mem_total = agent.get("gpu_mem_total_mb", 0) or 0
-        gpu_mem_used = agent.get("gpu_mem_used_mb", 0) or 0
-        available_vram_mb = gpu_mem_total - gpu_mem_used
-
-        requires_gpu = model.get("requires_gpu", False)
-        min_ram = model.get("min_ram_mb") or 0
-        min_vram = model.get("min_vram_mb") or 0
-
-        print(f"\n🔍 Prüfe Agent: {agent['agent_name']}")
-        print(f"   → RAM gesamt: {ram_mem_total_mb} MB | RAM verfügbar: {available_ram_mb:.0f} MB")
-        print(f"   → GPU gesamt: {gpu_mem_total} MB | GPU verfügbar: {available_vram_mb:.0f} MB")
-        print(f"   → Modellanforderung: min_ram={min_ram} MB | min_vram={min_vram} MB | GPU erforderlich: {bool(requires_gpu)}")
-
-        if requires_gpu and gpu_mem_total <= 0:
-            print("   ⛔ Kein GPU verfügbar – nicht geeignet.")
-            return False
-        if min_ram and available_ram_mb < min_ram:
-            print("   ⛔ RAM zu gering – nicht geeignet.")
-            return False
-        if min_vram and available_vram_mb < min_vram:
-            print("   ⛔ VRAM zu gering – nicht geeignet.")
-            return False
-
-        print("   ✅ Agent ist geeignet.")
-        return True
-
-    except Exception as e:
-        print(f"   ⚠️ Fehler bei der Agentprüfung: {e}")
-        return False
+def report_affinity(cycle_stats):
+    if not cycle_stats:
+        return
+    affinity_totals.update(cycle_stats)
+    total = sum(affinity_totals.values())
+    misses = ", ".join(f"{k}={v}" for k, v in sorted(affinity_totals.items()) if k != "hit")
+    logging.info(
+        f"🔗 Dialog-Affinität: Zyklus {cycle_stats['hit']}/{sum(cycle_stats.values())} | "
+        f"gesamt {affinity_totals['hit']}/{total} ({affinity_totals['hit'] / total:.0%}) | {misses or '-'}"
+    )
 
 def run_dispatcher_cycle():
-    cfg = load_db_config()
-    conn = mysql.connector.connect(**cfg)
-    cursor = conn.cursor(dictionary=True)
+    with db_cursor() as cursor:
+        return dispatch(cursor)
 
-    update_agent_availability(cursor)
+def dispatch(cursor):
+    if registry is None:
+        update_agent_availability(cursor)
+    release_expired_leases(cursor)
+    cursor.commit()
 
     open_requests = load_open_requests(cursor)
     if not open_requests:
-        cursor.close()
-        conn.close()
-        return
+        return 0
 
-    agents = get_available_agents(cursor)
+    # Mit Registry kommen die Agents aus dem Speicher statt aus agent_status
+    agents = registry.available_agents() if registry else get_available_agents(cursor)
     prompts = get_all_pre_prompts(cursor)
     model_catalog = get_model_catalog(cursor)
 
@@ -164,24 +135,35 @@ def run_dispatcher_cycle():
     for a in agents:
         print(f"  - {a['agent_name']} | CPU: {a['cpu_load_percent']}% | RAM: {a['mem_used_percent']}%")
 
-    for req in open_requests:
-        print(f"\n📨 Anfrage {req['id']} von User {req['user_id']}: '{req['user_message'][:60]}'")
-
-        best_score = -1
-        best_prompt_id = None
-        best_prompt = None
+    # Offene Arbeit pro Agent; wird mit jeder Zuweisung im Zyklus fortgeschrieben
+    engine = AssignmentEngine.from_db(cursor, agents)
+    dialog_agents = load_dialog_agents(cursor, open_requests)
 
-        for prompt in prompts:
-            score = score_prompt(prompt, req["user_message"])
-            print(f"   → Prompt {prompt['id']} („{prompt['name']}“): Score {score}")
-            if score > best_score:
-                best_score = score
-                best_prompt_id = prompt["id"]
-                best_prompt = prompt
+    # Alle offenen Anfragen in einem Matrixprodukt gegen alle pre-Prompts bewerten
+    scorer = scorer_for(prompts)
+    best_matches = scorer.best_prompts([req["user_message"] for req in open_requests])
 
+    assigned_agents = set()
+    assigned = 0
+    twins = {}  # (prompt_id, normalisierte Frage): Agent der ersten identischen Anfrage
+    coalesced = 0
+    matched = []
+    for req, (best_prompt, best_score) in zip(open_requests, best_matches):
         if not best_prompt:
-            print("⚠️ Kein passender PrePrompt gefunden.")
+            print(f"⚠️ Anfrage {req['id']}: Kein passender PrePrompt gefunden.")
             continue
+        matched.append({"req": req, "prompt": best_prompt, "score": best_score,
+                        "model": best_prompt.get("model"), "timestamp": req["timestamp"]})
+
+    # Nach Modell gebündelt zuweisen (mit Alterungsfenster), damit Bursts eines
+    # Modells auf dem Agent landen, der es bereits geladen hat
+    warm_models = set().union(*(loaded_models(a) for a in agents)) if agents else set()
+    for item in order_by_model(matched, warm_models):
+        req, best_prompt, best_score = item["req"], item["prompt"], item["score"]
+        print(f"\n📨 Anfrage {req['id']} von User {req['user_id']}: '{req['user_message'][:60]}'")
+
+        best_prompt_id = best_prompt["id"]
+        logging.debug(f"   → Prompt {best_prompt_id} („{best_prompt['name']}“): Score {best_score:.0f}")
 
         model_name = best_prompt.get("model")
         model = next((m for m in model_catalog if m["model_name"] == model_name), None)
@@ -190,27 +172,60 @@ def run_dispatcher_cycle():
             print(f"⚠️ Modell '{model_name}' nicht im Katalog gefunden.")
             continue
 
-        suitable_agents = [a for a in agents if is_agent_suitable(a, model)]
-        if not suitable_agents:
-            print(f"⚠️ Kein geeigneter Agent für Modell '{model_name}' mit RAM/VRAM verfügbar.")
+        # Identische Einzelfragen auf denselben Agent – dort teilen sie sich eine Generierung.
+        # Anfragen, die einen Dialog fortsetzen, haben einen eigenen Verlauf und zählen nicht.
+        preferred_agent = dialog_agents.get(req["id"])
+        twin_key = None if preferred_agent else (best_prompt_id, normalize_text(req["user_message"]).casefold())
+        if twin_key in twins:
+            selected_agent = twins[twin_key]
+            print(f"🪢 Zuweisung: Agent '{selected_agent}' (identische Anfrage läuft dort bereits)")
+            assign_request(cursor, req["id"], selected_agent, best_prompt_id)
+            assigned += 1
+            coalesced += 1
             continue
 
-        selected_agent = suitable_agents[0]
-        print(f"✅ Zuweisung: Agent '{selected_agent['agent_name']}' übernimmt mit PrePrompt {best_prompt_id}")
-        assign_request(cursor, req["id"], selected_agent["agent_name"], best_prompt_id)
+        selected_agent = engine.select(model, req["user_message"], preferred_agent)
+        if not selected_agent:
+            print(f"⚠️ Kein geeigneter Agent für Modell '{model_name}' mit RAM/VRAM verfügbar.")
+            continue
 
-    conn.commit()
-    cursor.close()
-    conn.close()
+        eta = engine.expected_completion(selected_agent, 0)
+        engine.reserve(selected_agent, model, req["user_message"])
+        print(f"✅ Zuweisung: Agent '{selected_agent}' übernimmt mit PrePrompt {best_prompt_id} (Rückstand ≈ {eta:.0f}s)")
+        assign_request(cursor, req["id"], selected_agent, best_prompt_id)
+        assigned_agents.add(selected_agent)
+        assigned += 1
+        if twin_key:
+            twins[twin_key] = selected_agent
+
+    cursor.commit()
+    if assigned_agents:
+        # Erst nach dem Commit wecken, sonst finden die Agents die Zeilen noch nicht
+        bus.publish(CONVERSATION_QUEUED, agents=sorted(assigned_agents))
+    report_affinity(engine.affinity)
+    if coalesced:
+        logging.info(f"🪢 {coalesced} identische Anfrage(n) zum selben Agent gebündelt.")
+    if engine.model_loads:
+        logging.info(f"🔁 {engine.model_loads} Zuweisung(en) erfordern einen Modellwechsel auf dem Agent.")
     print("⏳ Zyklus abgeschlossen. Warte auf nächste Runde ...\n")
+    return assigned
 
 def main():
+    global registry
+    if USE_AGENT_REGISTRY:
+        registry = AgentRegistry(AGENT_STALE_SECONDS).start()
+    if RUN_EVENT_BROKER:
+        EventBroker().serve_in_background()
+    # Neue Nachricht vom Connector → Zyklus sofort starten
+    bus.subscribe([CONVERSATION_NEW], lambda topic, data: poller.notify())
     while True:
+        found = 0
         try:
-            run_dispatcher_cycle()
+            found = run_dispatcher_cycle()
         except Exception as e:
             logging.error(f"❌ Fehler im Zyklus: {e}")
-        time.sleep(INTERVAL_SECONDS)
+        poller.record(found)
+        poller.wait()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Filename: prompt_index.py
+"""Invertierter Index Schlagwort → Prompt-IDs für das Pre-Prompt-Routing.
+
+Der Index wird einmal aus der Tabelle `prompts` aufgebaut und nur neu geladen,
+wenn sich der Bestand der pre-Prompts ändert (Anzahl, höchste ID oder
+updated_at). Das Routing selbst kostet danach nur noch einen Dict-Zugriff pro
+Wort der Nachricht und keine DB-Abfrage.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+
+REFRESH_INTERVAL = 30  # Sekunden zwischen zwei Versionsprüfungen in der DB
+
+
+def normalize_word(word: str) -> str:
+    return word.strip(",.!?").lower()
+
+
+def split_tags(tags: str) -> list:
+    return [tag.strip().lower() for tag in tags.split(",") if tag.strip()]
+
+
+class TagIndex:
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.index = {}  # tag: sortiertes Tupel von Prompt-IDs
+        self.version = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+    def build(self, rows):
+        index = defaultdict(set)
+        for row in rows:
+            for tag in split_tags(row["tags"] or ""):
+                index[tag].add(row["id"])
+        # Referenz wird in einem Schritt getauscht, Leser brauchen keinen Lock
+        self.index = {tag: tuple(sorted(ids)) for tag, ids in index.items()}
+
+    def refresh(self, cursor, force=False):
+        """Prüft höchstens alle refresh_interval Sekunden die Version der
+        pre-Prompts und baut den Index bei Änderungen neu auf."""
+        now = time.monotonic()
+        if not force and self.checked_at is not None and now - self.checked_at < self.refresh_interval:
+            return
+        with self.lock:
+            if not force and self.checked_at is not None and now - self.checked_at < self.refresh_interval:
+                return
+            cursor.execute("""
+                SELECT COUNT(*) AS cnt, MAX(id) AS max_id, MAX(updated_at) AS changed
+                FROM prompts
+                WHERE role = 'pre'
+            """)
+            version = tuple(cursor.fetchone().values())
+            if force or version != self.version:
+                cursor.execute("SELECT id, tags FROM prompts WHERE is_active = 1 AND role = 'pre' AND tags IS NOT NULL")
+                self.build(cursor.fetchall())
+                self.version = version
+                logging.debug(f"Tag-Index neu aufgebaut: {len(self.index)} Schlagwörter")
+            self.checked_at = now
+
+    def invalidate(self):
+        self.checked_at = None
+        self.version = None
+
+    def best_prompt_id(self, user_text: str):
+        """Prompt mit den meisten Treffern; bei Gleichstand gewinnt die kleinste ID."""
+        index = self.index
+        hits = defaultdict(int)
+        for word in user_text.split():
+            for prompt_id in index.get(normalize_word(word), ()):
+                hits[prompt_id] += 1
+        if not hits:
+            return None
+        return min(hits, key=lambda prompt_id: (-hits[prompt_id], prompt_id))
+
+
+tag_index = TagIndex()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# Filename: prompt_scoring.py
+"""Bewertung offener Anfragen gegen alle pre-Prompts per Matrixprodukt.
+
+Für alle Prompts wird einmal eine dünn besetzte Term-Matrix aufgebaut
+(Schlagwörter mit TAG_WEIGHT, Wörter des Prompt-Inhalts mit CONTENT_WEIGHT,
+Mehrfachvorkommen zählen mehrfach). Ein Stapel Nachrichten wird als binäre
+Term-Matrix kodiert; Scores = Nachrichten × Gewichteᵀ in einem Schritt.
+"""
+import re
+from collections import defaultdict
+
+import numpy as np
+from scipy import sparse
+
+TAG_WEIGHT = 3
+CONTENT_WEIGHT = 1
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    return TOKEN_RE.findall((text or "").lower())
+
+
+class PromptScorer:
+    def __init__(self, prompts, tag_weight=TAG_WEIGHT, content_weight=CONTENT_WEIGHT):
+        self.prompts = list(prompts)
+        self.vocab = {}  # Term: Spaltenindex
+        self.phrases = {}  # mehrteilige Schlagwörter: Spaltenindex
+
+        rows, cols, values = [], [], []
+        for i, prompt in enumerate(self.prompts):
+            weights = defaultdict(float)
+            for tag in (prompt.get("tags") or "").split(","):
+                tokens = tokenize(tag)
+                if tokens:
+                    weights[" ".join(tokens)] += tag_weight
+            for token in tokenize(prompt.get("content")):
+                weights[token] += content_weight
+            for term, weight in weights.items():
+                col = self.vocab.setdefault(term, len(self.vocab))
+                if " " in term:
+                    self.phrases[term] = col
+                rows.append(i)
+                cols.append(col)
+                values.append(weight)
+
+        self.weights = sparse.csr_matrix(
+            (values, (rows, cols)), shape=(len(self.prompts), len(self.vocab)), dtype=np.float32
+        )
+
+    def encode(self, messages) -> sparse.csr_matrix:
+        """Binäre Nachrichten × Term-Matrix (ein Term zählt pro Nachricht einmal)."""
+        rows, cols = [], []
+        for i, message in enumerate(messages):
+            tokens = tokenize(message)
+            present = {self.vocab[t] for t in tokens if t in self.vocab}
+            if self.phrases:
+                joined = f" {' '.join(tokens)} "
+                present.update(col for phrase, col in self.phrases.items() if f" {phrase} " in joined)
+            rows.extend([i] * len(present))
+            cols.extend(present)
+        return sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(messages), len(self.vocab))
+        )
+
+    def score(self, messages) -> np.ndarray:
+        """Scores als dichte Matrix (Nachrichten × Prompts)."""
+        return (self.encode(messages) @ self.weights.T).toarray()
+
+    def best_prompts(self, messages) -> list:
+        """Pro Nachricht (Prompt, Score) mit dem höchsten Score; bei Gleichstand
+        gewinnt der zuerst geladene Prompt. Ohne Prompts: (None, 0)."""
+        if not self.prompts:
+            return [(None, 0)] * len(messages)
+        scores = self.score(messages)
+        best = scores.argmax(axis=1)
+        return [(self.prompts[j], float(scores[i, j])) for i, j in enumerate(best)]
+
+
+_cached_key = None
+_cached_scorer = None
+
+
+def scorer_for(prompts) -> PromptScorer:
+    """Liefert den zwischengespeicherten Scorer, solange sich die Prompts
+    (ID und updated_at) nicht geändert haben."""
+    global _cached_key, _cached_scorer
+    key = tuple((p["id"], p.get("updated_at")) for p in prompts)
+    if key != _cached_key:
+        _cached_scorer = PromptScorer(prompts)
+        _cached_key = key
+    return _cached_scorer
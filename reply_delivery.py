@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# Filename: reply_delivery.py
+"""Gleichzeitige, gedrosselte Auslieferung von Antworten an Telegram.
+
+Antworten verschiedener Chats gehen parallel hinaus, innerhalb eines Chats
+der Reihe nach. Zwei Token-Buckets halten die Telegram-Grenzen ein: global
+(~30 Nachrichten/s pro Bot) und pro Chat (~1 Nachricht/s, kurze Bursts
+erlaubt). RetryAfter sperrt beide Buckets, danach wird wiederholt; Texte über
+4096 Zeichen werden an Absatz-, Zeilen- oder Wortgrenzen geteilt.
+"""
+import asyncio
+import time
+from collections import defaultdict
+
+from telegram.error import RetryAfter
+
+TELEGRAM_MAX_LEN = 4096
+GLOBAL_RATE = 30  # Nachrichten pro Sekunde über alle Chats
+GLOBAL_BURST = 30
+CHAT_RATE = 1  # Nachrichten pro Sekunde und Chat
+CHAT_BURST = 3
+MAX_CONCURRENT_CHATS = 20
+MAX_RETRIES = 3
+IDLE_BUCKET_SECONDS = 300  # ungenutzte Chat-Buckets danach verwerfen
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # nach RetryAfter
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # Eine Eventloop: zwischen zwei await ist Prüfen und Abziehen atomar
+        while True:
+            now = time.monotonic()
+            self.refill(now)
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def split_text(text, limit=TELEGRAM_MAX_LEN) -> list:
+    """Teilt an der letzten Absatz-, Zeilen- oder Wortgrenze vor dem Limit."""
+    chunks = []
+    while len(text) > limit:
+        cut = max(text.rfind("\n\n", 0, limit), text.rfind("\n", 0, limit), text.rfind(" ", 0, limit))
+        if cut <= limit // 2:
+            cut = limit  # keine sinnvolle Grenze – hart teilen
+        chunks.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text or not chunks:
+        chunks.append(text)
+    return chunks
+
+
+def retry_seconds(error) -> float:
+    # python-telegram-bot liefert je nach Version int oder timedelta
+    value = error.retry_after
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+
+class ReplyDelivery:
+    def __init__(self, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE):
+        self.global_bucket = TokenBucket(global_rate, GLOBAL_BURST)
+        self.chat_rate = chat_rate
+        self.chat_buckets = defaultdict(lambda: TokenBucket(self.chat_rate, CHAT_BURST))
+        self.chats = asyncio.Semaphore(MAX_CONCURRENT_CHATS)
+        self.retries = 0
+
+    async def call(self, chat_id, request):
+        """Führt request() gedrosselt aus und wiederholt bei RetryAfter."""
+        for attempt in range(MAX_RETRIES + 1):
+            await self.chat_buckets[chat_id].acquire()
+            await self.global_bucket.acquire()
+            try:
+                return await request()
+            except RetryAfter as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                self.retries += 1
+                # Die Flood-Sperre gilt auch botweit – sonst laufen andere Chats in dieselbe 429
+                self.chat_buckets[chat_id].block(retry_seconds(e))
+                self.global_bucket.block(retry_seconds(e))
+
+    async def send(self, bot, chat_id, text):
+        """Sendet text, bei Bedarf in mehreren Nachrichten; liefert die erste Nachricht."""
+        first = None
+        for chunk in split_text(text):
+            message = await self.call(chat_id, lambda: bot.send_message(chat_id=chat_id, text=chunk))
+            first = first or message
+        return first
+
+    async def edit(self, bot, chat_id, message_id, text):
+        return await self.call(chat_id, lambda: bot.edit_message_text(chat_id=chat_id, message_id=message_id,
+                                                                      text=text))
+
+    async def deliver(self, rows, deliver_row) -> list:
+        """Ruft deliver_row(row) für alle Zeilen auf – Chats parallel, pro Chat
+        in ID-Reihenfolge. Liefert die IDs der erfolgreich zugestellten Zeilen."""
+        by_chat = defaultdict(list)
+        for row in sorted(rows, key=lambda r: r["id"]):
+            by_chat[row["user_id"]].append(row)
+
+        async def deliver_chat(chat_rows):
+            done = []
+            async with self.chats:
+                for row in chat_rows:
+                    if await deliver_row(row):
+                        done.append(row["id"])
+            return done
+
+        results = await asyncio.gather(*(deliver_chat(chat_rows) for chat_rows in by_chat.values()))
+        self.forget_idle()
+        return [conv_id for done in results for conv_id in done]
+
+    def forget_idle(self):
+        now = time.monotonic()
+        for chat_id in [c for c, b in self.chat_buckets.items() if now - b.updated > IDLE_BUCKET_SECONDS]:
+            del self.chat_buckets[chat_id]
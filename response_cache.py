@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# Filename: response_cache.py
+"""Antwort-Cache für identische Anfragen ohne Verlauf (opt-in pro Prompt).
+
+Schlüssel ist ein SHA-256 über Modell, Optionen und die normalisierte
+Nachrichtenliste (Systemprompt-Inhalt eingeschlossen – eine neue
+Prompt-Version ergibt automatisch neue Schlüssel). Stufe 1 ist ein LRU mit
+TTL im Agent, Stufe 2 die Tabelle response_cache, die sich alle Agents
+teilen. Aktiv nur für Prompts mit prompts.cache_enabled = 1; die Lebensdauer
+kommt aus prompts.cache_ttl_s.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+
+MAX_ENTRIES = 2000
+MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 3600
+CLEANUP_EVERY = 200  # Speichervorgänge zwischen zwei DELETEs abgelaufener L2-Einträge
+REPORT_EVERY = 100  # Abfragen zwischen zwei Log-Ausgaben
+
+
+def normalize_text(text) -> str:
+    return " ".join((text or "").split())
+
+
+def cache_key(model, messages, options=None) -> str:
+    """Stabiler Schlüssel; Nutzertexte zählen ohne Groß-/Kleinschreibung und Leerraum."""
+    normalized = [
+        [m["role"], normalize_text(m["content"]).casefold() if m["role"] == "user" else normalize_text(m["content"])]
+        for m in messages
+    ]
+    payload = json.dumps([model, options or {}, normalized], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(messages) -> bool:
+    """Nur eigenständige Fragen: Systemprompt + genau eine Nutzernachricht."""
+    return [m["role"] for m in messages if m["role"] != "system"] == ["user"]
+
+
+class ResponseCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key: (reply, expires_at monotonic)
+        self.bytes = 0
+        self.counts = Counter()  # l1_hit, l2_hit, miss, store
+        self.lock = threading.Lock()
+
+    # === Stufe 1: LRU + TTL im Prozess ===
+    def get_local(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            reply, expires_at = entry
+            if expires_at <= time.monotonic():
+                self.drop(key)
+                return None
+            self.entries.move_to_end(key)
+            return reply
+
+    def put_local(self, key, reply, ttl):
+        with self.lock:
+            if key in self.entries:
+                self.drop(key)
+            self.entries[key] = (reply, time.monotonic() + ttl)
+            self.bytes += len(reply.encode("utf-8"))
+            while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+                self.drop(next(iter(self.entries)))
+
+    def drop(self, key):
+        # Aufrufer hält self.lock
+        reply, _ = self.entries.pop(key)
+        self.bytes -= len(reply.encode("utf-8"))
+
+    # === Beide Stufen ===
+    def get(self, cursor, key):
+        reply = self.get_local(key)
+        if reply is not None:
+            self.count("l1_hit")
+            return reply
+        cursor.execute("""
+            SELECT response, TIMESTAMPDIFF(SECOND, NOW(), expires_at) AS ttl
+            FROM response_cache
+            WHERE cache_key = %s AND expires_at > NOW()
+        """, (key,), prepared=True)
+        row = cursor.fetchone()
+        if row:
+            cursor.execute("UPDATE response_cache SET hits = hits + 1 WHERE cache_key = %s", (key,), prepared=True)
+            self.put_local(key, row["response"], max(int(row["ttl"] or 0), 1))
+            self.count("l2_hit")
+            return row["response"]
+        self.count("miss")
+        return None
+
+    def put(self, cursor, key, reply, model, prompt_id, ttl=DEFAULT_TTL_SECONDS):
+        self.put_local(key, reply, ttl)
+        cursor.execute("""
+            INSERT INTO response_cache (cache_key, model, prompt_id, response, created_at, expires_at)
+            VALUES (%s, %s, %s, %s, NOW(), NOW() + INTERVAL %s SECOND)
+            ON DUPLICATE KEY UPDATE
+                response = VALUES(response),
+                created_at = VALUES(created_at),
+                expires_at = VALUES(expires_at)
+        """, (key, model, prompt_id, reply, ttl), prepared=True)
+        if self.count("store") % CLEANUP_EVERY == 0:
+            cursor.execute("DELETE FROM response_cache WHERE expires_at <= NOW()")
+
+    # === Kennzahlen ===
+    def count(self, kind) -> int:
+        with self.lock:
+            self.counts[kind] += 1
+            value = self.counts[kind]
+            lookups = self.counts["l1_hit"] + self.counts["l2_hit"] + self.counts["miss"]
+        if kind != "store" and lookups % REPORT_EVERY == 0:
+            s = self.stats()
+            logging.info(f"⚡ Antwort-Cache: Trefferquote {s['hit_rate']:.0%} (L1 {s['l1_hits']}, "
+                         f"L2 {s['l2_hits']}, Fehlschläge {s['misses']}) | {s['entries']} Einträge, "
+                         f"{s['bytes'] / 1024:.0f} KB")
+        return value
+
+    def stats(self) -> dict:
+        with self.lock:
+            hits = self.counts["l1_hit"] + self.counts["l2_hit"]
+            lookups = hits + self.counts["miss"]
+            return {
+                "l1_hits": self.counts["l1_hit"],
+                "l2_hits": self.counts["l2_hit"],
+                "misses": self.counts["miss"],
+                "stores": self.counts["store"],
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# Filename: semantic_cache.py
+"""Semantischer Antwort-Cache für ähnlich formulierte Einzelfragen.
+
+Ergänzt response_cache: Wo der exakte Schlüssel verfehlt („Wie spät ist
+es?“ vs. „wie spaet ist es“), wird die Frage eingebettet und im
+In-Memory-Index derselben Partition (Modell, Prompt, Prompt-Version) nach
+dem nächsten Nachbarn gesucht. Liegt die Kosinus-Ähnlichkeit über der
+Schwelle des Prompts (prompts.semantic_threshold), gilt die gespeicherte
+Antwort als Treffer.
+
+Modi: "off" – nichts; "shadow" – suchen und messen, aber immer generieren
+(Trefferquote und Abweichung der Antworten im Log); "on" – Treffer ersetzen
+die Generierung. Der Index ist pro Partition und insgesamt begrenzt; eine neue
+Prompt-Version verdrängt die alten Partitionen desselben Prompts.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from vector_memory import normalize
+
+MODES = ("off", "shadow", "on")
+DEFAULT_THRESHOLD = 0.92
+MAX_PER_PARTITION = 500
+MAX_PARTITIONS = 64
+DEFAULT_TTL_SECONDS = 3600
+REPORT_EVERY = 100  # Abfragen zwischen zwei Log-Ausgaben
+
+
+def prompt_version(system_prompt) -> str:
+    """Kurzer Hash des Systemprompts – eine geänderte Fassung ergibt eine neue Partition."""
+    return hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest()[:12]
+
+
+class Partition:
+    """Fragen-Vektoren und Antworten einer (Modell, Prompt, Version)-Kombination, LRU-geordnet."""
+
+    def __init__(self, max_entries=MAX_PER_PARTITION):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # Fragetext: (vector, answer, expires_at monotonic)
+        self.matrix = None  # gestapelte Vektoren, nach Änderungen neu aufgebaut
+        self.keys = []
+
+    def add(self, question, vector, answer, ttl):
+        self.entries.pop(question, None)
+        self.entries[question] = (vector, answer, time.monotonic() + ttl)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.matrix = None
+
+    def nearest(self, vector):
+        """(score, question, answer) des ähnlichsten gültigen Eintrags oder None."""
+        now = time.monotonic()
+        expired = [q for q, (_, _, expires_at) in self.entries.items() if expires_at <= now]
+        for question in expired:
+            del self.entries[question]
+        if expired:
+            self.matrix = None
+        if not self.entries:
+            return None
+        if self.matrix is None:
+            self.keys = list(self.entries)
+            self.matrix = np.vstack([self.entries[q][0] for q in self.keys])
+        scores = self.matrix @ vector
+        best = int(np.argmax(scores))
+        question = self.keys[best]
+        self.entries.move_to_end(question)
+        return float(scores[best]), question, self.entries[question][1]
+
+
+class SemanticCache:
+    def __init__(self, embedder, mode="shadow", max_partitions=MAX_PARTITIONS):
+        if mode not in MODES:
+            raise ValueError(f"Unbekannter Modus für den semantischen Cache: {mode}")
+        self.embedder = embedder
+        self.mode = mode
+        self.max_partitions = max_partitions
+        self.partitions = OrderedDict()  # (model, prompt_id, version): Partition
+        self.counts = Counter()  # lookups, hits, stores, drift_samples
+        self.drift_total = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def embed(self, texts) -> np.ndarray:
+        return normalize(self.embedder.embed(texts))
+
+    def partition(self, model, prompt_id, version, create=False):
+        # Aufrufer hält self.lock
+        key = (model, prompt_id, version)
+        part = self.partitions.get(key)
+        if part is None and create:
+            # Alte Versionen desselben Prompts sind ab jetzt wertlos
+            for old in [k for k in self.partitions if k[:2] == key[:2]]:
+                del self.partitions[old]
+            part = self.partitions[key] = Partition()
+            while len(self.partitions) > self.max_partitions:
+                self.partitions.popitem(last=False)
+        if part is not None:
+            self.partitions.move_to_end(key)
+        return part
+
+    # === Suchen ===
+    def lookup(self, model, prompt_id, system_prompt, question, threshold=None, vector=None):
+        """Liefert (vector, hit); hit ist (score, frage, antwort) oder None.
+        Der Vektor wird für das spätere Speichern der Antwort mitgegeben; ist er
+        schon berechnet (vector), wird hier nicht eingebettet."""
+        if not self.enabled:
+            return None, None
+        if vector is None:
+            try:
+                vector = self.embed([question])[0]
+            except Exception as e:
+                logging.debug(f"Semantischer Cache: Einbettung fehlgeschlagen: {e}")
+                return None, None
+        with self.lock:
+            part = self.partition(model, prompt_id, prompt_version(system_prompt))
+            found = part.nearest(vector) if part is not None else None
+        hit = found if found and found[0] >= (threshold or DEFAULT_THRESHOLD) else None
+        self.count("hit" if hit else "miss")
+        return vector, hit
+
+    # === Speichern ===
+    def store(self, model, prompt_id, system_prompt, question, vector, answer, ttl=DEFAULT_TTL_SECONDS):
+        if not self.enabled or vector is None:
+            return
+        with self.lock:
+            self.partition(model, prompt_id, prompt_version(system_prompt), create=True).add(
+                " ".join(question.split()), vector, answer, ttl)
+            self.counts["store"] += 1
+
+    def record_drift(self, cached_answer, fresh_answer):
+        """Schattenbetrieb: wie weit weicht die gecachte von der frisch generierten Antwort ab?"""
+        try:
+            vectors = self.embed([cached_answer, fresh_answer])
+        except Exception as e:
+            logging.debug(f"Semantischer Cache: Drift nicht messbar: {e}")
+            return
+        similarity = float(vectors[0] @ vectors[1])
+        with self.lock:
+            self.counts["drift_samples"] += 1
+            self.drift_total += 1.0 - similarity
+
+    # === Kennzahlen ===
+    def count(self, kind):
+        with self.lock:
+            self.counts[kind] += 1
+            lookups = self.counts["hit"] + self.counts["miss"]
+        if lookups % REPORT_EVERY == 0:
+            s = self.stats()
+            logging.info(f"🧲 Semantischer Cache ({s['mode']}): Trefferquote {s['hit_rate']:.0%} "
+                         f"bei {s['lookups']} Abfragen | mittlere Abweichung {s['mean_drift']:.3f} "
+                         f"({s['drift_samples']} Vergleiche) | {s['entries']} Einträge "
+                         f"in {s['partitions']} Partitionen")
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.counts["hit"] + self.counts["miss"]
+            samples = self.counts["drift_samples"]
+            return {
+                "mode": self.mode,
+                "lookups": lookups,
+                "hits": self.counts["hit"],
+                "hit_rate": self.counts["hit"] / lookups if lookups else 0.0,
+                "stores": self.counts["store"],
+                "drift_samples": samples,
+                "mean_drift": self.drift_total / samples if samples else 0.0,
+                "partitions": len(self.partitions),
+                "entries": sum(len(p.entries) for p in self.partitions.values()),
+            }
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# Filename: single_flight.py
+"""Zusammenlegen gleichzeitiger, identischer Generierungen im Agent.
+
+Fragen mehrere Nutzer binnen Sekunden dasselbe (Gruppenchat, Rundnachricht),
+läuft pro Generierungsschlüssel nur eine Anfrage an Ollama. Die erste Anfrage
+führt (leader), alle weiteren hängen sich an (follower) und bekommen dieselbe
+Antwort, die jede für ihre eigene Zeile speichert. Zwischenstände beim
+Streaming werden an alle Beteiligten verteilt.
+
+Funktioniert im Thread- und im asyncio-Modus: das Ergebnis liegt in einem
+concurrent.futures.Future (asyncio: asyncio.wrap_future).
+"""
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+REPORT_EVERY = 50  # angehängte Anfragen zwischen zwei Log-Ausgaben
+
+
+class Flight:
+    __slots__ = ("key", "future", "followers", "partial")
+
+    def __init__(self, key):
+        self.key = key
+        self.future = Future()
+        self.followers = []  # Jobs, die auf dieses Ergebnis warten
+        self.partial = None  # letzter Zwischenstand beim Streaming
+
+
+class SingleFlight:
+    def __init__(self):
+        self.flights = {}  # key: Flight
+        self.counts = Counter()  # leaders, followers
+        self.lock = threading.Lock()
+
+    def join(self, key, job):
+        """Liefert (flight, is_leader). Follower erhalten den bisherigen
+        Zwischenstand über flight.partial."""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight(key)
+                self.counts["leaders"] += 1
+                return flight, True
+            flight.followers.append(job)
+            self.counts["followers"] += 1
+            followers = self.counts["followers"]
+        if followers % REPORT_EVERY == 0:
+            self.report()
+        return flight, False
+
+    def partial(self, flight, text) -> list:
+        """Merkt sich den Zwischenstand und gibt die Follower zurück, die ihn bekommen sollen."""
+        with self.lock:
+            flight.partial = text
+            return list(flight.followers)
+
+    def finish(self, flight, reply):
+        """Beendet die Generierung; neue Anfragen starten danach eine eigene.
+        Schlägt der Leader fehl, bekommen auch die Follower dessen Fehlerantwort."""
+        with self.lock:
+            self.flights.pop(flight.key, None)
+        flight.future.set_result(reply)
+
+    # === Kennzahlen ===
+    def stats(self) -> dict:
+        with self.lock:
+            leaders, followers = self.counts["leaders"], self.counts["followers"]
+            return {
+                "generations": leaders,
+                "coalesced": followers,
+                "saved_rate": followers / (leaders + followers) if leaders + followers else 0.0,
+                "in_flight": len(self.flights),
+            }
+
+    def report(self):
+        s = self.stats()
+        logging.info(f"🪢 Zusammengelegt: {s['coalesced']} Anfrage(n) ohne eigene Generierung "
+                     f"({s['saved_rate']:.0%} von {s['generations'] + s['coalesced']}) | "
+                     f"{s['in_flight']} laufend")
@@ -2,19 +2,36 @@
 # Filename: telegram_connector_db.py
 import asyncio
 import sys
-import mysql.connector
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from pathlib import Path
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler,
     ContextTypes, filters, JobQueue
 )
+from async_db import AsyncDB
+from reply_delivery import TELEGRAM_MAX_LEN, ReplyDelivery, split_text
+from telegram_webhook import WEBHOOK_HOST, WEBHOOK_PORT, WebhookServer, read_secret
+from event_bus import CONVERSATION_NEW, CONVERSATION_QUEUED, CONVERSATION_SOLVED, AdaptivePoller, EventBus
 
-ACCESS_FILE = "private/.mariadb_access"
 BOT_TOKEN_FILE = "private/.bot_token"
 ADMIN_ID = 13709024
 CONFIRM_TIMEOUT_MINUTES = 15
+STREAM_POLL_INTERVAL = 1  # Sekunden zwischen Abfragen, solange Antworten laufen
+STREAM_IDLE_INTERVAL = 30  # ohne laufende Antworten; neue Nachrichten und Zuweisungen wecken sofort
+STREAM_SUFFIX = " …"
+REPLY_MIN_INTERVAL = 1  # Sekunden; ohne neue Antworten Backoff bis REPLY_POLL_INTERVAL
+REPLY_POLL_INTERVAL = 5
+SAFETY_SWEEP_INTERVAL = 60  # Sicherheits-Polling, wenn Agents fertige Antworten melden (Bus/Rückruf)
+CALLBACK_HOST = "127.0.0.1"  # Rückruf-Endpunkt /solved im Polling-Betrieb (SOLVED_CALLBACK im Agent)
+RECENTLY_SENT_IDS = 1000  # so viele zugestellte IDs merken, damit der Sweep nichts doppelt sendet
+DEBOUNCE_SECONDS = 2.0  # kurz aufeinanderfolgende Nachrichten eines Nutzers zusammenfassen; 0 = aus
+DEBOUNCE_MAX_WAIT = 8.0  # spätestens so lange nach der ersten Nachricht wird gespeichert
+DB_REPORT_INTERVAL = 300  # Sekunden zwischen zwei Berichten der DB-Latenz
+DELIVERY_BATCH = 200  # Zeilen pro Seite beim Ausliefern
 
 
 def read_token(path=BOT_TOKEN_FILE) -> str:
@@ -25,66 +42,365 @@ def read_token(path=BOT_TOKEN_FILE) -> str:
     return token_path.read_text().strip()
 
 
-def load_db_credentials() -> dict:
-    creds = {}
-    with open(ACCESS_FILE) as f:
-        for line in f:
-            if "=" in line:
-                key, value = line.strip().split("=", 1)
-                creds[key.strip()] = value.strip()
-    return {
-        "host": creds.get("host"),
-        "port": int(creds.get("port", 3306)),
-        "user": creds.get("user"),
-        "password": creds.get("password"),
-        "database": creds.get("database"),
-    }
+# === DB-Schritte (laufen im DB-Thread-Pool, nie in der Eventloop) ===
+def load_solved_rows(cursor, after_id, limit):
+    # Keyset-Seite über idx_conversations_delivery (message_status, response_sent, id)
+    cursor.execute("""
+        SELECT id, user_id, model_response, telegram_message_id
+        FROM conversations
+        WHERE message_status = 'solved' AND response_sent = 0 AND id > %s
+          AND user_id IS NOT NULL  -- Profil gelöscht: niemand mehr, an den zugestellt werden kann
+        ORDER BY id
+        LIMIT %s
+    """, (after_id, limit), prepared=True)
+    return cursor.fetchall()
+
+
+def load_solved_row(cursor, conv_id):
+    cursor.execute("""
+        SELECT id, user_id, model_response, telegram_message_id
+        FROM conversations
+        WHERE id = %s AND message_status = 'solved' AND response_sent = 0
+          AND user_id IS NOT NULL
+    """, (conv_id,), prepared=True)
+    return cursor.fetchone()
+
+
+def mark_sent(cursor, conv_ids):
+    placeholders = ", ".join(["%s"] * len(conv_ids))
+    cursor.execute(f"UPDATE conversations SET response_sent = 1 WHERE id IN ({placeholders})", conv_ids)
+
+
+def load_partial_rows(cursor):
+    # Auch Zeilen ohne erste Tokens: sie halten das Abfrageintervall kurz
+    cursor.execute("""
+        SELECT id, user_id, model_response, telegram_message_id
+        FROM conversations
+        WHERE message_status = 'progress'
+          AND response_sent = 0
+    """, prepared=True)
+    return cursor.fetchall()
+
+
+def load_partial_row(cursor, conv_id):
+    # Unmittelbar vor Edit/Versand: ist die Antwort noch in Arbeit?
+    cursor.execute("""
+        SELECT id, user_id, model_response, telegram_message_id
+        FROM conversations
+        WHERE id = %s AND message_status = 'progress'
+          AND response_sent = 0
+    """, (conv_id,), prepared=True)
+    return cursor.fetchone()
+
+
+def set_stream_message(cursor, conv_id, message_id):
+    cursor.execute("UPDATE conversations SET telegram_message_id = %s WHERE id = %s",
+                   (message_id, conv_id), prepared=True)
+
+
+def load_user_state(cursor, user_id):
+    """Profil und letzte gelöste Konversation des Nutzers in einem Schritt."""
+    cursor.execute("SELECT * FROM user_profile WHERE user_id = %s", (user_id,), prepared=True)
+    profile = cursor.fetchone()
+    if not profile:
+        return None, None
+    cursor.execute("""
+        SELECT id, dialog_id, timestamp FROM conversations
+        WHERE user_id = %s AND message_status = 'solved'
+        ORDER BY timestamp DESC LIMIT 1
+    """, (user_id,), prepared=True)
+    return profile, cursor.fetchone()
+
+
+def register_user(cursor, user, now):
+    cursor.execute("""
+        INSERT INTO user_profile (user_id, first_name, last_name, messenger_id, last_active)
+        VALUES (%s, %s, %s, %s, %s)
+    """, (
+        user.id,
+        user.first_name or "",
+        user.last_name or "",
+        user.username or None,
+        now,
+    ))
+
+
+def insert_message(cursor, user_id, message, dialog_id):
+    cursor.execute("""
+        INSERT INTO conversations (user_id, user_message, message_status, timestamp, dialog_id)
+        VALUES (%s, %s, 'new', %s, %s)
+    """, (user_id, message, datetime.now(), dialog_id), prepared=True)
+    return cursor.lastrowid
+
+
+class PendingMessages:
+    """Noch nicht gespeicherte Nachrichten eines Nutzers im Entprell-Fenster."""
+    __slots__ = ("messages", "dialog_id", "first_at", "timer")
+
+    def __init__(self, dialog_id, first_at):
+        self.messages = []
+        self.dialog_id = dialog_id
+        self.first_at = first_at
+        self.timer = None
 
 
 class TelegramConnector:
-    def __init__(self, token: str, admin_id: int):
+    def __init__(self, token: str, admin_id: int, callback_port=None):
         self.token = token
         self.admin_id = admin_id
-        self.db_config = load_db_credentials()
         self.app = None
         self.pending_confirmations = {}  # user_id: (message_text, timestamp, dialog_id)
+        self.stream_state = {}  # conversation_id: in Telegram angezeigter Text (inkl. STREAM_SUFFIX)
+        self.bus = EventBus()
+        self.callback_port = callback_port
+        self.callback_server = None
+        # Mit Push-Meldungen (Bus oder Rückruf) ist das Polling nur noch ein seltener Sweep
+        push = self.bus.enabled or callback_port is not None
+        self.reply_poller = AdaptivePoller(REPLY_MIN_INTERVAL, SAFETY_SWEEP_INTERVAL if push else REPLY_POLL_INTERVAL)
+        self.delivery_lock = asyncio.Lock()  # Sweeps dürfen sich nicht überlappen
+        self.stream_poller = AdaptivePoller(STREAM_POLL_INTERVAL, STREAM_IDLE_INTERVAL)
+        self.stream_job = None  # nächster geplanter Lauf von send_stream_updates
+        self.stream_running = False
+        self.in_flight = set()  # IDs, die gerade zugestellt werden (End- oder Zwischenstand)
+        self.deferred = set()  # Endstände, die warten, bis die laufende Zustellung der ID fertig ist
+        self.recently_sent = OrderedDict()  # zuletzt zugestellte IDs (als Menge genutzt)
+        self.push_delivered = 0
+        self.sweep_delivered = 0
+        self.pending_messages = {}  # user_id: PendingMessages
+        self.debounced_in = 0  # Nachrichten, die durch das Entprell-Fenster gingen
+        self.debounced_out = 0  # daraus gespeicherte Anfragen
+        self.loop = None
+        self.db = AsyncDB()  # eigener Thread-Pool für alle DB-Zugriffe
+        self.delivery = ReplyDelivery()
 
     async def send_replies(self, context: ContextTypes.DEFAULT_TYPE):
-        conn = mysql.connector.connect(**self.db_config)
-        cursor = conn.cursor(dictionary=True)
-
-        cursor.execute("""
-            SELECT c.id, c.user_id, c.model_response
-            FROM conversations c
-            JOIN user_profile u ON c.user_id = u.user_id
-            WHERE c.message_status = 'solved'
-              AND c.processing_finished_at IS NOT NULL
-              AND (c.response_sent IS NULL OR c.response_sent = 0)
-        """)
-        rows = cursor.fetchall()
+        """Sicherheits-Sweep: findet Antworten, deren Meldung verloren ging
+        (oder alle, wenn kein Agent meldet), und plant sich selbst neu."""
+        delivered = 0
+        try:
+            async with self.delivery_lock:
+                delivered = await self.deliver_solved(context.bot)
+        finally:
+            interval = self.reply_poller.record(delivered)
+            context.job_queue.run_once(self.send_replies, interval)
+
+    def on_event(self, topic, data):
+        # Läuft im Bus-Thread – Arbeit in der Eventloop des Bots anstoßen
+        if not self.loop:
+            return
+        if topic == CONVERSATION_QUEUED:
+            # Zuweisung an Agents: gleich beginnen die Generierungen
+            self.loop.call_soon_threadsafe(self.wake_stream_updates)
+        elif data.get("id"):
+            self.loop.call_soon_threadsafe(self.schedule_delivery, data["id"])
+
+    def schedule_delivery(self, conv_id):
+        self.app.create_task(self.deliver_id(int(conv_id)))
+
+    async def on_startup(self, app):
+        self.loop = asyncio.get_running_loop()
+        self.bus.subscribe([CONVERSATION_SOLVED, CONVERSATION_QUEUED], self.on_event)
+        if self.callback_port is not None:
+            # Eigener, nur lokal erreichbarer Port für Rückrufe – der Webhook-Port ist öffentlich
+            self.callback_server = WebhookServer(app, None, CALLBACK_HOST, self.callback_port,
+                                                 on_solved=self.schedule_delivery, accept_updates=False)
+            await self.callback_server.start()
+
+    def claim_ids(self, conv_ids, defer=True) -> list:
+        """Markiert IDs als in Zustellung; liefert nur die, die noch niemand zustellt.
+        Mit defer werden belegte IDs nach deren Freigabe erneut zugestellt."""
+        free = [i for i in conv_ids if i not in self.in_flight and i not in self.recently_sent]
+        if defer:
+            self.deferred.update(i for i in conv_ids if i in self.in_flight)
+        self.in_flight.update(free)
+        return free
+
+    def release_ids(self, conv_ids, sent):
+        for conv_id in sent:
+            self.recently_sent[conv_id] = True
+            self.stream_state.pop(conv_id, None)
+        while len(self.recently_sent) > RECENTLY_SENT_IDS:
+            self.recently_sent.popitem(last=False)
+        self.in_flight.difference_update(conv_ids)
+        for conv_id in self.deferred.intersection(conv_ids):
+            self.deferred.discard(conv_id)
+            if conv_id not in self.recently_sent:
+                # Endstand kam, während ein Zwischenstand unterwegs war – jetzt nachholen
+                self.schedule_delivery(conv_id)
+
+    async def deliver_id(self, conv_id):
+        """Push-Pfad: genau diese Antwort per Primärschlüssel laden und zustellen."""
+        if not self.claim_ids([conv_id]):
+            return
+        sent = []
+        try:
+            row = await self.db.run("deliver_id", load_solved_row, conv_id)
+            if row and await self.deliver_row(self.app.bot, row):
+                sent.append(conv_id)
+                await self.db.run("deliver_id", mark_sent, sent)
+                self.push_delivered += 1
+        finally:
+            self.release_ids([conv_id], sent)
+
+    async def deliver_solved(self, bot):
+        """Liefert alle gelösten, noch nicht gesendeten Antworten seitenweise aus;
+        pro Seite ein gemeinsames UPDATE für die zugestellten Zeilen."""
+        delivered = 0
+        after_id = 0
+        while True:
+            rows = await self.db.run("send_replies", load_solved_rows, after_id, DELIVERY_BATCH)
+            if not rows:
+                break
+            claimed = set(self.claim_ids([row["id"] for row in rows]))
+            sent = []
+            try:
+                sent = await self.delivery.deliver([row for row in rows if row["id"] in claimed],
+                                                   lambda row: self.deliver_row(bot, row))
+                if sent:
+                    await self.db.run("send_replies", mark_sent, sent)
+            finally:
+                self.release_ids(claimed, sent)
+            delivered += len(sent)
+            if len(rows) < DELIVERY_BATCH:
+                break
+            after_id = rows[-1]["id"]
+        if delivered:
+            self.sweep_delivered += delivered
+            if self.bus.enabled or self.callback_port is not None:
+                print(f"🧹 Sicherheits-Sweep hat {delivered} Antwort(en) ohne Meldung zugestellt.")
+        return delivered
+
+    async def deliver_row(self, bot, row) -> bool:
+        text = row["model_response"] or "(keine Antwort)"
+        try:
+            if row["telegram_message_id"]:
+                # Gestreamte Antwort: bestehende Nachricht mit dem Endstand überschreiben,
+                # was über 4096 Zeichen hinausgeht, folgt als weitere Nachrichten
+                first, *rest = split_text(text)
+                # Verglichen wird mit dem angezeigten Text – der Zwischenstand trägt noch STREAM_SUFFIX
+                if self.stream_state.get(row["id"]) != first:
+                    await self.edit_stream_message(bot, row["user_id"], row["telegram_message_id"], first)
+                for chunk in rest:
+                    await self.delivery.send(bot, row["user_id"], chunk)
+            else:
+                await self.delivery.send(bot, row["user_id"], text)
+            return True
+        except Exception as e:
+            print(f"❌ Fehler beim Senden an {row['user_id']}: {e}")
+            return False
+
+    async def send_stream_updates(self, context: ContextTypes.DEFAULT_TYPE):
+        """Zeigt Zwischenstände laufender Antworten an: erste Tokens als neue
+        Nachricht, jeder weitere Stand per edit_message_text. Plant sich selbst
+        neu – ohne laufende Antworten mit Backoff bis STREAM_IDLE_INTERVAL."""
+        self.stream_running = True
+        running = 0
+        try:
+            running = await self.deliver_partials(context.bot)
+        finally:
+            self.stream_running = False
+            self.stream_job = context.job_queue.run_once(self.send_stream_updates,
+                                                         self.stream_poller.record(running))
+
+    def wake_stream_updates(self):
+        """Neue Arbeit in Sicht: Backoff beenden und sofort abfragen."""
+        self.stream_poller.record(True)
+        if self.stream_running or self.stream_job is None:
+            return  # der laufende Durchgang plant sich danach mit kurzem Intervall neu
+        self.stream_job.schedule_removal()
+        self.stream_job = self.app.job_queue.run_once(self.send_stream_updates, 0)
+
+    async def deliver_partials(self, bot) -> int:
+        """Liefert die Anzahl laufender Antworten (mit oder ohne erste Tokens)."""
+        rows = await self.db.run("send_stream_updates", load_partial_rows)
 
         for row in rows:
+            if not row["model_response"]:
+                continue
+            # Wie der Endstand über in_flight beanspruchen – sonst überholt ein später
+            # Zwischenstand die fertige Antwort oder es entstehen zwei Nachrichten
+            conv_id = row["id"]
+            if not self.claim_ids([conv_id], defer=False):
+                continue
             try:
-                await context.bot.send_message(chat_id=row["user_id"], text=row["model_response"] or "(keine Antwort)")
-                cursor.execute("UPDATE conversations SET response_sent = 1 WHERE id = %s", (row["id"],))
-                conn.commit()
+                # Der Schnappschuss kann veraltet sein: Status direkt vor dem Senden prüfen
+                current = await self.db.run("send_stream_updates", load_partial_row, conv_id)
+                if current and current["model_response"]:
+                    await self.deliver_partial(bot, current)
             except Exception as e:
-                print(f"❌ Fehler beim Senden an {row['user_id']}: {e}")
+                print(f"❌ Fehler beim Streaming an {row['user_id']}: {e}")
+            finally:
+                self.release_ids([conv_id], [])
+        return len(rows)
 
-        cursor.close()
-        conn.close()
+    async def deliver_partial(self, bot, row):
+        shown = self.clip(row["model_response"] + STREAM_SUFFIX)
+        if self.stream_state.get(row["id"]) == shown:
+            return
+        if row["telegram_message_id"]:
+            await self.edit_stream_message(bot, row["user_id"], row["telegram_message_id"], shown)
+        else:
+            message = await self.delivery.send(bot, row["user_id"], shown)
+            await self.db.run("send_stream_updates", set_stream_message, row["id"], message.message_id)
+        self.stream_state[row["id"]] = shown
 
-    def start(self):
-        self.app = ApplicationBuilder().token(self.token).build()
+    async def edit_stream_message(self, bot, chat_id, message_id, text):
+        try:
+            await self.delivery.edit(bot, chat_id, message_id, self.clip(text))
+        except BadRequest as e:
+            # Telegram lehnt Edits ohne inhaltliche Änderung ab – das ist kein Fehler
+            if "not modified" not in str(e).lower():
+                raise
+
+    @staticmethod
+    def clip(text: str) -> str:
+        if len(text) <= TELEGRAM_MAX_LEN:
+            return text
+        return text[:TELEGRAM_MAX_LEN - len(STREAM_SUFFIX)] + STREAM_SUFFIX
+
+    def build_app(self, webhook=False):
+        builder = ApplicationBuilder().token(self.token).post_init(self.on_startup)
+        if webhook:
+            # Updates kommen über WebhookServer, kein eigener Updater
+            builder = builder.updater(None)
+        self.app = builder.build()
         self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
         self.app.add_handler(CommandHandler("start", self.handle_start))
 
         job_queue = self.app.job_queue
-        job_queue.run_repeating(self.send_replies, interval=5)
         job_queue.run_repeating(self.cleanup_confirmations, interval=60)
+        job_queue.run_repeating(self.report_db_latency, interval=DB_REPORT_INTERVAL)
+        job_queue.run_once(self.send_replies, 0)
+        self.stream_job = job_queue.run_once(self.send_stream_updates, 0)
+        return self.app
 
+    def start(self):
+        self.build_app()
         self.app.run_polling()
 
+    async def run_webhook(self, public_url=None, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+        """Webhook-Betrieb: eingebetteter HTTP-Server statt Long Polling.
+        Ist public_url gesetzt, wird der Webhook bei Telegram registriert.
+        Bewusst ein einziger Prozess: Rückfragen und Entprell-Puffer liegen im Speicher."""
+        secret = read_secret()
+        self.build_app(webhook=True)
+        server = WebhookServer(self.app, secret, host, port)
+        async with self.app:
+            await self.on_startup(self.app)  # post_init läuft nur bei run_polling/run_webhook von PTB
+            if public_url:
+                await self.app.bot.set_webhook(url=public_url, secret_token=secret,
+                                               allowed_updates=Update.ALL_TYPES)
+                print(f"🌐 Webhook registriert: {public_url}")
+            await self.app.start()
+            await server.start()
+            try:
+                await asyncio.Event().wait()
+            finally:
+                await server.stop()
+                if self.callback_server:
+                    await self.callback_server.stop()
+                await self.app.stop()
+
     async def handle_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("👋 Hallo! Sende mir einfach eine Nachricht, um zu starten.")
 
@@ -109,68 +425,76 @@ class TelegramConnector:
             del self.pending_confirmations[user_id]
             return
 
-        conn = mysql.connector.connect(**self.db_config)
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM user_profile WHERE user_id = %s", (user_id,))
-        profile = cursor.fetchone()
+        await self.handle_registered_message(update, user, msg_text, now)
+
+    async def handle_registered_message(self, update, user, msg_text, now):
+        user_id = user.id
+        profile, last = await self.db.run("handle_message", load_user_state, user_id)
 
         if not profile:
-            cursor.execute("""
-                INSERT INTO user_profile (user_id, first_name, last_name, messenger_id, last_active)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (
-                user_id,
-                user.first_name or "",
-                user.last_name or "",
-                user.username or None,
-                now,
-            ))
-            conn.commit()
+            await self.db.run("handle_message", register_user, user, now)
             await update.message.reply_text("👤 Dein Account wurde registriert. Bitte warte auf Freischaltung.")
-            cursor.close()
-            conn.close()
             return
 
         if profile["role"] == "disabled":
             await update.message.reply_text("🚫 Dein Zugriff wurde deaktiviert.")
-            cursor.close()
-            conn.close()
             return
 
         # Letzte Konversation prüfen
-        cursor.execute("""
-            SELECT id, dialog_id, timestamp FROM conversations
-            WHERE user_id = %s AND message_status = 'solved'
-            ORDER BY timestamp DESC LIMIT 1
-        """, (user_id,))
-        last = cursor.fetchone()
-
         if last:
             delta = now - last["timestamp"]
             if delta.total_seconds() > CONFIRM_TIMEOUT_MINUTES * 60:
                 self.pending_confirmations[user_id] = (msg_text, now, last["dialog_id"])
                 await update.message.reply_text("🤔 Möchtest Du unser letztes Gespräch fortsetzen? Antworte bitte mit ja oder nein.")
-                cursor.close()
-                conn.close()
                 return
 
         # Fortsetzung oder erster Eintrag
         dialog_id = last["dialog_id"] if last else None
-        await self.save_message(user_id, msg_text, dialog_id)
+        await self.queue_message(user_id, msg_text, dialog_id)
         #await update.message.reply_text("✅ Deine Nachricht wurde entgegengenommen.")
-        cursor.close()
-        conn.close()
+
+    async def queue_message(self, user_id, message, dialog_id):
+        """Sammelt schnell aufeinanderfolgende Nachrichten und speichert sie als
+        eine Anfrage, sobald DEBOUNCE_SECONDS Ruhe ist (höchstens DEBOUNCE_MAX_WAIT).
+        ja/nein-Antworten auf Rückfragen laufen nicht hier durch."""
+        if DEBOUNCE_SECONDS <= 0:
+            await self.save_message(user_id, message, dialog_id)
+            return
+        now = time.monotonic()
+        pending = self.pending_messages.get(user_id)
+        if pending is None:
+            pending = self.pending_messages[user_id] = PendingMessages(dialog_id, now)
+        else:
+            pending.timer.cancel()
+        pending.messages.append(message)
+        self.debounced_in += 1
+
+        delay = min(DEBOUNCE_SECONDS, pending.first_at + DEBOUNCE_MAX_WAIT - now)
+        if delay <= 0:
+            await self.flush_messages(user_id)
+        else:
+            pending.timer = asyncio.create_task(self.flush_later(user_id, delay))
+
+    async def flush_later(self, user_id, delay):
+        await asyncio.sleep(delay)
+        try:
+            await self.flush_messages(user_id)
+        except Exception as e:
+            print(f"❌ Fehler beim Speichern der Nachrichten von {user_id}: {e}")
+
+    async def flush_messages(self, user_id):
+        # Erst aus dem Puffer nehmen: neue Nachrichten beginnen ab hier ein neues Fenster
+        pending = self.pending_messages.pop(user_id, None)
+        if pending is None:
+            return
+        self.debounced_out += 1
+        await self.save_message(user_id, "\n".join(pending.messages), pending.dialog_id)
 
     async def save_message(self, user_id, message, dialog_id):
-        conn = mysql.connector.connect(**self.db_config)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO conversations (user_id, user_message, message_status, timestamp, dialog_id)
-            VALUES (%s, %s, 'new', %s, %s)
-        """, (user_id, message, datetime.now(), dialog_id))
-        conn.commit()
-        cursor.close()
-        conn.close()
+        conv_id = await self.db.run("save_message", insert_message, user_id, message, dialog_id)
+        # Nach dem Commit: Watchdog sofort verteilen lassen
+        await asyncio.to_thread(self.bus.publish, CONVERSATION_NEW, id=conv_id)
+        self.wake_stream_updates()
 
     async def cleanup_confirmations(self, context: ContextTypes.DEFAULT_TYPE):
         now = datetime.now()
@@ -179,6 +503,17 @@ class TelegramConnector:
         for uid in expired:
             del self.pending_confirmations[uid]
 
+    async def report_db_latency(self, context: ContextTypes.DEFAULT_TYPE):
+        report = self.db.format_report()
+        if report:
+            print(report)
+        if self.debounced_in:
+            saved = self.debounced_in - self.debounced_out - sum(len(p.messages) for p in self.pending_messages.values())
+            print(f"🧵 Entprellung: {self.debounced_in} Nachricht(en) → {self.debounced_out} Anfrage(n), "
+                  f"{saved} LLM-Aufruf(e) gespart")
+        if self.push_delivered or self.sweep_delivered:
+            print(f"📬 Zustellung: {self.push_delivered} per Meldung, {self.sweep_delivered} per Sweep")
+
     async def send_test_message(self):
         await self.app.initialize()
         await self.app.bot.send_message(chat_id=self.admin_id, text="✅ Telegram-Verbindung erfolgreich (Testnachricht).")
@@ -190,10 +525,22 @@ if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Telegram Bot Connector mit Datenbankintegration")
     parser.add_argument("--test", action="store_true", help="Sende Testnachricht an Admin")
+    parser.add_argument("--webhook", action="store_true", help="Updates per Webhook statt Long Polling empfangen")
+    parser.add_argument("--webhook-url", help="Öffentliche HTTPS-URL, die bei Telegram registriert wird")
+    parser.add_argument("--host", default=WEBHOOK_HOST, help="Lauschadresse des Webhook-Servers")
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT, help="Port des Webhook-Servers")
+    parser.add_argument("--callback-port", type=int, help="Port für den Rückruf-Endpunkt /solved (SOLVED_CALLBACK)")
     args = parser.parse_args()
 
-    connector = TelegramConnector(token=read_token(), admin_id=ADMIN_ID)
     if args.test:
+        connector = TelegramConnector(token=read_token(), admin_id=ADMIN_ID)
         asyncio.run(connector.send_test_message())
+    elif args.webhook:
+        connector = TelegramConnector(token=read_token(), admin_id=ADMIN_ID, callback_port=args.callback_port)
+        try:
+            asyncio.run(connector.run_webhook(args.webhook_url, args.host, args.port))
+        except KeyboardInterrupt:
+            pass
     else:
+        connector = TelegramConnector(token=read_token(), admin_id=ADMIN_ID, callback_port=args.callback_port)
         connector.start()
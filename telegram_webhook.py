@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# Filename: telegram_webhook.py
+"""Webhook-Empfang für den Telegram-Connector (aiohttp).
+
+Telegram schickt jedes Update als POST. Der Server prüft das geheime Token
+(Header X-Telegram-Bot-Api-Secret-Token), wandelt das JSON in ein Update und
+legt es in die update_queue der python-telegram-bot-Application – die Antwort
+an Telegram geht sofort raus, die Handler laufen danach.
+
+Lokal testbar mit tools/post_update.py.
+
+Zusätzlich nimmt POST /solved {"id": ...} die Meldung eines Agents entgegen,
+dass eine Antwort fertig ist (SOLVED_CALLBACK). Die Meldung ist nur ein
+Hinweis – ausgeliefert wird, was in der DB steht – und braucht daher kein Secret.
+"""
+import hmac
+import json
+import logging
+import os
+from pathlib import Path
+
+from aiohttp import web
+from telegram import Update
+
+WEBHOOK_SECRET_FILE = "private/.webhook_secret"
+WEBHOOK_HOST = "127.0.0.1"  # hinter einem Reverse-Proxy mit TLS
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "/telegram"
+SOLVED_PATH = "/solved"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def read_secret(path=WEBHOOK_SECRET_FILE) -> str:
+    """Secret aus WEBHOOK_SECRET oder der Datei; Telegram erlaubt A-Z, a-z, 0-9, _ und -."""
+    secret = os.environ.get("WEBHOOK_SECRET")
+    if not secret and Path(path).exists():
+        secret = Path(path).read_text().strip()
+    if not secret:
+        raise FileNotFoundError(f"Webhook-Secret fehlt (WEBHOOK_SECRET oder {path}).")
+    return secret
+
+
+class WebhookServer:
+    def __init__(self, application, secret, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                 on_solved=None, accept_updates=True):
+        self.application = application
+        self.secret = secret
+        self.host = host
+        self.port = port
+        self.path = path
+        self.on_solved = on_solved  # Funktion(conv_id), läuft in der Eventloop
+        self.accept_updates = accept_updates
+        self.runner = None
+        self.received = 0
+        self.rejected = 0
+
+    async def handle_update(self, request):
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token, self.secret):
+            self.rejected += 1
+            return web.Response(status=403)
+        try:
+            data = json.loads(await request.read())
+            update = Update.de_json(data, self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logging.warning(f"⚠️ Ungültiges Update verworfen: {e}")
+            return web.Response(status=400)
+        await self.application.update_queue.put(update)
+        self.received += 1
+        return web.Response()
+
+    async def handle_solved(self, request):
+        try:
+            conv_id = int((await request.json())["id"])
+        except (ValueError, TypeError, KeyError):
+            return web.Response(status=400)
+        self.on_solved(conv_id)
+        return web.Response(status=204)
+
+    async def handle_health(self, request):
+        return web.json_response({"received": self.received, "rejected": self.rejected,
+                                  "queued": self.application.update_queue.qsize()})
+
+    async def start(self):
+        app = web.Application()
+        if self.accept_updates:
+            app.router.add_post(self.path, self.handle_update)
+        if self.on_solved:
+            app.router.add_post(SOLVED_PATH, self.handle_solved)
+        app.router.add_get("/healthz", self.handle_health)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        paths = [p for p, on in ((self.path, self.accept_updates), (SOLVED_PATH, self.on_solved)) if on]
+        logging.info(f"🌐 HTTP-Server lauscht auf http://{self.host}:{self.port} ({', '.join(paths)})")
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# Filename: telemetry.py
+"""Hintergrund-Sampler für Agent-Telemetrie ohne Prozessstarts pro Abfrage.
+
+Modelle kommen über die Ollama-HTTP-API (/api/tags, /api/ps), CPU/RAM über
+psutil und GPU-Werte über ein austauschbares Backend (pynvml, nvidia-smi oder
+keins). Ein Thread sammelt alle SAMPLE_INTERVAL Sekunden und legt einen
+Schnappschuss ab; Statusschreiber und Agent lesen nur noch diesen. Statische
+Werte (RAM gesamt, GPU gesamt, Modellliste) werden zwischengespeichert und nur
+selten neu gelesen; Änderungen erhöhen eine Versionsnummer.
+"""
+import logging
+import shutil
+import subprocess
+import threading
+import time
+
+import psutil
+import requests
+
+OLLAMA_BASE_URL = "http://localhost:11434"
+SAMPLE_INTERVAL = 3  # Sekunden zwischen zwei Messungen
+TAGS_REFRESH_INTERVAL = 60  # Sekunden; Modellliste ändert sich selten
+GPU_SAMPLE_INTERVAL = 5  # Sekunden; nvidia-smi ist ein eigener Prozess
+HTTP_TIMEOUT = 3
+
+
+# === CPU/RAM-Backend ===
+class PsutilBackend:
+    def __init__(self):
+        self.ram_total_mb = psutil.virtual_memory().total // 1024 // 1024
+        psutil.cpu_percent(interval=None)  # erster Aufruf liefert immer 0.0
+
+    def sample(self) -> dict:
+        return {
+            "cpu": psutil.cpu_percent(interval=None),
+            "mem": psutil.virtual_memory().percent,
+            "ram_total_mb": self.ram_total_mb,
+        }
+
+
+# === GPU-Backends ===
+class NullGpuBackend:
+    name = "none"
+
+    def sample(self):
+        return None, None, None
+
+
+class NvmlGpuBackend:
+    """Liest die erste GPU direkt über NVML – kein Prozessstart."""
+    name = "nvml"
+
+    def __init__(self):
+        import pynvml  # optional
+        pynvml.nvmlInit()
+        self.nvml = pynvml
+        self.handle = pynvml.nvmlDeviceGetHandleByIndex(0)
+        self.total_mb = pynvml.nvmlDeviceGetMemoryInfo(self.handle).total // 1024 // 1024
+
+    def sample(self):
+        util = self.nvml.nvmlDeviceGetUtilizationRates(self.handle).gpu
+        used_mb = self.nvml.nvmlDeviceGetMemoryInfo(self.handle).used // 1024 // 1024
+        return float(util), int(used_mb), int(self.total_mb)
+
+
+class NvidiaSmiGpuBackend:
+    """Fallback über nvidia-smi, höchstens alle GPU_SAMPLE_INTERVAL Sekunden."""
+    name = "nvidia-smi"
+
+    def __init__(self, interval=GPU_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.last = (None, None, None)
+        self.sampled_at = None
+
+    def sample(self):
+        now = time.monotonic()
+        if self.sampled_at is not None and now - self.sampled_at < self.interval:
+            return self.last
+        self.sampled_at = now
+        try:
+            out = subprocess.check_output(["nvidia-smi", "--query-gpu=utilization.gpu,memory.used,memory.total",
+                                           "--format=csv,noheader,nounits"], text=True, timeout=5)
+            util_str, used_str, total_str = out.strip().splitlines()[0].split(", ")
+            self.last = (float(util_str), int(used_str), int(total_str))
+        except Exception as e:
+            logging.debug(f"GPU-Abfrage fehlgeschlagen: {e}")
+            self.last = (None, None, None)
+        return self.last
+
+
+def detect_gpu_backend():
+    try:
+        return NvmlGpuBackend()
+    except Exception:
+        pass
+    if shutil.which("nvidia-smi"):
+        return NvidiaSmiGpuBackend()
+    return NullGpuBackend()
+
+
+# === Formatierung wie `ollama list` / `ollama ps` ===
+def format_size(size_bytes) -> str:
+    size = float(size_bytes or 0)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1000:
+            return f"{size:.0f} {unit}"
+        size /= 1000
+    return f"{size:.1f} TB"
+
+
+def format_model_list(models) -> str:
+    return "\n".join(
+        f"{m['name']}\t{(m.get('digest') or '')[:12]}\t{format_size(m.get('size'))}\t{m.get('modified_at', '')}"
+        for m in sorted(models, key=lambda m: m["name"])
+    )
+
+
+def format_running(models) -> str:
+    # Erste Spalte = Modellname; agent_assignment.loaded_models liest genau diese
+    return "\n".join(
+        f"{m['name']}\t{(m.get('digest') or '')[:12]}\t{format_size(m.get('size'))}\t"
+        f"VRAM {format_size(m.get('size_vram'))}\t{m.get('expires_at', '')}"
+        for m in models
+    )
+
+
+# === Sampler ===
+class TelemetrySampler:
+    def __init__(self, base_url=OLLAMA_BASE_URL, interval=SAMPLE_INTERVAL, gpu_backend=None, cpu_backend=None):
+        self.base_url = base_url
+        self.interval = interval
+        self.gpu = gpu_backend or detect_gpu_backend()
+        self.cpu = cpu_backend or PsutilBackend()
+        self.model_info = ""
+        self.model_names = set()
+        self.model_info_version = 0  # steigt bei jeder Änderung der Modellliste
+        self.tags_loaded_at = None
+        self.current = None
+        self.lock = threading.Lock()
+        self.started = False
+
+    def fetch_json(self, path) -> dict:
+        response = requests.get(f"{self.base_url}{path}", timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def refresh_tags(self, force=False):
+        now = time.monotonic()
+        if not force and self.tags_loaded_at is not None and now - self.tags_loaded_at < TAGS_REFRESH_INTERVAL:
+            return
+        models = self.fetch_json("/api/tags").get("models", [])
+        model_info = format_model_list(models)
+        if model_info != self.model_info:
+            self.model_info = model_info
+            self.model_names = {m["name"] for m in models}
+            self.model_info_version += 1
+            logging.info(f"📦 Modellliste geändert: {len(models)} Modelle")
+        self.tags_loaded_at = now
+
+    def sample(self) -> dict:
+        """Eine Messung; Fehler der Ollama-API landen wie früher in runtime_status."""
+        snapshot = self.cpu.sample()
+        snapshot["gpu_util"], snapshot["gpu_used"], snapshot["gpu_total"] = self.gpu.sample()
+        try:
+            running = self.fetch_json("/api/ps").get("models", [])
+            # Unbekanntes Modell geladen → Liste sofort neu holen
+            self.refresh_tags(force=any(m["name"] not in self.model_names for m in running))
+            snapshot["runtime_status"] = format_running(running)
+            snapshot["loaded_models"] = [m["name"] for m in running]
+            snapshot["active_model"] = running[0]["name"] if running else "-"
+        except Exception as e:
+            snapshot["runtime_status"] = f"Fehler: {e}"
+            snapshot["loaded_models"] = []
+            snapshot["active_model"] = "-"
+        snapshot["model_info"] = self.model_info
+        snapshot["model_info_version"] = self.model_info_version
+        snapshot["sampled_at"] = time.time()
+        with self.lock:
+            self.current = snapshot
+        return snapshot
+
+    def snapshot(self) -> dict:
+        """Letzter Schnappschuss; vor dem ersten Thread-Durchlauf wird direkt gemessen."""
+        with self.lock:
+            current = self.current
+        return current if current is not None else self.sample()
+
+    def run_forever(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                logging.error(f"Fehler beim Telemetrie-Sampling: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        if not self.started:
+            self.started = True
+            logging.info(f"📈 Telemetrie gestartet (GPU-Backend: {self.gpu.name})")
+            threading.Thread(target=self.run_forever, daemon=True).start()
+        return self
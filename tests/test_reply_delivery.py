@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# Filename: test_reply_delivery.py
+"""Flood-Sperre (RetryAfter) gilt für alle Chats des Bots."""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from telegram.error import RetryAfter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from reply_delivery import ReplyDelivery
+
+FLOOD_WAIT = 1  # Sekunden
+
+
+class FloodBot:
+    """Erster Versand löst eine Flood-Sperre aus, danach geht alles durch."""
+
+    def __init__(self):
+        self.calls = []  # (chat_id, Zeitpunkt, ok)
+        self.flooded = False
+
+    async def send_message(self, chat_id, text):
+        now = time.monotonic()
+        if not self.flooded:
+            self.flooded = True
+            self.calls.append((chat_id, now, False))
+            raise RetryAfter(FLOOD_WAIT)
+        self.calls.append((chat_id, now, True))
+        return text
+
+
+def test_two_chats_share_one_flood_wait():
+    bot = FloodBot()
+    delivery = ReplyDelivery()
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(delivery.send(bot, 1, "a"), delivery.send(bot, 2, "b"))
+        return started
+
+    started = asyncio.run(run())
+    sent = [(chat_id, at) for chat_id, at, ok in bot.calls if ok]
+    assert sorted(chat_id for chat_id, _ in sent) == [1, 2]
+    # Auch der Chat ohne eigene 429 wartet die Sperre ab
+    assert all(at - started >= FLOOD_WAIT * 0.9 for _, at in sent)
+    assert delivery.retries == 1
@@ -34,6 +34,9 @@ CREATE TABLE IF NOT EXISTS prompts (
     language VARCHAR(10) DEFAULT 'de',
     model VARCHAR(100),
     is_active TINYINT(1) DEFAULT TRUE,
+    cache_enabled TINYINT(1) DEFAULT FALSE,
+    cache_ttl_s INT DEFAULT 3600,
+    semantic_threshold FLOAT DEFAULT NULL,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 );
@@ -63,16 +66,21 @@ CREATE TABLE IF NOT EXISTS conversations (
     system_prompt_id INT,
     pre_prompt_id INT,
     post_prompt_id INT,
-    message_status ENUM('new', 'queued', 'progress', 'solved') DEFAULT 'new';
+    message_status ENUM('new', 'queued', 'progress', 'solved', 'error') DEFAULT 'new',
     agent VARCHAR(50),
     metric ENUM('low', 'normal', 'high', 'critical') DEFAULT 'normal',
     dialog_id VARCHAR(64),
     locked_by_agent VARCHAR(50),
     locked_at DATETIME,
+    claim_token VARCHAR(64),
     processing_started_at DATETIME,
     processing_finished_at DATETIME,
     failure_reason TEXT,
-    response_sent TINYINT(1) DEFAULT 0,
+    response_sent TINYINT(1) NOT NULL DEFAULT 0,
+    response_updated_at DATETIME,
+    telegram_message_id BIGINT(20),
+    user_tokens INT,
+    response_tokens INT,
     FOREIGN KEY (user_id) REFERENCES user_profile(user_id) ON DELETE SET NULL,
     FOREIGN KEY (associated_script_id) REFERENCES scripts(id) ON DELETE SET NULL,
     FOREIGN KEY (system_prompt_id) REFERENCES prompts(id) ON DELETE SET NULL,
@@ -83,6 +91,9 @@ CREATE TABLE IF NOT EXISTS conversations (
 CREATE INDEX idx_conversations_status ON conversations(message_status);
 CREATE INDEX idx_conversations_dialog_id ON conversations(dialog_id);
 CREATE INDEX idx_conversations_user_timestamp ON conversations(user_id, timestamp DESC);
+CREATE INDEX idx_conversations_claim ON conversations(message_status, agent, locked_by_agent, timestamp);
+CREATE INDEX idx_conversations_claim_token ON conversations(claim_token);
+CREATE INDEX idx_conversations_delivery ON conversations(message_status, response_sent, id);
 
 CREATE TABLE IF NOT EXISTS conversation_log (
     id BIGINT(20) AUTO_INCREMENT PRIMARY KEY,
@@ -123,12 +134,33 @@ CREATE TABLE IF NOT EXISTS script_usage (
     FOREIGN KEY (script_id) REFERENCES scripts(id)
 );
 
+CREATE TABLE IF NOT EXISTS response_cache (
+    cache_key CHAR(64) PRIMARY KEY,
+    model VARCHAR(100),
+    prompt_id INT,
+    response MEDIUMTEXT,
+    hits INT DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    expires_at DATETIME NOT NULL,
+    INDEX idx_response_cache_expires (expires_at)
+);
+
+CREATE TABLE IF NOT EXISTS dialog_summary (
+    dialog_id VARCHAR(64) PRIMARY KEY,
+    summary TEXT,
+    summary_tokens INT,
+    covered_until_id BIGINT(20),
+    model_used VARCHAR(50),
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
 CREATE TABLE IF NOT EXISTS agent_log (
     id BIGINT(20) AUTO_INCREMENT PRIMARY KEY,
     agent_name VARCHAR(100) NOT NULL,
     log_type ENUM('startup', 'status', 'assignment', 'warning', 'info', 'error') NOT NULL,
     conversation_id BIGINT(20) NULL,
     message TEXT,
+    model_info TEXT,
     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE SET NULL
 );
@@ -169,6 +201,11 @@ CREATE TABLE IF NOT EXISTS model_catalog (
     tags TEXT,
     is_active TINYINT(1) DEFAULT TRUE,
     notes TEXT,
+    preload TINYINT(1) DEFAULT TRUE,
+    keep_alive_min_s INT DEFAULT 300,
+    keep_alive_max_s INT DEFAULT 3600,
+    last_load_ms INT DEFAULT NULL,
+    context_tokens INT DEFAULT 4096,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     UNIQUE (model_name, version)
@@ -1,25 +1,19 @@
 #!/usr/bin/env python3
 # Filename: agent_status_monitor.py
 
-import mysql.connector
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from db_access import get_connection
 import time
 from datetime import datetime
 from rich.console import Console
 from rich.table import Table
 from rich.live import Live
 
-ACCESS_FILE = "../private/.mariadb_access"
 INTERVAL = 1  # Sekunden
 
-def read_access():
-    cfg = {}
-    with open(ACCESS_FILE) as f:
-        for line in f:
-            if "=" in line:
-                key, value = line.strip().split("=", 1)
-                cfg[key.strip()] = value.strip()
-    return cfg
-
 def create_agent_table(cursor):
     cursor.execute("""
         SELECT agent_name, hostname, last_seen, performance_class,
@@ -64,14 +58,7 @@ def create_agent_table(cursor):
     return table
 
 def monitor_agents():
-    cfg = read_access()
-    conn = mysql.connector.connect(
-        host=cfg["host"],
-        user=cfg["user"],
-        password=cfg["password"],
-        database=cfg["database"],
-        port=int(cfg.get("port", 3306))
-    )
+    conn = get_connection()
 
     console = Console()
     console.print("[bold green]▶ Live Agent-Status-Monitor wird gestartet... (STRG+C zum Beenden)[/bold green]")
@@ -1,22 +1,12 @@
 #!/usr/bin/env python3
-import mysql.connector
-from configparser import ConfigParser
+import sys
+from pathlib import Path
 
-def load_db_config():
-    config = ConfigParser()
-    config.read("../private/.mariadb_access")
-    client = config["client"]
-    return {
-        "host": client.get("host", "127.0.0.1"),
-        "port": int(client.get("port", 3306)),
-        "user": client.get("user"),
-        "password": client.get("password"),
-        "database": client.get("database")
-    }
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from db_access import get_connection
 
 def main():
-    cfg = load_db_config()
-    conn = mysql.connector.connect(**cfg)
+    conn = get_connection()
     cursor = conn.cursor()
 
     table = input("🔍 Welche Tabelle möchtest du anzeigen? ").strip()
@@ -1,32 +1,19 @@
 #!/usr/bin/env python3
 # Filename: live_log.py
-import mysql.connector
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from db_access import get_connection
 from datetime import datetime
 import time
 from rich import print
 from rich.console import Console
 
-ACCESS_FILE = "../private/.mariadb_access"
 INTERVAL = 3  # Sekunden
 
-def read_access():
-    cfg = {}
-    with open(ACCESS_FILE) as f:
-        for line in f:
-            if "=" in line:
-                key, value = line.strip().split("=", 1)
-                cfg[key.strip()] = value.strip()
-    return cfg
-
 def live_log():
-    cfg = read_access()
-    conn = mysql.connector.connect(
-        host=cfg["host"],
-        user=cfg["user"],
-        password=cfg["password"],
-        database=cfg["database"],
-        port=int(cfg.get("port", 3306))
-    )
+    conn = get_connection()
     cursor = conn.cursor()
 
     last_ts = {
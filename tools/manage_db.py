@@ -2,16 +2,29 @@
 # Filename: setup_ollama_db.py
 # Version : 1.5
 import os
+import sys
 import subprocess
 import mysql.connector
-from configparser import ConfigParser
 from getpass import getpass
 from pathlib import Path
 import re
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import db_access
+
 VERSION = "1.5"
-ACCESS_FILE = "../private/.mariadb_access"
+ACCESS_FILE = db_access.ACCESS_FILE
 SCHEMA_FILE = "SQL_Tables.sql"
+# Datenanpassungen für bestehende Datenbanken; jeder Schritt ist wiederholbar
+MIGRATIONS = [
+    ("conversations.response_sent: NULL → 0",
+     "UPDATE conversations SET response_sent = 0 WHERE response_sent IS NULL"),
+    ("conversations.response_sent: NOT NULL DEFAULT 0",
+     "ALTER TABLE conversations MODIFY COLUMN response_sent TINYINT(1) NOT NULL DEFAULT 0"),
+    ("conversations.message_status: Status 'error'",
+     "ALTER TABLE conversations MODIFY COLUMN message_status "
+     "ENUM('new', 'queued', 'progress', 'solved', 'error') DEFAULT 'new'"),
+]
 COLOR = {
     "GREEN": "\033[0;32m",
     "RED": "\033[0;31m",
@@ -34,19 +47,11 @@ def check_service():
         exit(1)
 
 def parse_access():
-    config = ConfigParser()
-    config.read(ACCESS_FILE)
-    client = config["client"]
-    if not client.get("user") or not client.get("database"):
+    cfg = db_access.load_db_config(ACCESS_FILE)
+    if not cfg["user"] or not cfg["database"]:
         print(colored(f"❌ DB‑Zugangsdaten unvollständig. Bitte {ACCESS_FILE} prüfen.", "RED"))
         exit(1)
-    return {
-        "host": client.get("host", "127.0.0.1"),
-        "port": int(client.get("port", 3306)),
-        "user": client.get("user"),
-        "password": client.get("password"),
-        "database": client.get("database")
-    }
+    return cfg
 
 def exec_sql(cfg, sql):
     try:
@@ -85,6 +90,19 @@ def add_column_if_not_exists(cfg, table, column, coltype):
     cursor.close()
     conn.close()
 
+def run_migrations(cfg):
+    conn = mysql.connector.connect(**cfg)
+    cursor = conn.cursor()
+    for description, stmt in MIGRATIONS:
+        try:
+            cursor.execute(stmt)
+            conn.commit()
+            print(colored(f"✔ Migration: {description}", "GREEN"))
+        except mysql.connector.Error as err:
+            print(colored(f"❌ Migration fehlgeschlagen ({description}): {err}", "RED"))
+    cursor.close()
+    conn.close()
+
 def create_or_update_tables(cfg):
     print(colored(f"→ Tabellen werden erstellt oder aktualisiert (Version {VERSION})...", "GREEN"))
     exec_sql(cfg, read_schema_sql())
@@ -112,6 +130,8 @@ def create_or_update_tables(cfg):
                 col_name, definition = match.groups()
                 add_column_if_not_exists(cfg, table_name, col_name, definition)
 
+    run_migrations(cfg)
+
 def wipe_tables(cfg):
     print(colored("[WARNUNG] Alle Tabellen werden geleert (DELETE)...", "RED"))
     exclude_tables = set()  # Optional
@@ -332,6 +352,8 @@ def sync_schema(cfg):
 
     cursor.close()
     conn.close()
+    # Der Typvergleich oben sieht keine geänderte NULL-Fähigkeit
+    run_migrations(cfg)
 
 def compare_schema(cfg):
     print(colored("→ Starte SCHEMA-VERGLEICH (read-only)…", "YELLOW"))
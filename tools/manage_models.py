@@ -1,24 +1,17 @@
 #!/usr/bin/env python3
 # Filename: manage_models.py
-import mysql.connector
-import configparser
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from db_access import get_connection
 from tabulate import tabulate
 import textwrap
 
-ACCESS_FILE = "../private/.mariadb_access"
 TABLE = "model_catalog"
 
 def connect_db():
-    config = configparser.ConfigParser()
-    config.read(ACCESS_FILE)
-    creds = config['client']
-    return mysql.connector.connect(
-        host=creds['host'],
-        port=int(creds.get('port', 3306)),
-        user=creds['user'],
-        password=creds['password'],
-        database=creds['database']
-    )
+    return get_connection()
 
 def wrap_text(text, width=60):
     if isinstance(text, str) and len(text) > width:
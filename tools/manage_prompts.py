@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 # Filename: manage_prompts.py
-import mysql.connector
-from configparser import ConfigParser
 from getpass import getpass
+import sys
 from pathlib import Path
 
-ACCESS_FILE = "../private/.mariadb_access"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import db_access
+from db_access import get_connection
+
+ACCESS_FILE = db_access.ACCESS_FILE
 TABLE = "prompts"
 
 COLOR = {
@@ -22,19 +25,7 @@ def load_db_config():
     if not Path(ACCESS_FILE).exists():
         print(colored(f"❌ Zugriffskonfig {ACCESS_FILE} fehlt.", "RED"))
         exit(1)
-    config = ConfigParser()
-    config.read(ACCESS_FILE)
-    client = config["client"]
-    return {
-        "host": client.get("host", "127.0.0.1"),
-        "port": int(client.get("port", 3306)),
-        "user": client.get("user"),
-        "password": client.get("password"),
-        "database": client.get("database")
-    }
-
-def get_connection(cfg):
-    return mysql.connector.connect(**cfg)
+    return db_access.load_db_config(ACCESS_FILE)
 
 def create_prompt(cfg):
     import tempfile
@@ -63,7 +54,7 @@ def create_prompt(cfg):
     language = input("Sprache (z. B. de/en) [de]: ").strip() or "de"
     model = input("Bevorzugtes Modell (optional): ").strip()
 
-    conn = get_connection(cfg)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(f"""
         INSERT INTO {TABLE} (name, role, version, description, tags, content, language, model)
@@ -83,7 +74,7 @@ def create_prompt(cfg):
     print(colored("✅ Prompt erstellt oder aktualisiert.", "GREEN"))
 
 def list_prompts(cfg):
-    conn = get_connection(cfg)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(f"SELECT id, name, role, version, LEFT(description, 60) AS description FROM {TABLE} ORDER BY id;")
     print("\n📋 Verfügbare Prompts:")
@@ -96,7 +87,7 @@ def view_prompt(cfg):
     pid = input("🔍 Prompt-ID zum Anzeigen: ")
     if not pid.isdigit():
         return
-    conn = get_connection(cfg)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(f"SELECT * FROM {TABLE} WHERE id = %s", (pid,))
     result = cursor.fetchone()
@@ -131,7 +122,7 @@ def edit_field(cfg):
     except (ValueError, IndexError):
         return
 
-    conn = get_connection(cfg)
+    conn = get_connection()
     cursor = conn.cursor()
 
     if field == "content":
@@ -174,7 +165,7 @@ def delete_prompt(cfg):
     confirm = input("⚠️ Sicher? (y/N): ")
     if confirm.lower() != "y":
         return
-    conn = get_connection(cfg)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(f"DELETE FROM {TABLE} WHERE id = %s", (pid,))
     conn.commit()
@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 # Filename: user_admin.py
 
-import mysql.connector
-from configparser import ConfigParser
+import sys
 from pathlib import Path
 
-ACCESS_FILE = "../private/.mariadb_access"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import db_access
+from db_access import get_connection
+
+ACCESS_FILE = db_access.ACCESS_FILE
 TABLE = "user_profile"
 
 COLOR = {
@@ -22,22 +25,10 @@ def load_db_config():
     if not Path(ACCESS_FILE).exists():
         print(colored(f"❌ Zugriffskonfig {ACCESS_FILE} fehlt.", "RED"))
         exit(1)
-    config = ConfigParser()
-    config.read(ACCESS_FILE)
-    client = config["client"]
-    return {
-        "host": client.get("host", "127.0.0.1"),
-        "port": int(client.get("port", 3306)),
-        "user": client.get("user"),
-        "password": client.get("password"),
-        "database": client.get("database")
-    }
-
-def get_connection(cfg):
-    return mysql.connector.connect(**cfg)
+    return db_access.load_db_config(ACCESS_FILE)
 
 def list_users(cfg):
-    conn = get_connection(cfg)
+    conn = get_connection()
     cursor = conn.cursor()
 
     print("\n🟢 Aktive Benutzer:")
@@ -69,7 +60,7 @@ def view_user(cfg):
     uid = input("🔍 user_id anzeigen: ")
     if not uid.isdigit():
         return
-    conn = get_connection(cfg)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(f"SELECT * FROM {TABLE} WHERE user_id = %s", (uid,))
     for desc, val in zip(cursor.column_names, cursor.fetchone() or []):
@@ -97,7 +88,7 @@ def edit_user(cfg):
         value = input(f"📝 Neuer Wert für {field}: ")
     except (ValueError, IndexError):
         return
-    conn = get_connection(cfg)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         f"UPDATE {TABLE} SET {field} = %s WHERE user_id = %s",
@@ -115,7 +106,7 @@ def delete_user(cfg):
     confirm = input("⚠️ Sicher? (y/N): ")
     if confirm.lower() != "y":
         return
-    conn = get_connection(cfg)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(f"DELETE FROM {TABLE} WHERE user_id = %s", (uid,))
     conn.commit()
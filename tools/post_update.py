@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Filename: post_update.py
+"""Schickt aufgezeichnete Telegram-Updates (JSON) an den lokalen Webhook.
+
+Beispiele:
+  python tools/post_update.py update.json
+  python tools/post_update.py updates.jsonl --count 50   # jede Zeile ein Update
+  python tools/post_update.py --text "hallo" --user 123   # synthetisches Update
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from telegram_webhook import SECRET_HEADER, WEBHOOK_PATH, WEBHOOK_PORT, read_secret
+
+
+def load_updates(path):
+    text = Path(path).read_text(encoding="utf-8")
+    try:
+        data = json.loads(text)
+    except ValueError:
+        # JSON Lines: ein Update pro Zeile
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    return data if isinstance(data, list) else [data]
+
+
+def synthetic_update(update_id, user_id, text):
+    now = int(time.time())
+    user = {"id": user_id, "is_bot": False, "first_name": "Test"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": now,
+            "chat": {"id": user_id, "type": "private", "first_name": "Test"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aufgezeichnete Updates an den Webhook senden")
+    parser.add_argument("file", nargs="?", help="JSON-Datei (Objekt, Liste oder eine Zeile pro Update)")
+    parser.add_argument("--text", help="Statt Datei: synthetisches Update mit diesem Text")
+    parser.add_argument("--user", type=int, default=1, help="Nutzer-ID für --text")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    parser.add_argument("--count", type=int, default=1, help="Alle Updates so oft wiederholen")
+    args = parser.parse_args()
+
+    if args.text:
+        updates = [synthetic_update(int(time.time()), args.user, args.text)]
+    elif args.file:
+        updates = load_updates(args.file)
+    else:
+        parser.error("Datei oder --text angeben")
+
+    headers = {SECRET_HEADER: read_secret(), "Content-Type": "application/json"}
+    session = requests.Session()
+    sent = failed = 0
+    started = time.monotonic()
+    for _ in range(args.count):
+        for update in updates:
+            response = session.post(args.url, data=json.dumps(update), headers=headers, timeout=10)
+            if response.ok:
+                sent += 1
+            else:
+                failed += 1
+                print(f"❌ Update {update.get('update_id')}: HTTP {response.status_code}")
+    duration = time.monotonic() - started
+    print(f"✅ {sent} Update(s) gesendet, {failed} Fehler, {sent / duration if duration else 0:.0f}/s")
+
+
+if __name__ == "__main__":
+    main()
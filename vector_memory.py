@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# Filename: vector_memory.py
+"""Langzeitgedächtnis pro Nutzer: Vektorindex früherer Runden.
+
+Jede gelöste Runde (Nutzertext + Antwort) wird eingebettet und an die Dateien
+des Nutzers angehängt: Vektoren als float32-Rohdaten (per np.memmap gelesen),
+dazu eine JSON-Zeile mit Ausschnitt und IDs. Bei einer neuen Anfrage liefert
+eine flache Kosinus-Suche die ähnlichsten Runden aus früheren Dialogen, die
+der Agent als kurze Ausschnitte in den Systemprompt einfügt – unabhängig von
+der 15-Minuten-Grenze der Dialoge.
+
+Embeddings kommen von Ollama (/api/embed); HashEmbedder ist ein
+deterministischer Ersatz ohne Modell (Tests, Agents ohne Embedding-Modell).
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import requests
+
+MEMORY_DIR = Path(__file__).resolve().parent / "private" / "vector_memory"
+OLLAMA_EMBED_URL = "http://localhost:11434/api/embed"
+EMBED_MODEL = "nomic-embed-text"
+HASH_DIMENSIONS = 256
+SNIPPET_CHARS = 400  # so viel Text pro Runde wird gespeichert und eingefügt
+MAX_OPEN_INDEXES = 64  # gleichzeitig gemappte Nutzerdateien
+EMBED_TIMEOUT = 10
+TOKEN_RE = re.compile(r"\w+")
+
+
+# === Embedder ===
+class OllamaEmbedder:
+    def __init__(self, model=EMBED_MODEL, url=OLLAMA_EMBED_URL):
+        self.model = model
+        self.url = url
+        self.name = f"ollama-{model}"
+
+    def embed(self, texts) -> np.ndarray:
+        response = requests.post(self.url, json={"model": self.model, "input": list(texts)}, timeout=EMBED_TIMEOUT)
+        response.raise_for_status()
+        return np.asarray(response.json()["embeddings"], dtype=np.float32)
+
+
+class HashEmbedder:
+    """Feature-Hashing über Wörter: gleiche Eingabe → gleicher Vektor, ohne Modell."""
+
+    def __init__(self, dimensions=HASH_DIMENSIONS):
+        self.dimensions = dimensions
+        self.name = f"hash-{dimensions}"
+
+    def embed(self, texts) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in TOKEN_RE.findall((text or "").lower()):
+                digest = hashlib.md5(token.encode("utf-8")).digest()
+                index = int.from_bytes(digest[:4], "little") % self.dimensions
+                vectors[i, index] += 1.0 if digest[4] & 1 else -1.0
+        return vectors
+
+
+def normalize(vectors) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+def clip(text, limit=SNIPPET_CHARS) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+# === Index pro Nutzer ===
+class UserIndex:
+    """Vektoren (float32, N × dim) und Metadaten eines Nutzers."""
+
+    def __init__(self, vector_path, meta_path, dimensions):
+        self.vector_path = vector_path
+        self.meta_path = meta_path
+        self.dimensions = dimensions
+        self.vectors = None
+        self.meta = []
+        self.load()
+
+    def load(self):
+        if self.meta_path.exists():
+            with open(self.meta_path, encoding="utf-8") as f:
+                self.meta = [json.loads(line) for line in f if line.strip()]
+        rows = self.vector_path.stat().st_size // (4 * self.dimensions) if self.vector_path.exists() else 0
+        # Abgebrochene Schreibvorgänge: nur vollständige Paare verwenden
+        rows = min(rows, len(self.meta))
+        self.meta = self.meta[:rows]
+        self.vectors = (np.memmap(self.vector_path, dtype=np.float32, mode="r", shape=(rows, self.dimensions))
+                        if rows else np.zeros((0, self.dimensions), dtype=np.float32))
+
+    def append(self, vector, meta):
+        with open(self.vector_path, "ab") as f:
+            f.write(np.asarray(vector, dtype=np.float32).tobytes())
+        with open(self.meta_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(meta, ensure_ascii=False) + "\n")
+        self.meta.append(meta)
+        rows = len(self.meta)
+        self.vectors = np.memmap(self.vector_path, dtype=np.float32, mode="r", shape=(rows, self.dimensions))
+
+    def search(self, query, k, exclude_dialog=None):
+        if not len(self.meta):
+            return []
+        scores = self.vectors @ query
+        if exclude_dialog:
+            mask = np.array([m.get("dialog_id") == exclude_dialog for m in self.meta])
+            scores = np.where(mask, -np.inf, scores)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.meta[i]) for i in top if np.isfinite(scores[i])]
+
+
+class VectorMemory:
+    def __init__(self, embedder=None, base_dir=MEMORY_DIR):
+        self.embedder = embedder or OllamaEmbedder()
+        self.base_dir = Path(base_dir) / self.embedder.name
+        self.indexes = OrderedDict()  # user_id: UserIndex
+        self.dimensions = None
+        self.lock = threading.Lock()
+
+    def embed(self, texts) -> np.ndarray:
+        vectors = normalize(self.embedder.embed(texts))
+        self.dimensions = vectors.shape[1]
+        return vectors
+
+    def index_for(self, user_id) -> UserIndex:
+        # Aufrufer hält self.lock
+        index = self.indexes.get(user_id)
+        if index is None:
+            self.base_dir.mkdir(parents=True, exist_ok=True)
+            index = UserIndex(self.base_dir / f"{user_id}.f32", self.base_dir / f"{user_id}.jsonl", self.dimensions)
+            self.indexes[user_id] = index
+            while len(self.indexes) > MAX_OPEN_INDEXES:
+                self.indexes.popitem(last=False)
+        self.indexes.move_to_end(user_id)
+        return index
+
+    def add(self, user_id, conv_id, dialog_id, user_message, reply):
+        """Legt eine gelöste Runde im Gedächtnis des Nutzers ab."""
+        try:
+            vector = self.embed([f"{user_message}\n{reply}"])[0]
+            meta = {"id": conv_id, "dialog_id": dialog_id,
+                    "user": clip(user_message), "assistant": clip(reply)}
+            with self.lock:
+                self.index_for(user_id).append(vector, meta)
+        except Exception as e:
+            logging.warning(f"⚠️ Runde {conv_id} nicht ins Gedächtnis übernommen: {e}")
+
+    def search(self, user_id, query, k, exclude_dialog=None, min_score=0.0, vector=None) -> list:
+        """Top-k ähnlichste frühere Runden als Liste von (score, meta).
+        Mit vector (aus embed) entfällt die Einbettung hier."""
+        try:
+            if vector is None:
+                vector = self.embed([query])[0]
+            with self.lock:
+                index = self.index_for(user_id)
+                hits = index.search(vector, k, exclude_dialog)
+        except Exception as e:
+            logging.debug(f"Gedächtnissuche für Nutzer {user_id} fehlgeschlagen: {e}")
+            return []
+        return [(score, meta) for score, meta in hits if score >= min_score]
+
+
+def format_snippets(hits) -> str:
+    lines = [f"- Nutzer: {meta['user']} | Antwort: {meta['assistant']}" for _, meta in hits]
+    return "Relevante Ausschnitte aus früheren Gesprächen:\n" + "\n".join(lines)